@@ -0,0 +1,127 @@
+"""
+A local stand-in for the FDSN event service of the Seismic Portal, serving a
+catalog with the query parameters the producer uses.
+"""
+
+import threading
+import time
+
+import numpy as np
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from loguru import logger
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks import formats
+from benchmarks.synthetic import Catalog
+
+
+class FakeFDSNServer:
+    """
+    Serves `catalog` on `http://127.0.0.1:{port}/query` like the event service:
+
+    - `start` and `end` are inclusive, to the second,
+    - at most `limit` earthquakes are returned, the latest first,
+    - `format` is "text", "json" or "xml",
+    - no earthquakes is a 204.
+
+    Each request waits `latency_sec` before answering, and `error_rate` of them
+    fail with a 503, to exercise the producer's retries.
+
+    `url` is a template for `HistoricalEarthquakes.URL`.
+    """
+
+    def __init__(
+        self,
+        catalog: Catalog,
+        latency_sec: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.catalog = catalog
+        self.latency_sec = latency_sec
+        self.error_rate = error_rate
+
+        self.requests = 0
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        port = self._server.server_port
+        return (
+            f"http://127.0.0.1:{port}/query?limit={{limit}}"
+            "&start={start_date}&end={end_date}&format={format}"
+        )
+
+    def start(self) -> "FakeFDSNServer":
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server._handle(self)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+        logger.info(f"Fake FDSN server with {len(self.catalog)} earthquakes on {self.url}")
+
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def _handle(self, request: BaseHTTPRequestHandler) -> None:
+        with self._lock:
+            self.requests += 1
+            fail = self.error_rate > 0 and self._rng.random() < self.error_rate
+
+        time.sleep(self.latency_sec)
+
+        if fail:
+            request.send_response(503)
+            request.end_headers()
+            return
+
+        query = parse_qs(urlparse(request.path).query)
+
+        try:
+            start_ms = _to_ms(query["start"][0])
+            # Inclusive, to the second
+            end_ms = _to_ms(query["end"][0]) + 999
+            limit = int(query.get("limit", ["20000"])[0])
+            format = query.get("format", ["xml"])[0]
+            assert format in formats.FORMATS, f"unknown format {format}"
+
+        except (AssertionError, KeyError, ValueError) as e:
+            request.send_response(400)
+            request.end_headers()
+            request.wfile.write(str(e).encode("utf-8"))
+            return
+
+        # The latest earthquakes first, like the event service
+        earthquakes = self.catalog.between(start_ms, end_ms)[::-1][:limit]
+
+        if len(earthquakes) == 0:
+            request.send_response(204)
+            request.end_headers()
+            return
+
+        body = formats.render(earthquakes, format)
+
+        request.send_response(200)
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+
+def _to_ms(date: str) -> int:
+    return int(np.datetime64(date, "ms").astype(np.int64))
@@ -0,0 +1,142 @@
+"""
+A local stand-in for the websocket of the Seismic Portal, which pushes one
+message per new earthquake.
+"""
+
+import asyncio
+import threading
+import time
+
+from loguru import logger
+from tornado.web import Application
+from tornado.websocket import WebSocketClosedError, WebSocketHandler
+from typing import List, Optional, Set
+
+from benchmarks import formats
+
+
+class FakeWebsocketServer:
+    """
+    Serves the earthquakes of `properties`, in a loop, on
+    `ws://127.0.0.1:{port}/standing_order/websocket`, at `rate_per_sec`
+    messages per second to each client.
+
+    The time of each earthquake is replaced by the time it is sent, so that
+    the event lag the pipeline measures is its own latency. The connection is
+    closed every `disconnect_every_sec`, if set, to exercise the reconnects.
+    """
+
+    def __init__(
+        self,
+        properties: List[dict],
+        rate_per_sec: float = 100,
+        max_messages: Optional[int] = None,
+        disconnect_every_sec: Optional[float] = None,
+    ):
+        self.properties = properties
+        self.rate_per_sec = rate_per_sec
+        self.max_messages = max_messages
+        self.disconnect_every_sec = disconnect_every_sec
+
+        self.sent = 0
+        self.connections = 0
+        self.port: Optional[int] = None
+
+        self._last_timestamp_ms = 0
+        self._started = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopped: Optional[asyncio.Event] = None
+        self._thread: Optional[threading.Thread] = None
+        self._handlers: Set[WebSocketHandler] = set()
+
+    @property
+    def url(self) -> str:
+        return f"ws://127.0.0.1:{self.port}/standing_order/websocket"
+
+    def start(self) -> "FakeWebsocketServer":
+        self._thread = threading.Thread(
+            target=lambda: asyncio.run(self._serve()), name="fake-websocket", daemon=True
+        )
+        self._thread.start()
+        self._started.wait()
+
+        logger.info(f"Fake websocket server on {self.url}")
+
+        return self
+
+    def stop(self) -> None:
+        """
+        Closes the connections and stops listening.
+        """
+        if self._thread is None:
+            return
+
+        self._loop.call_soon_threadsafe(self._stopped.set)
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    async def _serve(self) -> None:
+        server = self
+
+        class Handler(WebSocketHandler):
+            def open(self):
+                server.connections += 1
+                server._handlers.add(self)
+                asyncio.get_running_loop().create_task(server._stream(self))
+
+            def on_close(self):
+                server._handlers.discard(self)
+
+        app = Application([(r"/standing_order/websocket", Handler)])
+        http_server = app.listen(0, "127.0.0.1")
+        self.port = next(iter(http_server._sockets.values())).getsockname()[1]
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self._started.set()
+
+        await self._stopped.wait()
+
+        http_server.stop()
+        for handler in list(self._handlers):
+            handler.close()
+
+    async def _stream(self, handler: WebSocketHandler) -> None:
+        start = time.monotonic()
+        sent = 0
+
+        try:
+            while self.max_messages is None or self.sent < self.max_messages:
+                elapsed = time.monotonic() - start
+
+                if self.disconnect_every_sec and elapsed >= self.disconnect_every_sec:
+                    handler.close()
+                    return
+
+                due = int(elapsed * self.rate_per_sec) - sent
+
+                for _ in range(due):
+                    if self.max_messages is not None and self.sent >= self.max_messages:
+                        break
+
+                    await handler.write_message(self._next_message())
+                    sent += 1
+                    self.sent += 1
+
+                await asyncio.sleep(0.005)
+
+        except WebSocketClosedError:
+            return
+
+    def _next_message(self) -> str:
+        props = dict(self.properties[self.sent % len(self.properties)])
+
+        # Strictly increasing, so that two earthquakes never share a timestamp
+        timestamp_ms = max(int(time.time() * 1000), self._last_timestamp_ms + 1)
+        self._last_timestamp_ms = timestamp_ms
+
+        props["time"] = props["lastupdate"] = (
+            time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(timestamp_ms / 1000))
+            + f".{timestamp_ms % 1000:03d}Z"
+        )
+
+        return formats.to_websocket_message(props)
@@ -0,0 +1,230 @@
+"""
+Renders catalogs in the formats of the Seismic Portal: the FDSN text, GeoJSON
+and QuakeML responses of the event service, and the messages of the websocket.
+Also loads the recorded fixtures of `record_fixtures.py` back into catalogs.
+"""
+
+import json
+
+import numpy as np
+
+from typing import Iterator, List
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+from benchmarks.synthetic import Catalog
+
+FORMATS = ("text", "json", "xml")
+
+_TEXT_HEADER = (
+    "#EventID|Time|Latitude|Longitude|Depth/km|Author|Catalog|Contributor|"
+    "ContributorID|MagType|Magnitude|MagAuthor|EventLocationName|EventType\n"
+)
+
+
+def times(catalog: Catalog) -> np.ndarray:
+    """
+    Returns the ISO 8601 times of the earthquakes, to the millisecond, in UTC.
+    """
+    return np.char.add(
+        np.datetime_as_string(catalog.timestamp.astype("datetime64[ms]"), unit="ms"),
+        "Z",
+    )
+
+
+def event_ids(catalog: Catalog) -> List[str]:
+    return [f"bench{timestamp}" for timestamp in catalog.timestamp.tolist()]
+
+
+def render(catalog: Catalog, format: str) -> bytes:
+    """
+    Renders the earthquakes of `catalog` as an event service response in `format`.
+    """
+    if format == "text":
+        return to_fdsn_text(catalog)
+    if format == "json":
+        return to_geojson(catalog)
+    if format == "xml":
+        return to_quakeml(catalog)
+
+    raise ValueError(f"Unknown format: {format}")
+
+
+def to_fdsn_text(catalog: Catalog) -> bytes:
+    rows = zip(
+        event_ids(catalog),
+        # FDSN text times carry no zone designator
+        (time[:-1] for time in times(catalog).tolist()),
+        catalog.latitude.tolist(),
+        catalog.longitude.tolist(),
+        catalog.depth.tolist(),
+        catalog.magnitude.tolist(),
+        catalog.region.tolist(),
+    )
+
+    return (
+        _TEXT_HEADER
+        + "".join(
+            f"{id}|{time}|{lat}|{lon}|{depth}|BENCH|EMSC-RTS|EMSC|{id}|ml|{mag}|BENCH|{region}|ke\n"
+            for id, time, lat, lon, depth, mag, region in rows
+        )
+    ).encode("utf-8")
+
+
+def properties(catalog: Catalog) -> Iterator[dict]:
+    """
+    Yields the GeoJSON feature properties of the earthquakes, which are also the
+    properties of the websocket messages.
+    """
+    rows = zip(
+        event_ids(catalog),
+        times(catalog).tolist(),
+        catalog.latitude.tolist(),
+        catalog.longitude.tolist(),
+        catalog.depth.tolist(),
+        catalog.magnitude.tolist(),
+        catalog.region.tolist(),
+    )
+
+    for id, time, lat, lon, depth, mag, region in rows:
+        yield {
+            "source_id": id,
+            "source_catalog": "EMSC-RTS",
+            "lastupdate": time,
+            "time": time,
+            "flynn_region": region,
+            "lat": lat,
+            "lon": lon,
+            "depth": depth,
+            "evtype": "ke",
+            "auth": "BENCH",
+            "mag": mag,
+            "magtype": "ml",
+            "unid": id,
+        }
+
+
+def feature(props: dict) -> dict:
+    return {
+        "type": "Feature",
+        "geometry": {
+            "type": "Point",
+            "coordinates": [props["lon"], props["lat"], -props["depth"]],
+        },
+        "id": props["unid"],
+        "properties": props,
+    }
+
+
+def to_geojson(catalog: Catalog) -> bytes:
+    return json.dumps(
+        {
+            "type": "FeatureCollection",
+            "metadata": {"count": len(catalog)},
+            "features": [feature(props) for props in properties(catalog)],
+        }
+    ).encode("utf-8")
+
+
+def to_websocket_message(props: dict, action: str = "create") -> str:
+    return json.dumps({"action": action, "data": feature(props)})
+
+
+def to_quakeml(catalog: Catalog) -> bytes:
+    rows = zip(
+        event_ids(catalog),
+        times(catalog).tolist(),
+        catalog.latitude.tolist(),
+        catalog.longitude.tolist(),
+        # QuakeML depths are in meters
+        (catalog.depth * 1000).tolist(),
+        catalog.magnitude.tolist(),
+        catalog.region.tolist(),
+    )
+
+    events = "".join(
+        f'<event publicID="smi:bench/{id}">'
+        f'<description><text>{escape(region)}</text><type>region name</type></description>'
+        f'<origin publicID="smi:bench/{id}/origin">'
+        f"<time><value>{time}</value></time>"
+        f"<latitude><value>{lat}</value></latitude>"
+        f"<longitude><value>{lon}</value></longitude>"
+        f"<depth><value>{depth}</value></depth>"
+        f"</origin>"
+        f'<magnitude publicID="smi:bench/{id}/magnitude">'
+        f"<mag><value>{mag}</value></mag><type>ml</type>"
+        f"</magnitude>"
+        f"</event>"
+        for id, time, lat, lon, depth, mag, region in rows
+    )
+
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<q:quakeml xmlns:q="http://quakeml.org/xmlns/quakeml/1.2" '
+        'xmlns="http://quakeml.org/xmlns/bed/1.2">'
+        f'<eventParameters publicID="smi:bench/events">{events}</eventParameters>'
+        "</q:quakeml>"
+    ).encode("utf-8")
+
+
+def load_quakeml(path: str) -> Catalog:
+    """
+    Loads a QuakeML document, e.g. a recorded fixture, into a catalog. Events
+    without a time, place or magnitude are skipped.
+    """
+    columns = {name: [] for name in Catalog.__dataclass_fields__}
+
+    for _, element in ElementTree.iterparse(path):
+        if not element.tag.endswith("}event"):
+            continue
+
+        def find(*names):
+            node = element
+            for name in names:
+                node = next((c for c in node if c.tag.endswith("}" + name)), None)
+                if node is None:
+                    return None
+            return node.text
+
+        fields = (
+            find("origin", "time", "value"),
+            find("magnitude", "mag", "value"),
+            find("origin", "depth", "value"),
+            find("origin", "latitude", "value"),
+            find("origin", "longitude", "value"),
+            find("description", "text"),
+        )
+        element.clear()
+
+        if None in fields:
+            continue
+
+        time, magnitude, depth, latitude, longitude, region = fields
+        columns["timestamp"].append(
+            np.datetime64(time.rstrip("Z"), "ms").astype(np.int64)
+        )
+        columns["magnitude"].append(float(magnitude))
+        columns["depth"].append(float(depth) / 1000)
+        columns["latitude"].append(float(latitude))
+        columns["longitude"].append(float(longitude))
+        columns["region"].append(region)
+
+    order = np.argsort(np.array(columns["timestamp"], dtype=np.int64), kind="stable")
+
+    return Catalog(
+        timestamp=np.array(columns["timestamp"], dtype=np.int64)[order],
+        magnitude=np.array(columns["magnitude"])[order],
+        depth=np.array(columns["depth"])[order],
+        latitude=np.array(columns["latitude"])[order],
+        longitude=np.array(columns["longitude"])[order],
+        region=np.array(columns["region"], dtype=object)[order],
+    )
+
+
+def load_websocket_messages(path: str) -> List[dict]:
+    """
+    Loads recorded websocket messages, one JSON message per line, and returns
+    their properties.
+    """
+    with open(path) as f:
+        return [json.loads(line)["data"]["properties"] for line in f if line.strip()]
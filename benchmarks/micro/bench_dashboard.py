@@ -0,0 +1,105 @@
+"""
+Benchmarks of the dashboard queries: radius and time queries with the event
+index against a full scan, and binning the map at different zoom levels.
+
+Run it from `services/earthquake_dashboard`, with the repository root on the
+path, see `benchmarks/run.py`.
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.event_index import EventIndex, haversine_km
+from src.map_grid import bin_events, cell_size_for_zoom
+
+from benchmarks import stats, synthetic
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+def timed(fn, repeat: int) -> list:
+    """
+    Returns the durations of `repeat` runs of `fn`, in seconds.
+    """
+    durations = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+
+    return durations
+
+
+def run() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--result", required=True)
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    now_ms = int(time.time() * 1000)
+    catalog = synthetic.generate(args.events, now_ms - 3650 * DAY_MS, now_ms)
+    data = pd.DataFrame(
+        {
+            "timestamp": catalog.timestamp,
+            "datestr": pd.to_datetime(catalog.timestamp, unit="ms").strftime("%Y-%m-%d"),
+            "region": catalog.region,
+            "magnitude": catalog.magnitude,
+            "depth": catalog.depth,
+            "latitude": catalog.latitude,
+            "longitude": catalog.longitude,
+            "uuid": np.arange(len(catalog)).astype(str),
+        }
+    )
+    results = {}
+
+    start = time.perf_counter()
+    index = EventIndex(data)
+    results["index_build"] = {"build_ms": round((time.perf_counter() - start) * 1000, 3)}
+
+    # 500km around the busiest region, over the last 30 days
+    query = dict(
+        latitude=synthetic.REGIONS[0][1],
+        longitude=synthetic.REGIONS[0][2],
+        radius_km=500,
+        start_time=now_ms - 30 * DAY_MS,
+        min_magnitude=2.0,
+    )
+
+    def scan():
+        distance = haversine_km(
+            query["latitude"],
+            query["longitude"],
+            data["latitude"].to_numpy(),
+            data["longitude"].to_numpy(),
+        )
+        return data[
+            (distance <= query["radius_km"])
+            & (data["timestamp"] >= query["start_time"])
+            & (data["magnitude"] >= query["min_magnitude"])
+        ]
+
+    results["radius_query_index"] = stats.latency_ms(
+        timed(lambda: index.query(**query), args.repeat)
+    )
+    results["radius_query_scan"] = stats.latency_ms(timed(scan, args.repeat))
+
+    for zoom in (1, 5, 10):
+        results[f"bin_events_zoom_{zoom}"] = stats.latency_ms(
+            timed(
+                lambda: bin_events(data, cell_deg=cell_size_for_zoom(zoom)),
+                max(args.repeat // 4, 1),
+            )
+        )
+
+    stats.write_result(
+        args.result, {"benchmarks": results, "peak_rss_mb": stats.peak_rss_mb()}
+    )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,87 @@
+"""
+Benchmarks of the parts of the features service that need no broker: the
+deserializer of the earthquake messages, in each wire format.
+
+Run it from `services/earthquake_features`, with the repository root on the
+path, after `bench_producer.py`. It first checks that the service decodes the
+producer's messages, and computes its geohashes, like the producer does, see
+`benchmarks.wire_check`. See `benchmarks/run.py`.
+"""
+
+import argparse
+import time
+
+from confluent_kafka.serialization import MessageField
+from quixstreams.models.serializers import SerializationContext
+
+from src import wire_format
+from src.cells import geohash
+from src.wire_format import EarthquakeDeserializer
+
+from benchmarks import stats, wire_check
+
+
+def best_of(fn, repeat: int = 3) -> float:
+    """
+    Returns the shortest of `repeat` runs of `fn`, in seconds.
+    """
+    durations = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+
+    return min(durations)
+
+
+def run() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--result", required=True)
+    parser.add_argument("--work-dir", required=True)
+    args = parser.parse_args()
+
+    sample = wire_check.load_sample(args.work_dir)
+    deserializer = EarthquakeDeserializer()
+
+    contexts = {
+        "json": SerializationContext(topic="benchmark", field=MessageField.VALUE),
+        "binary": SerializationContext(
+            topic="benchmark",
+            field=MessageField.VALUE,
+            headers=[(wire_format.CONTENT_TYPE_HEADER, wire_format.CONTENT_TYPE_BINARY)],
+        ),
+    }
+
+    def deserialize(name):
+        return [deserializer(value, contexts[name]) for value in sample["messages"][name]]
+
+    # The service's copies of the wire format and geohash against the producer's
+    wire_check.check_layout(
+        sample,
+        "earthquake_features",
+        version=wire_format.VERSION,
+        layout=wire_format._HEADER.format,
+    )
+    results = {
+        "wire_format_check": wire_check.check(
+            sample,
+            "earthquake_features",
+            decoded={name: deserialize(name) for name in sample["messages"]},
+            geohash=geohash,
+        )
+    }
+
+    for name, values in sample["messages"].items():
+        duration = best_of(lambda: deserialize(name))
+        results[f"deserialize_{name}"] = {
+            "events_per_sec": round(len(values) / duration, 1)
+        }
+
+    stats.write_result(
+        args.result, {"benchmarks": results, "peak_rss_mb": stats.peak_rss_mb()}
+    )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,227 @@
+"""
+Benchmarks of the parts of the producer that need no broker: the FDSN decoders,
+the incremental QuakeML parser against the xmltodict one it replaced, the
+message encoders, the dedup cache and the concurrent historical download.
+
+Run it from `services/earthquake_producer`, with the repository root on the
+path, see `benchmarks/run.py`. The encoded messages are left in `--work-dir`
+for `bench_sink.py`, along with a sample for the consumers to check their copies
+of the wire format against, see `benchmarks.wire_check`.
+"""
+
+import argparse
+import io
+import os
+import pickle
+import time
+import tracemalloc
+import xmltodict
+
+from confluent_kafka.serialization import MessageField
+from quixstreams.models.serializers import JSONSerializer, SerializationContext
+
+from src import wire_format as wire
+from src.dedup import DedupCache
+from src.partitioning import geohash
+from src.seismic_portal_api.decoders import DECODERS
+from src.seismic_portal_api.historical_data import HistoricalEarthquakes
+from src.seismic_portal_api.utils import generate_earthquake_uuid, to_ms
+
+from benchmarks import formats, stats, synthetic, wire_check
+from benchmarks.fake_fdsn import FakeFDSNServer
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+def best_of(fn, repeat: int = 3) -> float:
+    """
+    Returns the shortest of `repeat` runs of `fn`, in seconds.
+    """
+    durations = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+
+    return min(durations)
+
+
+def peak_alloc_mb(fn) -> float:
+    """
+    Returns the peak memory allocated by Python during a run of `fn`, in
+    megabytes.
+    """
+    tracemalloc.start()
+
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return round(peak / 1024 / 1024, 1)
+
+
+def parse_quakeml_xmltodict(body: bytes) -> list:
+    """
+    Parses a QuakeML window the way the producer did before the incremental
+    parser: the whole document into a dict, then the fields of each event.
+    """
+    earthquakes = []
+
+    for earthquake in xmltodict.parse(body)["q:quakeml"]["eventParameters"]["event"]:
+        time_str = earthquake["origin"]["time"]["value"]
+        region = earthquake["description"]["text"]
+        timestamp = to_ms(time_str)
+        magnitude = earthquake["magnitude"]["mag"]["value"]
+
+        earthquakes.append(
+            {
+                "timestamp": timestamp,
+                "datestr": time_str[:10],
+                "latitude": earthquake["origin"]["latitude"]["value"],
+                "longitude": earthquake["origin"]["longitude"]["value"],
+                "depth": float(earthquake["origin"]["depth"]["value"]) / 1000,
+                "magnitude": magnitude,
+                "region": region,
+                "uuid": generate_earthquake_uuid(region, timestamp, magnitude),
+            }
+        )
+
+    return earthquakes
+
+
+def run() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--result", required=True)
+    parser.add_argument("--work-dir", required=True)
+    parser.add_argument("--events", type=int, default=50_000)
+    args = parser.parse_args()
+
+    now_ms = int(time.time() * 1000)
+    catalog = synthetic.generate(args.events, now_ms - 30 * DAY_MS, now_ms - DAY_MS)
+    results = {}
+
+    # FDSN decoders, on the same earthquakes in each format
+    for format, decoder in DECODERS.items():
+        body = formats.render(catalog, format)
+        duration = best_of(lambda: decoder.decode(io.BytesIO(body)))
+        results[f"decode_{format}"] = {
+            "events_per_sec": round(len(catalog) / duration, 1),
+            "bytes_per_event": round(len(body) / len(catalog), 1),
+        }
+
+    # QuakeML parsers, on a window of 20000 earthquakes, the most the API
+    # returns per query
+    window = catalog[:20_000]
+    body = formats.render(window, "xml")
+    parsers = {
+        "iterparse": lambda: DECODERS["xml"].decode(io.BytesIO(body)),
+        "xmltodict": lambda: parse_quakeml_xmltodict(body),
+    }
+
+    for parser, parse in parsers.items():
+        duration = best_of(parse)
+        results[f"quakeml_{parser}"] = {
+            "events_per_sec": round(len(window) / duration, 1),
+            "window_ms": round(duration * 1000, 1),
+            "peak_alloc_mb": peak_alloc_mb(parse),
+        }
+
+    batch = DECODERS["text"].decode(io.BytesIO(formats.render(catalog, "text")))
+    records = batch.to_records()
+
+    # Message encoders, JSON as the producer writes it through quixstreams
+    serializer = JSONSerializer()
+    context = SerializationContext(topic="benchmark", field=MessageField.VALUE)
+    encoders = {
+        "json": lambda record: serializer(record, context),
+        "binary": wire.encode,
+    }
+
+    for wire_format, encode in encoders.items():
+        duration = best_of(lambda: [encode(record) for record in records])
+        messages = [encode(record) for record in records]
+        results[f"encode_{wire_format}"] = {
+            "events_per_sec": round(len(records) / duration, 1),
+            "bytes_per_event": round(sum(map(len, messages)) / len(messages), 1),
+        }
+
+        with open(os.path.join(args.work_dir, f"messages_{wire_format}.pkl"), "wb") as f:
+            pickle.dump(messages, f)
+
+    # The earthquakes and messages the consumers check their decoders against,
+    # and geohashes of points up to the edges of the map
+    sample = slice(0, 1000)
+    points = [(record["latitude"], record["longitude"]) for record in records[sample]]
+    points += [(90.0, 180.0), (-90.0, -180.0), (0.0, 0.0), (-0.0, 179.999999)]
+
+    wire_check.write_sample(
+        args.work_dir,
+        version=wire.VERSION,
+        layout=wire._HEADER.format,
+        records=[dict(record, uuid=str(record["uuid"])) for record in records[sample]],
+        messages={
+            wire_format: [encode(record) for record in records[sample]]
+            for wire_format, encode in encoders.items()
+        },
+        geohashes=[
+            (latitude, longitude, precision, geohash(latitude, longitude, precision))
+            for latitude, longitude in points
+            for precision in wire_check.GEOHASH_PRECISIONS
+        ],
+    )
+
+    # Dedup cache, with every batch sent twice like overlapping backfills
+    def dedup():
+        cache = DedupCache(max_size=2 * len(batch))
+        for start in range(0, len(batch), 1000):
+            chunk = batch.take(list(range(start, min(start + 1000, len(batch)))))
+            cache.filter(chunk)
+            cache.filter(chunk)
+
+    duration = best_of(dedup)
+    results["dedup_filter"] = {"events_per_sec": round(2 * len(batch) / duration, 1)}
+
+    # Historical download, with a 50ms round trip per window
+    server = FakeFDSNServer(catalog, latency_sec=0.05).start()
+    HistoricalEarthquakes.URL = server.url
+
+    for max_workers in (1, 4):
+        windows = []
+        fetch_window = HistoricalEarthquakes._fetch_window
+
+        def record_window(self, window, *args):
+            start = time.perf_counter()
+            earthquakes = fetch_window(self, window, *args)
+            windows.append(time.perf_counter() - start)
+            return earthquakes
+
+        HistoricalEarthquakes._fetch_window = record_window
+
+        historical = HistoricalEarthquakes(
+            last_n_days=30, window_days=1, max_workers=max_workers, formats=["text"]
+        )
+        start = time.perf_counter()
+        events = 0
+        while not historical.is_done():
+            events += len(historical.get_earthquakes())
+        duration = time.perf_counter() - start
+
+        HistoricalEarthquakes._fetch_window = fetch_window
+
+        results[f"historical_fetch_{max_workers}_workers"] = {
+            "events_per_sec": round(events / duration, 1),
+            **stats.latency_ms(windows, prefix="window_fetch"),
+        }
+
+    server.stop()
+
+    stats.write_result(
+        args.result, {"benchmarks": results, "peak_rss_mb": stats.peak_rss_mb()}
+    )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,169 @@
+"""
+Benchmarks of the parts of the sink that need no broker: decoding the consumed
+messages into the columnar buffer, the batching policies writing to the
+Hopsworks stub, and the local Parquet store.
+
+Run it from `services/seismic_data_sink`, with the repository root on the path,
+after `bench_producer.py`, whose encoded messages it reads from `--work-dir`.
+It first checks that the sink decodes the producer's messages to the same
+earthquakes, see `benchmarks.wire_check`. See `benchmarks/run.py`.
+"""
+
+import argparse
+import json
+import os
+import pickle
+import time
+
+from src import hopsworks_stub
+from src import wire_format as wire
+from src.earthquake_batch import EarthquakeBatch
+from src.hopsworks_api import HopsworksApi
+from src.main import get_batching_policy
+from src.parquet_store import ParquetStore
+from src.writer import BackgroundWriter
+
+from benchmarks import stats, wire_check
+
+CONSUME_BATCH_SIZE = 500
+
+
+def best_of(fn, repeat: int = 3) -> float:
+    """
+    Returns the shortest of `repeat` runs of `fn`, in seconds.
+    """
+    durations = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+
+    return min(durations)
+
+
+def chunks(messages, size=CONSUME_BATCH_SIZE):
+    return [messages[i : i + size] for i in range(0, len(messages), size)]
+
+
+def run() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--result", required=True)
+    parser.add_argument("--work-dir", required=True)
+    parser.add_argument("--insert-latency-sec", type=float, default=0.2)
+    parser.add_argument("--insert-latency-sec-per-row", type=float, default=2e-6)
+    args = parser.parse_args()
+
+    messages = {}
+    for wire_format in ("json", "binary"):
+        with open(os.path.join(args.work_dir, f"messages_{wire_format}.pkl"), "rb") as f:
+            messages[wire_format] = pickle.load(f)
+
+    # The sink's copy of the wire format against the producer's
+    sample = wire_check.load_sample(args.work_dir)
+    wire_check.check_layout(
+        sample, "seismic_data_sink", version=wire.VERSION, layout=wire._HEADER.format
+    )
+    decoded = {}
+
+    for name, values in sample["messages"].items():
+        batch = EarthquakeBatch()
+        (batch.extend_json if name == "json" else batch.extend_binary)(values)
+        decoded[name] = [dict(zip(batch.columns, row)) for row in zip(*batch.columns.values())]
+
+    results = {
+        "wire_format_check": wire_check.check(
+            sample,
+            "seismic_data_sink",
+            decoded=decoded,
+        )
+    }
+
+    # Decoding the messages of each consume call into the buffer
+    def per_message():
+        batch = EarthquakeBatch()
+        for value in messages["json"]:
+            batch.append(json.loads(value), len(value))
+
+    def bulk(wire_format):
+        batch = EarthquakeBatch()
+        extend = batch.extend_json if wire_format == "json" else batch.extend_binary
+        for chunk in chunks(messages[wire_format]):
+            extend(chunk)
+
+    decoders = {
+        "decode_json_per_message": per_message,
+        "decode_json_bulk": lambda: bulk("json"),
+        "decode_binary_bulk": lambda: bulk("binary"),
+    }
+
+    for name, decode in decoders.items():
+        duration = best_of(decode)
+        results[name] = {"events_per_sec": round(len(messages["json"]) / duration, 1)}
+
+    # Batching policies, against a stub with a fixed and a per row insert latency
+    hopsworks_stub.INSERT_LATENCY_SEC = args.insert_latency_sec
+    hopsworks_stub.INSERT_LATENCY_SEC_PER_ROW = args.insert_latency_sec_per_row
+
+    backends = {
+        f"batching_{batching_policy}": (
+            batching_policy,
+            lambda batching_policy=batching_policy: HopsworksApi(
+                api_key="benchmark",
+                project_name="benchmark",
+                feature_group_name=f"benchmark_{batching_policy}",
+                feature_group_version=1,
+                login=hopsworks_stub.login,
+            ),
+        )
+        for batching_policy in ("threshold", "adaptive")
+    }
+    # The local Parquet store, with the largest writes
+    backends["parquet_store"] = (
+        "threshold",
+        lambda: ParquetStore(os.path.join(args.work_dir, "parquet_store")),
+    )
+
+    for name, (batching_policy, create_backend) in backends.items():
+        backend = create_backend()
+        policy = get_batching_policy(
+            batching_policy,
+            buffer_size=20000,
+            buffer_max_bytes=64 * 1024 * 1024,
+            save_every_n_sec=1,
+            adaptive_min_buffer_size=100,
+        )
+        writer = BackgroundWriter(backend, "offline", policy, max_pending=2)
+
+        start = time.perf_counter()
+        buffer = EarthquakeBatch()
+
+        for chunk in chunks(messages["json"]):
+            buffer.extend_json(chunk)
+
+            if policy.should_flush(len(buffer), buffer.nbytes, buffer.age_sec):
+                # The sink pauses its partition until the writer has room
+                while not writer.submit(buffer, []):
+                    time.sleep(0.001)
+                buffer = EarthquakeBatch()
+
+        while len(buffer) and not writer.submit(buffer, []):
+            time.sleep(0.001)
+        writer.close()
+        backend.close()
+
+        duration = time.perf_counter() - start
+
+        results[name] = {
+            "events_per_sec": round(len(messages["json"]) / duration, 1),
+            "flushes": backend.inserts,
+            "rows_per_flush": round(len(messages["json"]) / max(backend.inserts, 1)),
+        }
+
+    stats.write_result(
+        args.result, {"benchmarks": results, "peak_rss_mb": stats.peak_rss_mb()}
+    )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,86 @@
+"""
+Records real earthquakes from the Seismic Portal into `benchmarks/fixtures/`,
+for the end-to-end scenarios to replay with `--fixtures`:
+
+- `fdsn.xml`, the QuakeML of the last `--days` days of earthquakes.
+- `websocket.jsonl`, the messages of the live websocket, one per line, for
+  `--websocket-sec` seconds.
+
+    python -m benchmarks.record_fixtures --days 7 --websocket-sec 600
+"""
+
+import argparse
+import asyncio
+import os
+import time
+import urllib.request
+
+from loguru import logger
+from tornado.websocket import websocket_connect
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+FDSN_URL = "https://www.seismicportal.eu/fdsnws/event/1/query?limit={limit}&start={start_date}&end={end_date}&format=xml"
+WEBSOCKET_URL = "wss://www.seismicportal.eu/standing_order/websocket"
+
+
+def record_fdsn(path: str, days: int, limit: int) -> None:
+    end = time.time()
+    url = FDSN_URL.format(
+        limit=limit,
+        start_date=time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(end - days * 86400)),
+        end_date=time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(end)),
+    )
+    logger.info(f"Recording {url}")
+
+    with urllib.request.urlopen(url, timeout=300) as response, open(path, "wb") as f:
+        f.write(response.read())
+
+
+async def record_websocket(path: str, duration_sec: float) -> int:
+    connection = await websocket_connect(WEBSOCKET_URL)
+    deadline = time.monotonic() + duration_sec
+    messages = 0
+
+    with open(path, "w") as f:
+        while time.monotonic() < deadline:
+            try:
+                message = await asyncio.wait_for(
+                    connection.read_message(), deadline - time.monotonic()
+                )
+            except asyncio.TimeoutError:
+                break
+
+            if message is None:
+                logger.warning("The websocket closed, stopping early.")
+                break
+
+            f.write(message.strip() + "\n")
+            messages += 1
+
+    connection.close()
+
+    return messages
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--limit", type=int, default=20000)
+    parser.add_argument("--websocket-sec", type=float, default=600)
+    args = parser.parse_args()
+
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+
+    fdsn_path = os.path.join(FIXTURES_DIR, "fdsn.xml")
+    record_fdsn(fdsn_path, args.days, args.limit)
+    logger.info(f"Recorded {os.path.getsize(fdsn_path)} bytes to {fdsn_path}")
+
+    if args.websocket_sec:
+        websocket_path = os.path.join(FIXTURES_DIR, "websocket.jsonl")
+        messages = asyncio.run(record_websocket(websocket_path, args.websocket_sec))
+        logger.info(f"Recorded {messages} messages to {websocket_path}")
+
+
+if __name__ == "__main__":
+    main()
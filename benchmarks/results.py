@@ -0,0 +1,155 @@
+"""
+Stores the results of the benchmarks per commit, and compares them with the
+results of the closest earlier commit that has some.
+
+Each run is written to `results/<commit>.json`, and appended to
+`results/history.jsonl`. Commit them alongside the change they measure, from
+the same machine, so that regressions show up in review.
+"""
+
+import json
+import os
+import platform
+import subprocess
+import time
+
+from typing import Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+HISTORY_PATH = os.path.join(RESULTS_DIR, "history.jsonl")
+
+
+def _git(*args: str) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout.strip()
+
+
+def current_commit() -> Tuple[str, bool]:
+    """
+    Returns the current commit, and whether the tree has uncommitted changes
+    outside of the results.
+    """
+    commit = _git("rev-parse", "HEAD")
+    changes = [
+        line
+        for line in _git("status", "--porcelain").splitlines()
+        if "benchmarks/results/" not in line
+    ]
+
+    return commit, bool(changes)
+
+
+def save(results: dict) -> dict:
+    """
+    Saves `results` for the current commit, and returns the saved run.
+    """
+    commit, dirty = current_commit()
+
+    run = {
+        "commit": commit,
+        "dirty": dirty,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+
+    name = commit[:12] + ("-dirty" if dirty else "")
+    with open(os.path.join(RESULTS_DIR, f"{name}.json"), "w") as f:
+        json.dump(run, f, indent=2)
+
+    with open(HISTORY_PATH, "a") as f:
+        f.write(json.dumps(run) + "\n")
+
+    return run
+
+
+def previous(commit: str, dirty: bool = False) -> Optional[dict]:
+    """
+    Returns the latest run of the closest ancestor of `commit` that has one, or
+    of `commit` itself if the run being compared is of uncommitted changes.
+    """
+    if not os.path.exists(HISTORY_PATH):
+        return None
+
+    runs: Dict[str, dict] = {}
+    with open(HISTORY_PATH) as f:
+        for line in f:
+            if line.strip():
+                run = json.loads(line)
+                # Only committed trees are baselines
+                if not run["dirty"]:
+                    runs[run["commit"]] = run
+
+    try:
+        ancestors = _git("rev-list", "--max-count=1000", commit if dirty else f"{commit}~1")
+    except subprocess.CalledProcessError:
+        # The first commit has no ancestors
+        return None
+
+    for ancestor in ancestors.splitlines():
+        if ancestor in runs:
+            return runs[ancestor]
+
+    return None
+
+
+def flatten(results: dict, prefix: str = "") -> Dict[str, float]:
+    """
+    Flattens nested results into `{"a.b.metric": value}`.
+    """
+    flat = {}
+
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+
+    return flat
+
+
+def direction(metric: str) -> int:
+    """
+    1 if higher is better, -1 if lower is better, 0 if the metric is not compared.
+    """
+    name = metric.rsplit(".", 1)[-1]
+
+    if name.endswith("_per_sec"):
+        return 1
+    if name.endswith("_ms") or name in {"peak_rss_mb", "peak_alloc_mb"}:
+        return -1
+
+    return 0
+
+
+def compare(
+    current: dict, baseline: dict, threshold: float = 0.1
+) -> List[Tuple[str, float, float, float]]:
+    """
+    Returns the metrics that got worse by more than `threshold`, as
+    `(metric, baseline, current, relative change)`.
+    """
+    regressions = []
+    old = flatten(baseline)
+
+    for metric, value in flatten(current).items():
+        sign = direction(metric)
+
+        if not sign or metric not in old or not old[metric]:
+            continue
+
+        change = (value - old[metric]) / abs(old[metric])
+
+        if -sign * change > threshold:
+            regressions.append((metric, old[metric], value, change))
+
+    return regressions
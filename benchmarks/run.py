@@ -0,0 +1,736 @@
+"""
+Runs the benchmarks, stores their results for the current commit, and reports
+the regressions against the closest earlier commit with results.
+
+    python -m benchmarks.run                    # micro benchmarks, no broker
+    python -m benchmarks.run --suite e2e        # producer -> Kafka -> sink
+    python -m benchmarks.run --suite all --events 200000
+
+The end-to-end scenarios need a Kafka broker, e.g. the Redpanda of
+`docker-compose/redpanda.yaml`. Each service runs in its own process, from its
+own directory, since they all have a `src` package.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+from loguru import logger
+from typing import Dict, List, Optional, Tuple
+
+from benchmarks import formats, results, synthetic
+from benchmarks.fake_fdsn import FakeFDSNServer
+from benchmarks.fake_websocket import FakeWebsocketServer
+
+ROOT = results.ROOT
+BENCHMARKS_DIR = os.path.join(ROOT, "benchmarks")
+SERVICES = {
+    "producer": os.path.join(ROOT, "services", "earthquake_producer"),
+    "sink": os.path.join(ROOT, "services", "seismic_data_sink"),
+    "features": os.path.join(ROOT, "services", "earthquake_features"),
+    "dashboard": os.path.join(ROOT, "services", "earthquake_dashboard"),
+}
+FIXTURES_DIR = os.path.join(BENCHMARKS_DIR, "fixtures")
+
+DAY_MS = 24 * 60 * 60 * 1000
+HOUR_MS = 60 * 60 * 1000
+
+SCENARIOS = ("backfill", "live", "kill", "kill_sink", "scaling")
+
+
+class Stage:
+    """
+    A benchmark script running in the directory of a service, with its output
+    in `{work_dir}/{name}.log` and its result in `{work_dir}/{name}.json`.
+    """
+
+    def __init__(self, work_dir: str, name: str, service: str, script: str, args: List):
+        self.name = name
+        self.result_path = os.path.join(work_dir, f"{name}.json")
+        self.log_path = os.path.join(work_dir, f"{name}.log")
+
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([SERVICES[service], ROOT]))
+
+        with open(self.log_path, "w") as log:
+            self.process = subprocess.Popen(
+                [
+                    sys.executable,
+                    os.path.join(BENCHMARKS_DIR, script),
+                    *map(str, args),
+                    "--result",
+                    self.result_path,
+                ],
+                cwd=SERVICES[service],
+                env=env,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
+
+    def wait(self, timeout: Optional[float] = None) -> dict:
+        """
+        Waits for the stage to finish, and returns its result.
+        """
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            raise RuntimeError(f"{self.name} timed out, see {self.log_path}")
+
+        if not os.path.exists(self.result_path):
+            raise RuntimeError(f"{self.name} failed, see {self.log_path}")
+
+        with open(self.result_path) as f:
+            return json.load(f)
+
+
+def run_micro(work_dir: str, events: int) -> Dict[str, dict]:
+    producer = Stage(
+        work_dir,
+        "micro_producer",
+        "producer",
+        "micro/bench_producer.py",
+        ["--work-dir", work_dir, "--events", events],
+    ).wait()
+
+    # Decode the messages encoded by the producer benchmark, and check that
+    # their copies of the wire format agree with the producer's
+    sink = Stage(
+        work_dir, "micro_sink", "sink", "micro/bench_sink.py", ["--work-dir", work_dir]
+    ).wait()
+    features = Stage(
+        work_dir,
+        "micro_features",
+        "features",
+        "micro/bench_features.py",
+        ["--work-dir", work_dir],
+    ).wait()
+
+    dashboard = Stage(
+        work_dir, "micro_dashboard", "dashboard", "micro/bench_dashboard.py", []
+    ).wait()
+
+    return {"producer": producer, "sink": sink, "features": features, "dashboard": dashboard}
+
+
+class Broker:
+    """
+    Creates and deletes the topics of the scenarios.
+    """
+
+    def __init__(self, address: str):
+        from confluent_kafka.admin import AdminClient
+
+        self.address = address
+        self.admin = AdminClient({"bootstrap.servers": address})
+
+        try:
+            self.admin.list_topics(timeout=5)
+        except Exception as e:
+            raise RuntimeError(
+                f"No Kafka broker at {address}: {e}. Start one with "
+                "`make -C docker-compose start-redpanda`."
+            )
+
+    def create_topic(self, prefix: str, partitions: int) -> str:
+        from confluent_kafka.admin import NewTopic
+
+        name = f"benchmark_{prefix}_{uuid.uuid4().hex[:8]}"
+        future = self.admin.create_topics([NewTopic(name, partitions, 1)])[name]
+        future.result(timeout=30)
+
+        return name
+
+    def delete_topic(self, name: str) -> None:
+        try:
+            self.admin.delete_topics([name])[name].result(timeout=30)
+        except Exception as e:
+            logger.warning(f"Failed to delete topic {name}: {e}")
+
+
+def backfill_catalog(events: int, days: int, seed: int = 0) -> synthetic.Catalog:
+    """
+    A catalog over the last `days` days, an hour short on both ends so that the
+    producer's range, computed when it starts, covers all of it.
+    """
+    now_ms = int(time.time() * 1000)
+    return synthetic.generate(
+        events, now_ms - days * DAY_MS + HOUR_MS, now_ms - HOUR_MS, seed=seed
+    )
+
+
+def shift_catalog(catalog: synthetic.Catalog, days: int) -> synthetic.Catalog:
+    """
+    Shifts a recorded catalog so that it ends an hour ago, dropping what falls
+    before the last `days` days.
+    """
+    now_ms = int(time.time() * 1000)
+    catalog.timestamp = catalog.timestamp + (now_ms - HOUR_MS - catalog.timestamp.max())
+
+    return catalog.between(now_ms - days * DAY_MS + HOUR_MS, now_ms - HOUR_MS)
+
+
+def unique_events(catalog: synthetic.Catalog) -> int:
+    """
+    The number of earthquakes with a distinct UUID, which the producer derives
+    from their region, time and magnitude.
+    """
+    return len(
+        set(
+            zip(
+                catalog.region.tolist(),
+                catalog.timestamp.tolist(),
+                catalog.magnitude.tolist(),
+            )
+        )
+    )
+
+
+def producer_args(broker: Broker, topic: str, mode: str, **kwargs) -> List:
+    args = ["--broker", broker.address, "--topic", topic, "--mode", mode]
+
+    for key, value in kwargs.items():
+        if value is not None:
+            args += [f"--{key.replace('_', '-')}", value]
+
+    return args
+
+
+sink_args = producer_args
+
+
+def run_backfill(
+    broker: Broker, work_dir: str, events: int, wire_format: str, fixtures: bool
+) -> dict:
+    """
+    A 30 day historical backfill from the fake FDSN server, with the producer
+    and the sink running at the same time. With `fixtures`, the earthquakes are
+    the recorded ones, shifted into the last 30 days.
+    """
+    fixture = os.path.join(FIXTURES_DIR, "fdsn.xml")
+
+    if fixtures and os.path.exists(fixture):
+        catalog = shift_catalog(formats.load_quakeml(fixture), days=30)
+    else:
+        catalog = backfill_catalog(events, days=30)
+    server = FakeFDSNServer(catalog, latency_sec=0.05).start()
+    topic = broker.create_topic("backfill", partitions=3)
+
+    try:
+        sink = Stage(
+            work_dir,
+            "backfill_sink",
+            "sink",
+            "stages/sink_stage.py",
+            sink_args(
+                broker,
+                topic,
+                "historical",
+                group=f"{topic}_sink",
+                expected=unique_events(catalog),
+                idle_sec=30,
+            ),
+        )
+        producer = Stage(
+            work_dir,
+            "backfill_producer",
+            "producer",
+            "stages/producer_stage.py",
+            producer_args(
+                broker,
+                topic,
+                "historical",
+                fdsn_url=server.url,
+                last_n_days=30,
+                wire_format=wire_format,
+            ),
+        )
+
+        producer_result = producer.wait(timeout=1800)
+        sink_result = sink.wait(timeout=1800)
+
+    finally:
+        server.stop()
+        broker.delete_topic(topic)
+
+    duration = sink_result["last_insert_time"] - producer_result["start_time"]
+
+    return {
+        "producer": producer_result,
+        "sink": sink_result,
+        "pipeline": {
+            "events": sink_result["events"],
+            "events_per_sec": round(sink_result["events"] / max(duration, 1e-9), 1),
+        },
+    }
+
+
+def run_live(
+    broker: Broker, work_dir: str, rate: float, duration_sec: float, fixtures: bool
+) -> dict:
+    """
+    The live path, from the fake websocket at `rate` earthquakes per second for
+    `duration_sec`. The latencies are from the time each earthquake is sent.
+    With `fixtures`, the messages are the recorded ones.
+    """
+    fixture = os.path.join(FIXTURES_DIR, "websocket.jsonl")
+
+    if fixtures and os.path.exists(fixture):
+        properties = formats.load_websocket_messages(fixture)
+    else:
+        properties = list(formats.properties(backfill_catalog(1000, days=1)))
+
+    websocket = FakeWebsocketServer(properties, rate_per_sec=rate).start()
+    # For the backfills after a reconnect
+    fdsn = FakeFDSNServer(backfill_catalog(0, days=1)).start()
+    topic = broker.create_topic("live", partitions=1)
+    ready_path = os.path.join(work_dir, "live_sink.ready")
+
+    try:
+        # The sink reads from the end of the topic, it has to be assigned its
+        # partitions before the producer starts
+        sink = Stage(
+            work_dir,
+            "live_sink",
+            "sink",
+            "stages/sink_stage.py",
+            sink_args(
+                broker,
+                topic,
+                "live",
+                group=f"{topic}_sink",
+                ready_path=ready_path,
+                idle_sec=5,
+            ),
+        )
+
+        deadline = time.monotonic() + 60
+        while not os.path.exists(ready_path):
+            if time.monotonic() > deadline or sink.process.poll() is not None:
+                raise RuntimeError(f"The sink did not start, see {sink.log_path}")
+            time.sleep(0.2)
+        time.sleep(2)
+
+        producer = Stage(
+            work_dir,
+            "live_producer",
+            "producer",
+            "stages/producer_stage.py",
+            producer_args(
+                broker,
+                topic,
+                "live",
+                websocket_url=websocket.url,
+                fdsn_url=fdsn.url,
+                duration_sec=duration_sec,
+            ),
+        )
+
+        producer_result = producer.wait(timeout=duration_sec + 120)
+        sink_result = sink.wait(timeout=120)
+
+    finally:
+        websocket.stop()
+        fdsn.stop()
+        broker.delete_topic(topic)
+
+    return {
+        "producer": producer_result,
+        "sink": sink_result,
+        "pipeline": {"sent": websocket.sent, "events": sink_result["events"]},
+    }
+
+
+def run_kill(broker: Broker, work_dir: str, events: int, kill_after_sec: float) -> dict:
+    """
+    Kills a transactional producer in the middle of a backfill, restarts it,
+    and checks that the sink wrote every earthquake.
+    """
+    catalog = backfill_catalog(events, days=30)
+    server = FakeFDSNServer(catalog, latency_sec=0.2).start()
+    topic = broker.create_topic("kill", partitions=3)
+
+    args = producer_args(
+        broker,
+        topic,
+        "historical",
+        fdsn_url=server.url,
+        last_n_days=30,
+        max_workers=1,
+        transactional_id=f"{topic}_producer",
+        dedup_cache_path=os.path.join(work_dir, "kill_dedup.json"),
+        checkpoint_path=os.path.join(work_dir, "kill_checkpoint.json"),
+    )
+
+    try:
+        first = Stage(work_dir, "kill_producer_1", "producer", "stages/producer_stage.py", args)
+        time.sleep(kill_after_sec)
+        killed = first.process.poll() is None
+        first.process.kill()
+        first.process.wait()
+
+        producer_result = Stage(
+            work_dir, "kill_producer_2", "producer", "stages/producer_stage.py", args
+        ).wait(timeout=1800)
+
+        sink_result = Stage(
+            work_dir,
+            "kill_sink",
+            "sink",
+            "stages/sink_stage.py",
+            sink_args(
+                broker,
+                topic,
+                "historical",
+                group=f"{topic}_sink",
+                expected=unique_events(catalog),
+                idle_sec=15,
+            ),
+        ).wait(timeout=1800)
+
+    finally:
+        server.stop()
+        broker.delete_topic(topic)
+
+    missing = unique_events(catalog) - sink_result["events"]
+
+    if not killed:
+        logger.warning("The producer finished before it was killed, increase --events.")
+
+    return {
+        "producer": producer_result,
+        "sink": sink_result,
+        "check": {
+            "killed": killed,
+            "missing": missing,
+            "duplicate_messages": sink_result["duplicates"],
+            "passed": killed and missing == 0,
+        },
+    }
+
+
+def read_inserts(path: str) -> Tuple[int, List[List[str]]]:
+    """
+    Returns the number of inserts a sink stage started, and the UUIDs of each
+    insert it completed, from its `--inserts-path`.
+    """
+    started = 0
+    done = []
+
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                # The last line may be cut short by the kill
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+
+                if "started" in entry:
+                    started += 1
+                else:
+                    done.append(entry["uuids"])
+
+    return started, done
+
+
+def run_kill_sink(
+    broker: Broker, work_dir: str, events: int, insert_latency_sec: float
+) -> dict:
+    """
+    Kills the sink with SIGKILL while it writes a batch, after at least one
+    batch was written, restarts it in the same consumer group, and checks that
+    every earthquake was written, and that only the batch it was killed after
+    was written again.
+
+    The topic has a single partition, so that the sink writes one batch at a
+    time, each of at most `buffer_size` earthquakes.
+    """
+    buffer_size = 2000
+    catalog = backfill_catalog(events, days=30)
+    server = FakeFDSNServer(catalog).start()
+    topic = broker.create_topic("kill_sink", partitions=1)
+    group = f"{topic}_sink"
+    inserts_paths = [os.path.join(work_dir, f"kill_sink_{i}.inserts") for i in (1, 2)]
+
+    def sink(i: int) -> Stage:
+        return Stage(
+            work_dir,
+            f"kill_sink_{i}",
+            "sink",
+            "stages/sink_stage.py",
+            sink_args(
+                broker,
+                topic,
+                "historical",
+                group=group,
+                idle_sec=10,
+                buffer_size=buffer_size,
+                insert_latency_sec=insert_latency_sec,
+                inserts_path=inserts_paths[i - 1],
+            ),
+        )
+
+    try:
+        producer_result = Stage(
+            work_dir,
+            "kill_sink_producer",
+            "producer",
+            "stages/producer_stage.py",
+            producer_args(broker, topic, "historical", fdsn_url=server.url, last_n_days=30),
+        ).wait(timeout=1800)
+
+        # Wait for a batch to be written and the next one to be in flight
+        first = sink(1)
+        deadline = time.monotonic() + 300
+        killed = False
+
+        while time.monotonic() < deadline and first.process.poll() is None:
+            started, done = read_inserts(inserts_paths[0])
+
+            if done and started > len(done):
+                time.sleep(insert_latency_sec / 2)
+                first.process.kill()
+                killed = True
+                break
+
+            time.sleep(0.05)
+
+        first.process.wait()
+        started, done = read_inserts(inserts_paths[0])
+        killed_mid_insert = killed and started > len(done)
+
+        sink_result = sink(2).wait(timeout=1800)
+        _, rewritten = read_inserts(inserts_paths[1])
+
+    finally:
+        server.stop()
+        broker.delete_topic(topic)
+
+    written = [uuid for insert in done + rewritten for uuid in insert]
+    missing = unique_events(catalog) - len(set(written))
+    duplicates = len(written) - len(set(written))
+
+    if not killed_mid_insert:
+        logger.warning("The sink was not killed during an insert, increase --events.")
+
+    return {
+        "producer": producer_result,
+        "sink": sink_result,
+        "check": {
+            "killed_mid_insert": killed_mid_insert,
+            "batches_before_kill": len(done),
+            "missing": missing,
+            "rewritten": duplicates,
+            "passed": killed_mid_insert and missing == 0 and duplicates <= buffer_size,
+        },
+    }
+
+
+def run_scaling(
+    broker: Broker,
+    work_dir: str,
+    events: int,
+    workers: List[int],
+    insert_latency_sec: float,
+) -> dict:
+    """
+    Fills a topic, then drains it with more and more sink processes in the same
+    consumer group, with a Hopsworks insert latency of `insert_latency_sec`.
+    """
+    catalog = backfill_catalog(events, days=30)
+    server = FakeFDSNServer(catalog).start()
+    topic = broker.create_topic("scaling", partitions=max(workers))
+    scaling = {}
+
+    try:
+        Stage(
+            work_dir,
+            "scaling_producer",
+            "producer",
+            "stages/producer_stage.py",
+            producer_args(
+                broker,
+                topic,
+                "historical",
+                fdsn_url=server.url,
+                last_n_days=30,
+                partition_strategy="uuid",
+            ),
+        ).wait(timeout=1800)
+
+        for n_workers in workers:
+            group = f"{topic}_sink_{n_workers}"
+            sinks = [
+                Stage(
+                    work_dir,
+                    f"scaling_sink_{n_workers}_{i}",
+                    "sink",
+                    "stages/sink_stage.py",
+                    sink_args(
+                        broker,
+                        topic,
+                        "historical",
+                        group=group,
+                        idle_sec=10,
+                        insert_latency_sec=insert_latency_sec,
+                        uuids_path=os.path.join(work_dir, f"{group}_{i}.uuids"),
+                    ),
+                )
+                for i in range(n_workers)
+            ]
+            sink_results = [sink.wait(timeout=1800) for sink in sinks]
+
+            uuids = set()
+            for i in range(n_workers):
+                with open(os.path.join(work_dir, f"{group}_{i}.uuids")) as f:
+                    uuids.update(f.read().split())
+
+            active = [result for result in sink_results if result["inserted"]]
+            start = min(result["first_message_time"] for result in active)
+            end = max(result["last_insert_time"] for result in active)
+            inserted = sum(result["inserted"] for result in active)
+
+            scaling[f"{n_workers}_workers"] = {
+                "events": len(uuids),
+                "events_per_sec": round(inserted / max(end - start, 1e-9), 1),
+                "peak_rss_mb": max(result["peak_rss_mb"] for result in sink_results),
+            }
+
+    finally:
+        server.stop()
+        broker.delete_topic(topic)
+
+    return {"sink": scaling}
+
+
+def print_report(results: dict) -> None:
+    """
+    Prints the throughput, latency and peak RSS of every benchmark and stage,
+    and the peak Python allocations of the benchmarks that measure them.
+    """
+    rows = [("benchmark", "events/s", "p50 ms", "p99 ms", "peak RSS MB", "peak alloc MB")]
+
+    def visit(name: str, value: dict, rss: Optional[float]) -> None:
+        rss = value.get("peak_rss_mb", rss)
+        metrics = {key: v for key, v in value.items() if not isinstance(v, dict)}
+        p50 = next((v for key, v in metrics.items() if key.endswith("p50_ms")), None)
+        p99 = next((v for key, v in metrics.items() if key.endswith("p99_ms")), None)
+
+        if "events_per_sec" in metrics or p50 is not None:
+            rows.append(
+                (name, metrics.get("events_per_sec"), p50, p99, rss, metrics.get("peak_alloc_mb"))
+            )
+
+        for key, child in value.items():
+            if isinstance(child, dict):
+                # The micro benchmarks nest theirs under "benchmarks"
+                child_name = name if key == "benchmarks" else f"{name}.{key}"
+                visit(child_name.lstrip("."), child, rss)
+
+    visit("", results, None)
+
+    widths = [max(len(str(row[i])) for row in rows) for i in range(len(rows[0]))]
+    for row in rows:
+        print("  ".join(str("-" if v is None else v).ljust(w) for v, w in zip(row, widths)))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--suite", choices=["micro", "e2e", "all"], default="micro")
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(SCENARIOS),
+        help=f"Comma separated end-to-end scenarios, of {', '.join(SCENARIOS)}.",
+    )
+    parser.add_argument("--broker", default="localhost:19092")
+    parser.add_argument("--events", type=int, default=100_000)
+    parser.add_argument("--wire-format", choices=["json", "binary"], default="json")
+    parser.add_argument("--live-rate", type=float, default=200)
+    parser.add_argument("--live-duration-sec", type=float, default=30)
+    parser.add_argument("--kill-after-sec", type=float, default=3)
+    parser.add_argument("--kill-sink-insert-latency-sec", type=float, default=2)
+    parser.add_argument("--scaling-workers", default="1,2,4")
+    parser.add_argument("--insert-latency-sec", type=float, default=0.2)
+    parser.add_argument(
+        "--fixtures",
+        action="store_true",
+        help="Replay the earthquakes recorded by `record_fixtures.py`.",
+    )
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    work_dir = tempfile.mkdtemp(prefix="benchmarks-")
+    logger.info(f"Logs of the stages in {work_dir}")
+
+    current = {}
+
+    if args.suite in ("micro", "all"):
+        current["micro"] = run_micro(work_dir, args.events)
+
+    if args.suite in ("e2e", "all"):
+        broker = Broker(args.broker)
+        scenarios = args.scenarios.split(",")
+        e2e = current["e2e"] = {}
+
+        if "backfill" in scenarios:
+            e2e["backfill"] = run_backfill(
+                broker, work_dir, args.events, args.wire_format, args.fixtures
+            )
+        if "live" in scenarios:
+            e2e["live"] = run_live(
+                broker,
+                work_dir,
+                args.live_rate,
+                args.live_duration_sec,
+                args.fixtures,
+            )
+        if "kill" in scenarios:
+            e2e["kill"] = run_kill(broker, work_dir, args.events, args.kill_after_sec)
+        if "kill_sink" in scenarios:
+            e2e["kill_sink"] = run_kill_sink(
+                broker, work_dir, args.events, args.kill_sink_insert_latency_sec
+            )
+        if "scaling" in scenarios:
+            e2e["scaling"] = run_scaling(
+                broker,
+                work_dir,
+                args.events,
+                [int(n) for n in args.scaling_workers.split(",")],
+                args.insert_latency_sec,
+            )
+
+    print_report(current)
+
+    commit, dirty = results.current_commit()
+    baseline = results.previous(commit, dirty)
+
+    if not args.no_save:
+        results.save(current)
+
+    if baseline is None:
+        print("\nNo earlier results to compare with.")
+        return 0
+
+    regressions = results.compare(current, baseline["results"], args.threshold)
+
+    print(f"\nCompared with {baseline['commit'][:12]} ({baseline['time']}):")
+    for metric, old, new, change in regressions:
+        print(f"  {metric}: {old} -> {new} ({change:+.1%})")
+    if not regressions:
+        print(f"  no regression above {args.threshold:.0%}.")
+
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
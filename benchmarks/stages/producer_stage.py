@@ -0,0 +1,123 @@
+"""
+Runs the real `produce_earthquakes` against the fake Seismic Portal servers,
+and writes its throughput, latencies and peak RSS to `--result`.
+
+Run it from `services/earthquake_producer`, with the repository root on the
+path, see `benchmarks/run.py`.
+"""
+
+import argparse
+import os
+import time
+
+# `src.main` reads the service config on import, which needs a topic
+os.environ.setdefault("KAFKA_TOPIC", "benchmark")
+
+from src import main  # noqa: E402
+from src.seismic_portal_api.historical_data import HistoricalEarthquakes  # noqa: E402
+from src.seismic_portal_api.websocket import SeismicPortalAPI  # noqa: E402
+from src.throughput import ThroughputMeter  # noqa: E402
+
+from benchmarks import stats  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--broker", required=True)
+    parser.add_argument("--topic", required=True)
+    parser.add_argument("--mode", choices=["historical", "live"], required=True)
+    parser.add_argument("--result", required=True)
+    parser.add_argument("--fdsn-url")
+    parser.add_argument("--websocket-url")
+    parser.add_argument("--last-n-days", type=int, default=30)
+    parser.add_argument("--window-days", type=int, default=1)
+    parser.add_argument("--limit", type=int, default=20000)
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--duration-sec", type=float)
+    parser.add_argument("--wire-format", default="json")
+    parser.add_argument("--partition-strategy", default="region")
+    parser.add_argument("--transactional-id")
+    parser.add_argument("--dedup-cache-path")
+    parser.add_argument("--checkpoint-path")
+    return parser.parse_args()
+
+
+def run() -> None:
+    args = parse_args()
+
+    if args.fdsn_url:
+        HistoricalEarthquakes.URL = args.fdsn_url
+    if args.websocket_url:
+        SeismicPortalAPI.URL = args.websocket_url
+
+    deliveries = []
+    windows = []
+
+    # Time of each delivery and the time since its earthquake. The message
+    # timestamp is the time of the earthquake.
+    on_delivery = ThroughputMeter.on_delivery
+
+    def record_delivery(self, err, msg):
+        if err is None:
+            now = time.time()
+            deliveries.append((now, now - msg.timestamp()[1] / 1000))
+        on_delivery(self, err, msg)
+
+    ThroughputMeter.on_delivery = record_delivery
+
+    # Time to download and parse each historical window
+    fetch_window = HistoricalEarthquakes._fetch_window
+
+    def record_window(self, window, *args):
+        start = time.perf_counter()
+        earthquakes = fetch_window(self, window, *args)
+        windows.append(time.perf_counter() - start)
+        return earthquakes
+
+    HistoricalEarthquakes._fetch_window = record_window
+
+    stats.interrupt_after(args.duration_sec)
+
+    start = time.time()
+
+    try:
+        main.produce_earthquakes(
+            kafka_broker_address=args.broker,
+            kafka_topic=args.topic,
+            live_or_historical=args.mode,
+            last_n_days=args.last_n_days,
+            limit=args.limit,
+            window_days=args.window_days,
+            max_workers=args.max_workers,
+            fdsn_formats=["text"],
+            dedup_cache_path=args.dedup_cache_path,
+            wire_format=args.wire_format,
+            producer_transactional_id=args.transactional_id,
+            partition_strategy=args.partition_strategy,
+            checkpoint_path=args.checkpoint_path,
+        )
+    except KeyboardInterrupt:
+        pass
+
+    end = deliveries[-1][0] if deliveries else time.time()
+
+    result = {
+        "events": len(deliveries),
+        "start_time": start,
+        "wall_sec": round(time.time() - start, 3),
+        "events_per_sec": round(len(deliveries) / max(end - start, 1e-9), 1),
+        "peak_rss_mb": stats.peak_rss_mb(),
+        "windows": len(windows),
+        **stats.latency_ms(windows, prefix="window_fetch"),
+    }
+
+    # The time since the earthquake is the latency of the stage in live mode,
+    # where the fake websocket stamps earthquakes with the time it sends them
+    if args.mode == "live":
+        result.update(stats.latency_ms((lag for _, lag in deliveries)))
+
+    stats.write_result(args.result, result)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,171 @@
+"""
+Runs the real `kafka_to_feature_store` with the in-memory Hopsworks stub, and
+writes its throughput, latencies and peak RSS to `--result`.
+
+It stops once `--expected` earthquakes are in the stub, or once nothing was
+written for `--idle-sec` after the first write, or after `--timeout-sec`.
+
+With `--inserts-path`, each insert appends a line to that file when it starts
+and another with its UUIDs once it is done, so that a run that gets killed
+still tells which inserts completed.
+
+Run it from `services/seismic_data_sink`, with the repository root on the path,
+see `benchmarks/run.py`.
+"""
+
+import _thread
+import argparse
+import json
+import threading
+import time
+
+from src import hopsworks_stub, main
+
+from benchmarks import stats
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--broker", required=True)
+    parser.add_argument("--topic", required=True)
+    parser.add_argument("--group", required=True)
+    parser.add_argument("--mode", choices=["historical", "live"], required=True)
+    parser.add_argument("--result", required=True)
+    parser.add_argument("--ready-path", help="Created once partitions are assigned.")
+    parser.add_argument("--uuids-path", help="Where to write the UUIDs written.")
+    parser.add_argument("--inserts-path", help="Where to log each insert as it happens.")
+    parser.add_argument("--expected", type=int)
+    parser.add_argument("--idle-sec", type=float, default=10)
+    parser.add_argument("--timeout-sec", type=float, default=600)
+    parser.add_argument("--buffer-size", type=int, default=20000)
+    parser.add_argument("--save-every-n-sec", type=float, default=1)
+    parser.add_argument("--batching-policy", default="threshold")
+    parser.add_argument("--consume-batch-size", type=int, default=500)
+    parser.add_argument("--insert-latency-sec", type=float, default=0.0)
+    parser.add_argument("--insert-latency-sec-per-row", type=float, default=0.0)
+    return parser.parse_args()
+
+
+def run() -> None:
+    args = parse_args()
+
+    hopsworks_stub.INSERT_LATENCY_SEC = args.insert_latency_sec
+    hopsworks_stub.INSERT_LATENCY_SEC_PER_ROW = args.insert_latency_sec_per_row
+
+    inserts = []
+    lags = []
+    first_message_time = []
+
+    # Duration and end of each insert, and the time from each earthquake to it
+    insert = hopsworks_stub.StubFeatureGroup.insert
+
+    def log_insert(entry: dict) -> None:
+        if args.inserts_path:
+            with open(args.inserts_path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def record_insert(self, features, **kwargs):
+        log_insert({"started": time.time()})
+        start = time.perf_counter()
+        insert(self, features, **kwargs)
+        now = time.time()
+        log_insert({"done": now, "uuids": features["uuid"].astype(str).tolist()})
+        inserts.append((now, time.perf_counter() - start, len(features)))
+        lags.extend((now - features["timestamp"].to_numpy() / 1000).tolist())
+
+    hopsworks_stub.StubFeatureGroup.insert = record_insert
+
+    consume = main.consume
+
+    def record_consume(consumer, num_messages, timeout):
+        messages = consume(consumer, num_messages, timeout)
+        if messages and not first_message_time:
+            first_message_time.append(time.time())
+        return messages
+
+    main.consume = record_consume
+
+    on_assign = main.log_committed_offsets
+
+    def record_assign(consumer, partitions):
+        on_assign(consumer, partitions)
+        if args.ready_path:
+            open(args.ready_path, "w").close()
+
+    main.log_committed_offsets = record_assign
+
+    def rows():
+        return sum(
+            len(feature_group.rows)
+            for feature_group in hopsworks_stub.feature_store.feature_groups.values()
+        )
+
+    def watch():
+        start = time.time()
+
+        while True:
+            time.sleep(0.2)
+            now = time.time()
+
+            # Only idle once something was written, the topic may still be empty
+            if (
+                (args.expected is not None and rows() >= args.expected)
+                or (inserts and now - inserts[-1][0] >= args.idle_sec)
+                or now - start >= args.timeout_sec
+            ):
+                _thread.interrupt_main()
+                return
+
+    threading.Thread(target=watch, daemon=True).start()
+
+    try:
+        main.kafka_to_feature_store(
+            kafka_broker_address=args.broker,
+            kafka_topic=args.topic,
+            kafka_consumer_group=args.group,
+            feature_group_name="benchmark_earthquakes",
+            feature_group_version=1,
+            buffer_size=args.buffer_size,
+            live_or_historical=args.mode,
+            save_every_n_sec=args.save_every_n_sec,
+            hopsworks_project_name="benchmark",
+            hopsworks_api_key="benchmark",
+            use_hopsworks_stub=True,
+            batching_policy=args.batching_policy,
+            consume_batch_size=args.consume_batch_size,
+        )
+    except KeyboardInterrupt:
+        pass
+
+    inserted = sum(size for _, _, size in inserts)
+    start = first_message_time[0] if first_message_time else time.time()
+    end = inserts[-1][0] if inserts else start
+
+    result = {
+        "events": rows(),
+        "inserted": inserted,
+        "duplicates": inserted - rows(),
+        "flushes": len(inserts),
+        "first_message_time": start,
+        "last_insert_time": end,
+        "events_per_sec": round(inserted / max(end - start, 1e-9), 1),
+        "peak_rss_mb": stats.peak_rss_mb(),
+        **stats.latency_ms((duration for _, duration, _ in inserts), prefix="insert"),
+    }
+
+    # The time from the earthquake to it being in the feature store is the
+    # latency of the whole pipeline in live mode, where the fake websocket
+    # stamps earthquakes with the time it sends them
+    if args.mode == "live":
+        result.update(stats.latency_ms(lags))
+
+    if args.uuids_path:
+        with open(args.uuids_path, "w") as f:
+            for feature_group in hopsworks_stub.feature_store.feature_groups.values():
+                f.writelines(f"{key[0]}\n" for key in feature_group.rows)
+
+    stats.write_result(args.result, result)
+
+
+if __name__ == "__main__":
+    run()
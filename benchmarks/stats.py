@@ -0,0 +1,62 @@
+"""
+Helpers shared by the stage runners and the micro benchmarks, which run in the
+directory of their service, with the repository root on their path.
+"""
+
+import _thread
+import json
+import resource
+import sys
+import threading
+
+import numpy as np
+
+from typing import Dict, Iterable, Optional
+
+
+def latency_ms(samples_sec: Iterable[float], prefix: str = "latency") -> Dict[str, float]:
+    """
+    Returns the p50 and p99 of latencies in seconds, in milliseconds, under the
+    keys `{prefix}_p50_ms` and `{prefix}_p99_ms`. Empty if there are no samples.
+    """
+    samples = np.asarray(list(samples_sec), dtype=float)
+
+    if len(samples) == 0:
+        return {}
+
+    p50, p99 = np.percentile(samples, [50, 99]) * 1000
+
+    return {f"{prefix}_p50_ms": round(float(p50), 3), f"{prefix}_p99_ms": round(float(p99), 3)}
+
+
+def peak_rss_mb() -> float:
+    """
+    Returns the peak resident set size of this process, in megabytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Kilobytes on Linux, bytes on macOS
+    if sys.platform == "darwin":
+        peak /= 1024
+
+    return round(peak / 1024, 1)
+
+
+def interrupt_after(seconds: Optional[float]) -> Optional[threading.Timer]:
+    """
+    Raises a KeyboardInterrupt in the main thread after `seconds`, to stop a
+    service loop the way Ctrl-C does.
+    """
+    if seconds is None:
+        return None
+
+    timer = threading.Timer(seconds, _thread.interrupt_main)
+    timer.daemon = True
+    timer.start()
+
+    return timer
+
+
+def write_result(path: str, result: dict) -> None:
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
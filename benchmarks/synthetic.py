@@ -0,0 +1,202 @@
+"""
+A synthetic earthquake catalog, to benchmark the pipeline with data that looks
+like the Seismic Portal's without calling it:
+
+- magnitudes follow the Gutenberg-Richter law above a completeness magnitude,
+- the largest earthquakes are followed by aftershock bursts, with Omori's law
+  for their times and magnitudes below the one of their mainshock,
+- a few regions have most of the earthquakes, with Zipf-like weights.
+"""
+
+import numpy as np
+
+from dataclasses import dataclass
+from typing import List, Tuple
+
+# Flynn regions and their rough center, latitude and longitude. The first ones
+# get most of the earthquakes.
+REGIONS: List[Tuple[str, float, float]] = [
+    ("CENTRAL ITALY", 42.8, 13.1),
+    ("SOUTHERN CALIFORNIA", 34.0, -117.0),
+    ("GREECE", 38.5, 22.5),
+    ("WESTERN TURKEY", 38.8, 28.0),
+    ("HOKKAIDO, JAPAN REGION", 42.5, 143.0),
+    ("CENTRAL CHILE", -33.5, -71.5),
+    ("ICELAND", 64.0, -21.0),
+    ("SUMATRA, INDONESIA", -0.5, 100.0),
+    ("NORTHERN CALIFORNIA", 38.8, -122.8),
+    ("ALASKA PENINSULA", 56.0, -157.0),
+    ("HINDU KUSH REGION, AFGHANISTAN", 36.5, 70.8),
+    ("KERMADEC ISLANDS, NEW ZEALAND", -30.0, -178.0),
+    ("SICILY, ITALY", 37.7, 14.8),
+    ("CRETE, GREECE", 35.2, 25.0),
+    ("PUERTO RICO REGION", 18.5, -66.5),
+    ("TONGA ISLANDS", -20.0, -174.5),
+    ("PYRENEES", 42.8, 0.5),
+    ("NEAR COAST OF PERU", -12.0, -77.5),
+    ("TAIWAN", 23.8, 121.2),
+    ("CANARY ISLANDS, SPAIN REGION", 28.5, -16.5),
+]
+
+
+@dataclass
+class Catalog:
+    """
+    The earthquakes of a synthetic catalog, one array per field, sorted by time.
+    """
+
+    timestamp: np.ndarray  # milliseconds since the epoch, int64
+    magnitude: np.ndarray  # rounded to 0.1
+    depth: np.ndarray  # kilometers
+    latitude: np.ndarray
+    longitude: np.ndarray
+    region: np.ndarray  # str objects
+
+    def __len__(self) -> int:
+        return len(self.timestamp)
+
+    def between(self, start_ms: int, end_ms: int) -> "Catalog":
+        """
+        Returns the earthquakes with `start_ms <= timestamp <= end_ms`.
+        """
+        start = np.searchsorted(self.timestamp, start_ms, side="left")
+        end = np.searchsorted(self.timestamp, end_ms, side="right")
+
+        return self[start:end]
+
+    def __getitem__(self, index) -> "Catalog":
+        return Catalog(
+            timestamp=self.timestamp[index],
+            magnitude=self.magnitude[index],
+            depth=self.depth[index],
+            latitude=self.latitude[index],
+            longitude=self.longitude[index],
+            region=self.region[index],
+        )
+
+
+def gutenberg_richter(
+    rng: np.random.Generator,
+    size: int,
+    b_value: float,
+    min_magnitude: float,
+    max_magnitude: float,
+) -> np.ndarray:
+    """
+    Samples magnitudes from the Gutenberg-Richter law, log10 N(>=M) = a - b M,
+    truncated to `[min_magnitude, max_magnitude]`, by inverting its CDF.
+    """
+    span = 1 - 10 ** (-b_value * (max_magnitude - min_magnitude))
+    return min_magnitude - np.log10(1 - rng.random(size) * span) / b_value
+
+
+def generate(
+    size: int,
+    start_ms: int,
+    end_ms: int,
+    seed: int = 0,
+    b_value: float = 1.0,
+    completeness_magnitude: float = 1.0,
+    max_magnitude: float = 8.5,
+    aftershock_fraction: float = 0.3,
+    mainshock_magnitude: float = 5.0,
+    omori_c_sec: float = 60.0,
+    omori_p: float = 1.1,
+    region_skew: float = 1.2,
+) -> Catalog:
+    """
+    Generates a catalog of `size` earthquakes between `start_ms` and `end_ms`.
+
+    Background earthquakes are spread uniformly in time. Each one of at least
+    `mainshock_magnitude` triggers a share of the `aftershock_fraction` of the
+    catalog that grows tenfold per magnitude unit. Aftershocks happen after their
+    mainshock with the modified Omori law, near its epicenter, and with smaller
+    magnitudes.
+
+    Args:
+        size (int): The number of earthquakes.
+        start_ms (int): The start of the catalog, in milliseconds.
+        end_ms (int): The end of the catalog, in milliseconds.
+        seed (int): The seed of the random generator, the same seed gives the
+            same catalog.
+        b_value (float): The b-value of the Gutenberg-Richter law.
+        completeness_magnitude (float): The smallest magnitude.
+        max_magnitude (float): The largest magnitude.
+        aftershock_fraction (float): The share of aftershocks in the catalog.
+        mainshock_magnitude (float): The smallest magnitude with aftershocks.
+        omori_c_sec (float): The `c` of the Omori law, in seconds.
+        omori_p (float): The `p` of the Omori law, above 1.
+        region_skew (float): The exponent of the Zipf weights of the regions.
+
+    Returns:
+        Catalog: The earthquakes, sorted by time.
+    """
+    rng = np.random.default_rng(seed)
+
+    n_aftershocks = int(size * aftershock_fraction)
+    n_background = size - n_aftershocks
+
+    weights = 1 / np.arange(1, len(REGIONS) + 1) ** region_skew
+    region_index = rng.choice(len(REGIONS), n_background, p=weights / weights.sum())
+    centers = np.array([(lat, lon) for _, lat, lon in REGIONS])
+
+    timestamp = rng.integers(start_ms, end_ms, n_background)
+    magnitude = gutenberg_richter(
+        rng, n_background, b_value, completeness_magnitude, max_magnitude
+    )
+    latitude = centers[region_index, 0] + rng.normal(0, 1.0, n_background)
+    longitude = centers[region_index, 1] + rng.normal(0, 1.0, n_background)
+    depth = rng.lognormal(np.log(10), 0.8, n_background)
+
+    if n_aftershocks:
+        mainshocks = np.flatnonzero(magnitude >= mainshock_magnitude)
+        if len(mainshocks) == 0:
+            mainshocks = np.argsort(magnitude)[-10:]
+
+        # Productivity grows tenfold per magnitude unit
+        productivity = 10 ** (magnitude[mainshocks] - magnitude[mainshocks].min())
+        counts = rng.multinomial(n_aftershocks, productivity / productivity.sum())
+        parent = np.repeat(mainshocks, counts)
+
+        # Inverse CDF of the modified Omori law, 1 - (1 + t / c) ** (1 - p). Its
+        # tail is heavy, so the aftershocks past the end of the catalog are
+        # spread over it instead of piling up at the end.
+        with np.errstate(over="ignore"):
+            delay_sec = omori_c_sec * (
+                (1 - rng.random(n_aftershocks)) ** (1 / (1 - omori_p)) - 1
+            )
+        aftershock_time = timestamp[parent] + delay_sec * 1000
+        late = ~(aftershock_time < end_ms)
+        aftershock_time[late] = rng.integers(start_ms, end_ms, np.count_nonzero(late))
+        aftershock_timestamp = aftershock_time.astype(np.int64)
+        aftershock_magnitude = np.minimum(
+            gutenberg_richter(
+                rng, n_aftershocks, b_value, completeness_magnitude, max_magnitude
+            ),
+            magnitude[parent] - 0.1,
+        )
+
+        region_index = np.concatenate([region_index, region_index[parent]])
+        timestamp = np.concatenate([timestamp, aftershock_timestamp])
+        magnitude = np.concatenate([magnitude, aftershock_magnitude])
+        latitude = np.concatenate(
+            [latitude, latitude[parent] + rng.normal(0, 0.1, n_aftershocks)]
+        )
+        longitude = np.concatenate(
+            [longitude, longitude[parent] + rng.normal(0, 0.1, n_aftershocks)]
+        )
+        depth = np.concatenate(
+            [depth, depth[parent] + rng.normal(0, 2.0, n_aftershocks)]
+        )
+
+    order = np.argsort(timestamp, kind="stable")
+    names = np.array([name for name, _, _ in REGIONS], dtype=object)
+
+    return Catalog(
+        timestamp=timestamp[order].astype(np.int64),
+        magnitude=np.round(np.maximum(magnitude[order], completeness_magnitude), 1),
+        depth=np.round(np.abs(depth[order]), 1),
+        latitude=np.round(np.clip(latitude[order], -90, 90), 4),
+        longitude=np.round((longitude[order] + 180) % 360 - 180, 4),
+        region=names[region_index[order]],
+    )
@@ -0,0 +1,132 @@
+"""
+Checks that the services agree on the messages of the earthquake topic.
+
+The binary wire format, and the geohash of the cells, are copied by hand into
+each service that reads them. The producer benchmark writes a sample of
+earthquakes, their messages in each wire format, and their geohashes, along
+with its version and struct layout of the format. The benchmarks of the
+consumers `check_layout` of their copies first, then decode the sample with
+them and `check` the result.
+"""
+
+import os
+import pickle
+
+from typing import Any, Dict, List, Tuple
+
+SAMPLE_FILE = "wire_format_sample.pkl"
+
+# Geohash precisions of the sample, the ones the services use
+GEOHASH_PRECISIONS = (1, 2, 3, 5)
+
+
+def write_sample(
+    work_dir: str,
+    version: int,
+    layout: str,
+    records: List[Dict[str, Any]],
+    messages: Dict[str, List[bytes]],
+    geohashes: List[Tuple[float, float, int, str]],
+) -> None:
+    """
+    Saves the producer's side of the sample to `work_dir`.
+
+    Args:
+        work_dir (str): The directory shared by the benchmarks.
+        version (int): The version of the binary wire format.
+        layout (str): The struct format of its header.
+        records (List[Dict[str, Any]]): The earthquakes, as the JSON messages
+            hold them, i.e. with the UUID as a string.
+        messages (Dict[str, List[bytes]]): Their messages, by wire format.
+        geohashes (List[Tuple[float, float, int, str]]): Points with a precision
+            and their geohash.
+    """
+    sample = {
+        "version": version,
+        "layout": layout,
+        "records": records,
+        "messages": messages,
+        "geohashes": geohashes,
+    }
+
+    with open(os.path.join(work_dir, SAMPLE_FILE), "wb") as f:
+        pickle.dump(sample, f)
+
+
+def load_sample(work_dir: str) -> dict:
+    with open(os.path.join(work_dir, SAMPLE_FILE), "rb") as f:
+        return pickle.load(f)
+
+
+def check_layout(sample: dict, service: str, version: int, layout: str) -> None:
+    """
+    Checks that the copy of the wire format of `service` has the version and
+    struct layout of the producer's.
+
+    Raises:
+        RuntimeError: If they differ.
+    """
+    if (version, layout) != (sample["version"], sample["layout"]):
+        raise RuntimeError(
+            f"{service} reads version {version} {layout!r} of the wire format, "
+            f"the producer writes version {sample['version']} {sample['layout']!r}."
+        )
+
+
+def check(
+    sample: dict,
+    service: str,
+    decoded: Dict[str, List[Dict[str, Any]]],
+    geohash=None,
+) -> Dict[str, int]:
+    """
+    Compares the decoding of the sample by `service` with the producer's.
+
+    Args:
+        sample (dict): The sample, from `load_sample`.
+        service (str): The name of the service, for the error.
+        decoded (Dict[str, List[Dict[str, Any]]]): The earthquakes the service
+            decoded from the messages of each wire format.
+        geohash: The service's copy of the geohash function, if it has one.
+
+    Returns:
+        Dict[str, int]: The number of messages and geohashes checked.
+
+    Raises:
+        RuntimeError: If the service disagrees with the producer.
+    """
+    errors = []
+
+    for wire_format, earthquakes in decoded.items():
+        if len(earthquakes) != len(sample["records"]):
+            errors.append(
+                f"{len(earthquakes)} earthquakes decoded from {wire_format}, "
+                f"{len(sample['records'])} written"
+            )
+
+        for expected, earthquake in zip(sample["records"], earthquakes):
+            fields = {name: earthquake.get(name) for name in expected}
+
+            if fields != expected:
+                errors.append(f"{wire_format}: decoded {fields}, written {expected}")
+                break
+
+    if geohash is not None:
+        for latitude, longitude, precision, expected in sample["geohashes"]:
+            if geohash(latitude, longitude, precision) != expected:
+                errors.append(
+                    f"geohash of ({latitude}, {longitude}) at precision {precision} is "
+                    f"{geohash(latitude, longitude, precision)!r}, the producer's is "
+                    f"{expected!r}"
+                )
+                break
+
+    if errors:
+        raise RuntimeError(
+            f"{service} disagrees with the producer:\n" + "\n".join(errors)
+        )
+
+    return {
+        "messages_checked": sum(len(earthquakes) for earthquakes in decoded.values()),
+        "geohashes_checked": len(sample["geohashes"]) if geohash is not None else 0,
+    }
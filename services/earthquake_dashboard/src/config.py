@@ -15,6 +15,29 @@ class Config(BaseSettings):
 
     live_or_historical: Optional[str] = "historical"
 
+    # where the offline features are read from: "hopsworks", or "parquet" for
+    # the local store the sink writes under `parquet_store_path` with its
+    # `sink_backend` set to "parquet"
+    offline_store: str = "hopsworks"
+    parquet_store_path: str = "data/offline_store"
+
+    # local Parquet copy of the offline features, refreshed with the events
+    # newer than the ones it has at most every `offline_data_ttl_sec`, and
+    # read again in full every `feature_cache_full_refresh_every_sec`
+    feature_cache_path: str = "data/offline_features.parquet"
+    offline_data_ttl_sec: int = 10 * 60
+    feature_cache_full_refresh_every_sec: int = 24 * 60 * 60
+
+    # how long the online features are served from memory before reading them again
+    online_data_ttl_sec: int = 10
+
+    # maximum number of points drawn on the map, earthquakes are binned into
+    # a grid to stay under it
+    map_max_points: int = 5000
+
+    # port of the Prometheus metrics endpoint, off if not set
+    metrics_port: Optional[int] = None
+
     @field_validator("live_or_historical")
     @classmethod
     def validate_live_or_historical(cls, value):
@@ -24,5 +47,14 @@ class Config(BaseSettings):
         }, f"Invalid value for live_or_historical: {value}"
         return value
 
+    @field_validator("offline_store")
+    @classmethod
+    def validate_offline_store(cls, value):
+        assert value in {
+            "hopsworks",
+            "parquet",
+        }, f"Invalid value for offline_store: {value}"
+        return value
+
 
 config = Config()
@@ -0,0 +1,298 @@
+import math
+import threading
+
+import numpy as np
+import pandas as pd
+
+from typing import List, Optional
+
+EARTH_RADIUS_KM = 6371.0
+
+
+class EventIndex:
+    """
+    An in-memory index of earthquakes to answer "the events within `radius_km`
+    of a point, between two times, in a magnitude range" without scanning them
+    all.
+
+    Events are bucketed into a grid of `cell_deg` degree cells, and kept sorted
+    by cell and then by timestamp, so that a query only reads the time range of
+    the cells around the point before computing exact haversine distances.
+    Queries without a point use a second, timestamp-sorted order.
+
+    Inserted events go to a pending buffer that queries scan, and are merged into
+    the sorted arrays once it holds more than `max_pending` events or a tenth of
+    the index, which keeps inserts cheap as live events arrive.
+
+    Events are keyed by `uuid`: inserting an event that is already indexed
+    replaces it. The old row is marked as removed in the sorted arrays, which
+    queries skip, until the next merge drops it.
+    """
+
+    def __init__(
+        self,
+        data: Optional[pd.DataFrame] = None,
+        cell_deg: float = 1.0,
+        max_pending: int = 10_000,
+    ):
+        """
+        Args:
+            data (Optional[pd.DataFrame]): Earthquakes to index, with at least the
+                `uuid`, `timestamp`, `latitude`, `longitude` and `magnitude`
+                columns.
+            cell_deg (float): The side of the grid cells, in degrees.
+            max_pending (int): The number of inserted events we keep out of the
+                sorted arrays before merging them in.
+        """
+        self.cell_deg = cell_deg
+        self.max_pending = max_pending
+
+        self._rows = int(math.ceil(180 / cell_deg))
+        self._columns = int(math.ceil(360 / cell_deg))
+
+        self._data = pd.DataFrame()
+        self._pending: List[pd.DataFrame] = []
+        self._pending_rows = 0
+
+        # Sessions and the refresh of the feature cache run in different threads
+        self._lock = threading.Lock()
+
+        self._build(data if data is not None else pd.DataFrame())
+
+    def __len__(self) -> int:
+        return len(self._data) - self._removed_rows + self._pending_rows
+
+    def insert(self, data: pd.DataFrame) -> None:
+        """
+        Adds earthquakes to the index, replacing the indexed ones with the same
+        `uuid`.
+        """
+        if data.empty:
+            return
+
+        data = data.drop_duplicates(subset="uuid", keep="last")
+
+        with self._lock:
+            # Remove the previous versions of the events, sorted or pending
+            positions = self._uuids.get_indexer(data["uuid"])
+            positions = positions[positions >= 0]
+            positions = positions[~self._removed[positions]]
+            self._removed[positions] = True
+            self._removed_rows += len(positions)
+
+            self._pending = [
+                pending[~pending["uuid"].isin(data["uuid"])] for pending in self._pending
+            ]
+            self._pending.append(data)
+            self._pending_rows = sum(len(pending) for pending in self._pending)
+
+            if self._pending_rows + self._removed_rows > max(
+                self.max_pending, len(self._data) // 10
+            ):
+                self._build(
+                    pd.concat(
+                        [self._data[~self._removed], *self._pending], ignore_index=True
+                    )
+                )
+
+    def query(
+        self,
+        latitude: Optional[float] = None,
+        longitude: Optional[float] = None,
+        radius_km: Optional[float] = None,
+        start_time: Optional[int] = None,
+        end_time: Optional[int] = None,
+        min_magnitude: Optional[float] = None,
+        max_magnitude: Optional[float] = None,
+    ) -> pd.DataFrame:
+        """
+        Returns the earthquakes matching all the given conditions.
+
+        Args:
+            latitude (Optional[float]): Latitude of the point to search around.
+            longitude (Optional[float]): Longitude of the point to search around.
+            radius_km (Optional[float]): The maximum distance to the point, in km.
+                Ignored unless `latitude` and `longitude` are given too.
+            start_time (Optional[int]): The earliest timestamp, in milliseconds.
+            end_time (Optional[int]): The timestamp to stop at, excluded.
+            min_magnitude (Optional[float]): The minimum magnitude.
+            max_magnitude (Optional[float]): The maximum magnitude.
+
+        Returns:
+            pd.DataFrame: The matching earthquakes.
+        """
+        start_time = -(2**63) if start_time is None else start_time
+        end_time = 2**63 - 1 if end_time is None else end_time
+        spatial = None not in (latitude, longitude, radius_km)
+
+        with self._lock:
+            data = self._data
+
+            if spatial:
+                candidates = self._spatial_candidates(
+                    latitude, longitude, radius_km, start_time, end_time
+                )
+            else:
+                lo, hi = np.searchsorted(
+                    self._sorted_timestamps, [start_time, end_time], side="left"
+                )
+                candidates = self._time_order[lo:hi]
+
+            candidates = candidates[~self._removed[candidates]]
+            pending = (
+                pd.concat(self._pending, ignore_index=True) if self._pending else None
+            )
+
+        matches = [data.iloc[candidates]]
+
+        if pending is not None:
+            timestamp = pending["timestamp"].to_numpy()
+            matches.append(pending[(timestamp >= start_time) & (timestamp < end_time)])
+
+        result = pd.concat(matches, ignore_index=True)
+
+        # An empty index may not even have the columns
+        if result.empty:
+            return result.reset_index(drop=True)
+
+        if spatial:
+            distance = haversine_km(
+                latitude,
+                longitude,
+                result["latitude"].to_numpy(),
+                result["longitude"].to_numpy(),
+            )
+            result = result[distance <= radius_km]
+
+        if min_magnitude is not None:
+            result = result[result["magnitude"] >= min_magnitude]
+
+        if max_magnitude is not None:
+            result = result[result["magnitude"] <= max_magnitude]
+
+        return result.reset_index(drop=True)
+
+    def _build(self, data: pd.DataFrame) -> None:
+        """
+        Sorts `data` by cell and timestamp and builds the arrays of the index.
+        """
+        self._pending, self._pending_rows = [], 0
+
+        if data.empty:
+            self._data = data
+            self._uuids = pd.Index([])
+            self._removed = np.zeros(0, dtype=bool)
+            self._removed_rows = 0
+            self._cells = np.empty(0, dtype=np.int64)
+            self._timestamps = np.empty(0, dtype=np.int64)
+            self._cell_ids = np.empty(0, dtype=np.int64)
+            self._cell_starts = np.empty(0, dtype=np.int64)
+            self._cell_ends = np.empty(0, dtype=np.int64)
+            self._time_order = np.empty(0, dtype=np.int64)
+            self._sorted_timestamps = np.empty(0, dtype=np.int64)
+            return
+
+        data = data.drop_duplicates(subset="uuid", keep="last")
+
+        cells = self._cell_of(data["latitude"].to_numpy(), data["longitude"].to_numpy())
+        timestamps = data["timestamp"].to_numpy(dtype=np.int64)
+
+        order = np.lexsort((timestamps, cells))
+        self._data = data.iloc[order].reset_index(drop=True)
+        self._uuids = pd.Index(self._data["uuid"])
+        self._removed = np.zeros(len(self._data), dtype=bool)
+        self._removed_rows = 0
+        self._cells = cells[order]
+        self._timestamps = timestamps[order]
+
+        # Start and end of each non-empty cell in the sorted arrays
+        starts = np.flatnonzero(np.diff(self._cells, prepend=-1))
+        self._cell_ids = self._cells[starts]
+        self._cell_starts = starts
+        self._cell_ends = np.append(starts[1:], len(self._cells))
+
+        self._time_order = np.argsort(self._timestamps, kind="stable")
+        self._sorted_timestamps = self._timestamps[self._time_order]
+
+    def _cell_of(self, latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+        rows = np.clip(
+            np.floor((latitude + 90) / self.cell_deg).astype(np.int64), 0, self._rows - 1
+        )
+        columns = (
+            np.floor((longitude + 180) / self.cell_deg).astype(np.int64) % self._columns
+        )
+
+        return rows * self._columns + columns
+
+    def _spatial_candidates(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        start_time: int,
+        end_time: int,
+    ) -> np.ndarray:
+        """
+        Returns the positions of the events in the time range and in the cells
+        that overlap the bounding box of the circle around the point.
+        """
+        dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+        min_lat, max_lat = latitude - dlat, latitude + dlat
+
+        rows = np.arange(
+            max(int(math.floor((min_lat + 90) / self.cell_deg)), 0),
+            min(int(math.floor((max_lat + 90) / self.cell_deg)), self._rows - 1) + 1,
+        )
+
+        # Longitude degrees get shorter towards the poles
+        max_abs_lat = max(abs(min_lat), abs(max_lat))
+        cos_lat = math.cos(math.radians(max_abs_lat)) if max_abs_lat < 90 else 0.0
+        dlon = (
+            math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat)) if cos_lat > 0 else 180
+        )
+
+        if dlon >= 180:
+            columns = np.arange(self._columns)
+        else:
+            first = int(math.floor((longitude - dlon + 180) / self.cell_deg))
+            last = int(math.floor((longitude + dlon + 180) / self.cell_deg))
+            columns = np.unique(np.arange(first, last + 1) % self._columns)
+
+        cells = (rows[:, None] * self._columns + columns[None, :]).ravel()
+
+        # Keep the cells that have events
+        positions = np.searchsorted(self._cell_ids, cells)
+        found = positions < len(self._cell_ids)
+        positions, cells = positions[found], cells[found]
+        positions = positions[self._cell_ids[positions] == cells]
+
+        ranges = []
+
+        for start, end in zip(self._cell_starts[positions], self._cell_ends[positions]):
+            lo, hi = np.searchsorted(
+                self._timestamps[start:end], [start_time, end_time], side="left"
+            )
+            if hi > lo:
+                ranges.append(np.arange(start + lo, start + hi))
+
+        return np.concatenate(ranges) if ranges else np.empty(0, dtype=np.int64)
+
+
+def haversine_km(
+    latitude: float,
+    longitude: float,
+    latitudes: np.ndarray,
+    longitudes: np.ndarray,
+) -> np.ndarray:
+    """
+    Returns the great-circle distances, in km, from a point to many points.
+    """
+    lat1, lon1 = math.radians(latitude), math.radians(longitude)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
@@ -0,0 +1,145 @@
+import os
+import threading
+import time
+
+import pandas as pd
+
+from loguru import logger
+from typing import Callable, Optional
+
+from src import metrics
+from src.event_index import EventIndex
+
+
+class FeatureCache:
+    """
+    A local Parquet copy of the offline features, so that the dashboard serves
+    page loads from disk instead of reading the whole feature view each time.
+
+    `refresh` only asks `fetch` for the events from the highest cached
+    `timestamp` on, and merges them in by `uuid`. Events that reach the offline
+    store late with an older timestamp, e.g. from a historical backfill, are
+    missed by the incremental refreshes, so the whole feature view is read
+    again every `full_refresh_every_sec`.
+
+    The cached features are also indexed in `index`, which each refresh
+    updates with the new events, to query them by place and time.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fetch: Callable[[Optional[int]], pd.DataFrame],
+        full_refresh_every_sec: float = 24 * 60 * 60,
+    ):
+        """
+        Args:
+            path (str): The Parquet file of the cache.
+            fetch (Callable[[Optional[int]], pd.DataFrame]): Reads the features
+                from a timestamp on, in milliseconds, or all of them given None.
+            full_refresh_every_sec (float): How often to read all the features.
+        """
+        self.path = path
+        self.fetch = fetch
+        self.full_refresh_every_sec = full_refresh_every_sec
+
+        self._data: Optional[pd.DataFrame] = None
+        self.index = EventIndex()
+        self._last_full_refresh_time: Optional[float] = None
+
+        # Sessions run in threads of the same process
+        self._lock = threading.Lock()
+
+    def read(self) -> pd.DataFrame:
+        """
+        Returns the cached features, loading them from `path` on the first call.
+        """
+        with self._lock:
+            return self._load()
+
+    def refresh(self) -> pd.DataFrame:
+        """
+        Fetches the features we do not have yet, saves them and returns all of them.
+        """
+        with self._lock:
+            data = self._load()
+
+            # The cache loaded from disk counts as fresh when the process starts
+            full_refresh = data.empty or (
+                self._last_full_refresh_time is not None
+                and time.monotonic() - self._last_full_refresh_time
+                >= self.full_refresh_every_sec
+            )
+
+            start = time.perf_counter()
+
+            if full_refresh:
+                data = self._deduplicate(self.fetch(None))
+                self.index = EventIndex(data)
+                self._last_full_refresh_time = time.monotonic()
+            else:
+                # From the last cached timestamp included, in case several events
+                # share it. The ones we have are replaced by uuid.
+                since = int(data["timestamp"].max())
+                new_data = self.fetch(since)
+
+                self.index.insert(new_data)
+
+                data = self._deduplicate(pd.concat([data, new_data], ignore_index=True))
+
+                if self._last_full_refresh_time is None:
+                    self._last_full_refresh_time = time.monotonic()
+
+            elapsed_sec = time.perf_counter() - start
+            kind = "full" if full_refresh else "incremental"
+            logger.info(
+                f"Refreshed the feature cache in {elapsed_sec:.3f}s "
+                f"({kind}, {len(data)} rows)."
+            )
+
+            metrics.REFRESH_SECONDS.labels(kind).observe(elapsed_sec)
+            metrics.CACHED_ROWS.set(len(data))
+            if not data.empty:
+                metrics.set_newest_event_age("offline", data["timestamp"].max())
+
+            self._save(data)
+            self._data = data
+
+            return data
+
+    def _load(self) -> pd.DataFrame:
+        if self._data is None:
+            if os.path.exists(self.path):
+                self._data = pd.read_parquet(self.path)
+                self.index = EventIndex(self._data)
+                logger.info(f"Loaded {len(self._data)} rows from {self.path}.")
+            else:
+                self._data = pd.DataFrame()
+
+        return self._data
+
+    def _save(self, data: pd.DataFrame) -> None:
+        """
+        Atomically writes `data` to `path`.
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = f"{self.path}.tmp"
+        data.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _deduplicate(data: pd.DataFrame) -> pd.DataFrame:
+        """
+        Keeps the last row of each `uuid`, sorted by `timestamp`.
+        """
+        if data.empty:
+            return data
+
+        return (
+            data.drop_duplicates(subset="uuid", keep="last")
+            .sort_values("timestamp")
+            .reset_index(drop=True)
+        )
@@ -1,8 +1,18 @@
+import os
+import time
+
+from functools import partial
+
+import pandas as pd
 import streamlit as st
 
+from src import metrics
 from src.config import config
+from src.event_index import EventIndex
+from src.feature_cache import FeatureCache
 from src.hopsworks_api import HopsworksApi
-from datetime import datetime, timezone
+from src.map_grid import bin_events, cell_size_for_zoom
+from src.parquet_store import read_parquet_store
 
 st.set_page_config(
     layout="wide",
@@ -12,41 +22,116 @@ st.title("Earthquake Dashboard")
 
 live_or_historical = st.radio("Live or Historical Data", ["Live", "Historical"])
 
-hopsworks_api = HopsworksApi(
-    api_key=config.hopsworks_api_key,
-    project_name=config.hopsworks_project_name,
-    feature_group_name=config.feature_group_name,
-    feature_group_version=config.feature_group_version,
-    feature_view_name=config.feature_view_name,
-    feature_view_version=config.feature_view_version,
-)
 
+@st.cache_resource
+def start_metrics_server() -> None:
+    # Once per process, not on every rerun of the script
+    metrics.start_metrics_server(config.metrics_port)
+
+
+start_metrics_server()
+
+
+@st.cache_resource
+def get_hopsworks_api() -> HopsworksApi:
+    # One client per process, shared by all sessions
+    return HopsworksApi(
+        api_key=config.hopsworks_api_key,
+        project_name=config.hopsworks_project_name,
+        feature_group_name=config.feature_group_name,
+        feature_group_version=config.feature_group_version,
+        feature_view_name=config.feature_view_name,
+        feature_view_version=config.feature_view_version,
+    )
+
+
+@st.cache_resource
+def get_feature_cache() -> FeatureCache:
+    if config.offline_store == "parquet":
+        # The store of the feature group, as the sink names it
+        fetch = partial(
+            read_parquet_store,
+            os.path.join(
+                config.parquet_store_path,
+                f"{config.feature_group_name}_{config.feature_group_version}",
+            ),
+        )
+    else:
+        fetch = get_hopsworks_api().extract_offline_features_from_feature_view
+
+    return FeatureCache(
+        path=config.feature_cache_path,
+        fetch=fetch,
+        full_refresh_every_sec=config.feature_cache_full_refresh_every_sec,
+    )
 
-@st.cache_data
-def get_offline_data():
-    return hopsworks_api.extract_offline_features_from_feature_view()
 
+@st.cache_data(ttl=config.offline_data_ttl_sec)
+def refresh_offline_data() -> int:
+    # Refreshes the feature cache and its index at most once per TTL, and
+    # returns the number of rows rather than a copy of them
+    return len(get_feature_cache().refresh())
 
+
+@st.cache_data(ttl=config.online_data_ttl_sec)
 def get_online_data():
-    return hopsworks_api.extract_online_features_from_feature_group()
+    return get_hopsworks_api().extract_online_features_from_feature_group()
+
 
+magnitude_range = st.slider("Magnitude", 0.0, 10.0, (0.0, 10.0), step=0.1)
+map_zoom = st.slider("Map detail", 1, 10, 1)
 
-historical_data = get_offline_data()
-live_data = get_online_data()
+with st.expander("Search around a point"):
+    search = st.checkbox("Only show the earthquakes around a point")
+    search_latitude = st.number_input("Latitude", -90.0, 90.0, 0.0)
+    search_longitude = st.number_input("Longitude", -180.0, 180.0, 0.0)
+    search_radius_km = st.number_input("Radius (km)", 1.0, 20000.0, 500.0)
+    search_last_n_days = st.number_input("Last n days", 1, 36500, 30)
 
 if live_or_historical == "Historical":
-    data = historical_data
+    refresh_offline_data()
+    index = get_feature_cache().index
+
+else:
+    # The online data is small, it is indexed on every rerun
+    index = EventIndex(get_online_data())
+
+start = time.perf_counter()
 
+if search:
+    now_ms = int(pd.Timestamp.now(tz="UTC").timestamp() * 1000)
+    data = index.query(
+        latitude=search_latitude,
+        longitude=search_longitude,
+        radius_km=search_radius_km,
+        start_time=now_ms - search_last_n_days * 24 * 60 * 60 * 1000,
+        min_magnitude=magnitude_range[0],
+        max_magnitude=magnitude_range[1],
+    )
 else:
-    data = live_data
+    data = index.query(min_magnitude=magnitude_range[0], max_magnitude=magnitude_range[1])
+
+metrics.QUERY_SECONDS.labels(str(search).lower()).observe(time.perf_counter() - start)
+
+if data.empty:
+    st.info("No earthquakes to show.")
+    st.stop()
+
+# Bin the earthquakes into cells sized for the zoom level, so that the map gets
+# a bounded number of points
+map_data = bin_events(
+    data,
+    cell_deg=cell_size_for_zoom(map_zoom),
+    max_points=config.map_max_points,
+)
+st.map(map_data, latitude="latitude", longitude="longitude", size="magnitude", zoom=map_zoom)
 
-# Convert timestamp in milliseconds to datetime
-data["datetime"] = data["timestamp"].apply(
-    lambda x: datetime.fromtimestamp(x / 1000, timezone.utc)
+# Convert timestamp in milliseconds to datetime, for the latest earthquakes only
+latest = data.nlargest(50, "timestamp").assign(
+    datetime=lambda df: pd.to_datetime(df["timestamp"], unit="ms", utc=True)
 )
-data = data[["datetime", "region", "magnitude", "latitude", "longitude", "depth"]]
+latest = latest[["datetime", "region", "magnitude", "latitude", "longitude", "depth"]]
 
-data.set_index("datetime", inplace=True)
+latest.set_index("datetime", inplace=True)
 
-st.map(data, latitude="latitude", longitude="longitude", size="magnitude", zoom=1)
-st.table(data.sort_index(ascending=False).head(50))
+st.table(latest)
@@ -1,12 +1,25 @@
+import threading
+
 import hopsworks
 import pandas as pd
 from hsfs.feature_group import FeatureGroup
 from hsfs.feature_view import FeatureView, FeatureStoreException
 
 from loguru import logger
+from typing import Optional
+
+from src import metrics
 
 
 class HopsworksApi:
+    """
+    A long-lived client for the feature group and feature view of the dashboard.
+
+    We log in on the first request, not when the client is created, and reuse
+    the feature store, feature group and feature view for every request after
+    it. Create one client per process and share it across sessions.
+    """
+
     def __init__(
         self,
         api_key: str,
@@ -16,34 +29,52 @@ class HopsworksApi:
         feature_view_name: str,
         feature_view_version: int = 1,
     ):
-        logger.info(f"Connecting to Hopsworks. Project name: {project_name}")
-        self.project = hopsworks.login(
-            api_key_value=api_key,
-            project=project_name,
-        )
         # initialize variables
+        self.api_key = api_key
+        self.project_name = project_name
         self.feature_group_name = feature_group_name
         self.feature_group_version = feature_group_version
         self.feature_view_name = feature_view_name
         self.feature_view_version = feature_view_version
-        logger.info("Connected to Hopsworks")
-        self.feature_store = self.project.get_feature_store()
-        logger.info("Connected to Hopsworks Feature Store")
 
-    def get_feature_group(self) -> FeatureGroup:
+        self._feature_store = None
+        self._feature_group: Optional[FeatureGroup] = None
+        self._feature_view: Optional[FeatureView] = None
+
+        # Sessions run in threads of the same process
+        self._lock = threading.Lock()
+
+    @property
+    def feature_store(self):
         """
-        Gets the feature group from the Hopsworks feature store. If it does
-        not exist, it creates it.
+        The feature store of the project, logging in to Hopsworks if we have not yet.
         """
+        with self._lock:
+            if self._feature_store is None:
+                logger.info(f"Connecting to Hopsworks. Project name: {self.project_name}")
+                project = hopsworks.login(
+                    api_key_value=self.api_key,
+                    project=self.project_name,
+                )
+                logger.info("Connected to Hopsworks")
+                self._feature_store = project.get_feature_store()
+                logger.info("Connected to Hopsworks Feature Store")
+
+        return self._feature_store
 
-        # Get the feature group to read the feature view from
-        feature_group = self.feature_store.get_feature_group(
-            name=self.feature_group_name,
-            version=self.feature_group_version,
-        )
-        logger.info(f"Connected to feature group: {self.feature_group_name}")
+    def get_feature_group(self) -> FeatureGroup:
+        """
+        Gets the feature group from the Hopsworks feature store.
+        """
+        if self._feature_group is None:
+            # Get the feature group to read the feature view from
+            self._feature_group = self.feature_store.get_feature_group(
+                name=self.feature_group_name,
+                version=self.feature_group_version,
+            )
+            logger.info(f"Connected to feature group: {self.feature_group_name}")
 
-        return feature_group
+        return self._feature_group
 
     def get_feature_view(self) -> FeatureView:
         """
@@ -52,27 +83,43 @@ class HopsworksApi:
         data in the dashboard.
         """
 
-        feature_group = self.get_feature_group()
+        if self._feature_view is None:
+            feature_group = self.get_feature_group()
 
-        feature_view = self.feature_store.get_or_create_feature_view(
-            name=self.feature_view_name,
-            version=self.feature_view_version,
-            query=feature_group.select_all(),
-        )
+            self._feature_view = self.feature_store.get_or_create_feature_view(
+                name=self.feature_view_name,
+                version=self.feature_view_version,
+                query=feature_group.select_all(),
+            )
+
+        return self._feature_view
+
+    def extract_offline_features_from_feature_view(
+        self, start_time: Optional[int] = None
+    ) -> pd.DataFrame:
+        """
+        Extracts offline features from the feature view.
 
-        return feature_view
+        Args:
+            start_time (Optional[int]): If given, only the events from this
+                timestamp on, in milliseconds, are read.
 
-    def extract_offline_features_from_feature_view(self) -> pd.DataFrame:
+        Returns:
+            pd.DataFrame: The features.
+        """
         feature_view = self.get_feature_view()
 
         logger.info(
             f"Extracting offline features from feature view: {self.feature_view_name}"
+            + (f", from timestamp {start_time}" if start_time is not None else "")
         )
 
         try:
-            features: pd.DataFrame = feature_view.get_batch_data(
-                read_options={"use_hive": True}
-            )
+            with metrics.READ_SECONDS.labels("offline").time():
+                features: pd.DataFrame = feature_view.get_batch_data(
+                    start_time=start_time,
+                    read_options={"use_hive": True},
+                )
 
         except FeatureStoreException:
             # retry the call with the use_hive option. This is what Hopsworks recommends
@@ -88,4 +135,10 @@ class HopsworksApi:
 
         feature_group = self.get_feature_group()
 
-        return feature_group.read(online=True)
+        with metrics.READ_SECONDS.labels("online").time():
+            features = feature_group.read(online=True)
+
+        if not features.empty:
+            metrics.set_newest_event_age("online", features["timestamp"].max())
+
+        return features
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+
+def cell_size_for_zoom(zoom: int) -> float:
+    """
+    Returns the side, in degrees, of the grid cells for a map zoom level, about
+    a few pixels wide on screen: 4 degrees at zoom 1, halving at each level.
+    """
+    return 4.0 / 2 ** (zoom - 1)
+
+
+def bin_events(
+    data: pd.DataFrame,
+    cell_deg: float,
+    max_points: int = 5000,
+) -> pd.DataFrame:
+    """
+    Bins earthquakes into a grid of `cell_deg` degree cells, with one point per
+    cell at the mean position of its earthquakes, so that the map shows a bounded
+    number of points however much history there is. If there are more than
+    `max_points` cells, the cells are made bigger until there are not.
+
+    Args:
+        data (pd.DataFrame): Earthquakes with `latitude`, `longitude` and
+            `magnitude` columns.
+        cell_deg (float): The side of the cells, in degrees.
+        max_points (int): The maximum number of points returned.
+
+    Returns:
+        pd.DataFrame: One row per cell with the mean `latitude` and `longitude`,
+            the maximum `magnitude` and the `count` of earthquakes.
+    """
+    if data.empty:
+        return pd.DataFrame(columns=["latitude", "longitude", "magnitude", "count"])
+
+    latitude = data["latitude"].to_numpy()
+    longitude = data["longitude"].to_numpy()
+
+    rows = np.floor((latitude + 90) / cell_deg).astype(np.int64)
+    columns = np.floor((longitude + 180) / cell_deg).astype(np.int64)
+    width = int(360 / cell_deg) + 2
+
+    # Double the cells until there are few enough, working on the distinct
+    # cells only, which are far fewer than the earthquakes once coarse enough
+    cell_rows, cell_columns = rows, columns
+    shift = 0
+
+    while True:
+        distinct = _distinct(cell_rows * width + cell_columns)
+
+        if len(distinct) <= max_points:
+            break
+
+        cell_rows, cell_columns = distinct // width >> 1, distinct % width >> 1
+        shift += 1
+
+    cells = (rows >> shift) * width + (columns >> shift)
+
+    return (
+        pd.DataFrame(
+            {
+                "cell": cells,
+                "latitude": latitude,
+                "longitude": longitude,
+                "magnitude": data["magnitude"].to_numpy(),
+            }
+        )
+        .groupby("cell", sort=False)
+        .agg(
+            latitude=("latitude", "mean"),
+            longitude=("longitude", "mean"),
+            magnitude=("magnitude", "max"),
+            count=("magnitude", "size"),
+        )
+        .reset_index(drop=True)
+    )
+
+
+def _distinct(values: np.ndarray) -> np.ndarray:
+    """
+    Returns the sorted distinct values, like `np.unique`, which is several times
+    slower on millions of integers.
+    """
+    values = np.sort(values)
+
+    return values[np.concatenate(([True], values[1:] != values[:-1]))]
@@ -0,0 +1,65 @@
+"""
+Prometheus metrics of the earthquake dashboard, served over HTTP by
+`start_metrics_server` for Prometheus to scrape.
+
+Every service has its own copy of `start_metrics_server`, with the metrics of
+that service. Latencies are in seconds, and the age of an earthquake is the time
+since its `timestamp`, i.e. since it happened.
+"""
+
+import time
+
+from loguru import logger
+from prometheus_client import Gauge, Histogram, start_http_server
+from typing import Optional
+
+READ_SECONDS = Histogram(
+    "earthquake_dashboard_read_seconds",
+    "Time to read features from Hopsworks, or from the local Parquet store.",
+    ["store"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+REFRESH_SECONDS = Histogram(
+    "earthquake_dashboard_cache_refresh_seconds",
+    "Time to refresh the local cache of the offline features.",
+    ["kind"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+CACHED_ROWS = Gauge(
+    "earthquake_dashboard_cached_rows",
+    "Number of earthquakes in the local cache of the offline features.",
+)
+QUERY_SECONDS = Histogram(
+    "earthquake_dashboard_query_seconds",
+    "Time to query the earthquakes to show from the index.",
+    ["search"],
+)
+NEWEST_EVENT_AGE_SECONDS = Gauge(
+    "earthquake_dashboard_newest_event_age_seconds",
+    "Time since the newest earthquake the dashboard can show, i.e. how stale it is.",
+    ["store"],
+)
+
+
+def start_metrics_server(port: Optional[int]) -> None:
+    """
+    Serves the metrics on `http://0.0.0.0:{port}/metrics`, from a background
+    thread. Does nothing if `port` is None.
+    """
+    if port is None:
+        return
+
+    start_http_server(port)
+    logger.info(f"Serving metrics on port {port}.")
+
+
+def set_newest_event_age(store: str, newest_timestamp_ms: Optional[float]) -> None:
+    """
+    Sets the newest earthquake of `store`, if there is one. Its age is computed
+    when the metrics are scraped, so that it keeps growing until the next one.
+    """
+    if newest_timestamp_ms is not None:
+        newest_timestamp_sec = float(newest_timestamp_ms) / 1000
+        NEWEST_EVENT_AGE_SECONDS.labels(store).set_function(
+            lambda: time.time() - newest_timestamp_sec
+        )
@@ -0,0 +1,122 @@
+"""
+Reads the local Parquet offline store the seismic data sink writes to when its
+`sink_backend` is "parquet". The sink has its own copy of these functions, in
+its `src.parquet_store`, along with the writer. `tests/test_parquet_store.py`
+checks that both copies read the same rows from a store the sink wrote.
+
+The store lists the files of each `datestr` partition in `_manifest.json`, in
+the order they were written, and the last row written for a `uuid` in a
+partition wins.
+"""
+
+import json
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from typing import List, Optional
+
+from src import metrics
+
+MANIFEST = "_manifest.json"
+
+# Columns of the earthquakes, for the reads of a store with no files yet
+COLUMNS = {
+    "timestamp": "int64",
+    "datestr": "object",
+    "region": "object",
+    "magnitude": "float64",
+    "depth": "float64",
+    "latitude": "float64",
+    "longitude": "float64",
+    "uuid": "object",
+}
+
+
+def read_manifest(path: str) -> dict:
+    """
+    Returns the manifest of the store at `path`, an empty one if there is none.
+    """
+    try:
+        with open(os.path.join(path, MANIFEST)) as f:
+            return json.load(f)
+
+    except FileNotFoundError:
+        return {"version": 0, "partitions": {}, "obsolete": []}
+
+
+def read_files(path: str, files: List[str]) -> pd.DataFrame:
+    """
+    Reads `files` of the store at `path` in order, and keeps the last row of
+    each `uuid`, sorted by `timestamp`.
+    """
+    data = pd.concat(
+        [pd.read_parquet(os.path.join(path, file)) for file in files], ignore_index=True
+    )
+
+    return (
+        data.drop_duplicates(subset="uuid", keep="last")
+        .sort_values("timestamp", kind="stable")
+        .reset_index(drop=True)
+    )
+
+
+def empty_frame(path: str, manifest: dict) -> pd.DataFrame:
+    """
+    Returns an empty frame with the columns of the store at `path`, the ones of
+    its files, or the columns of the earthquakes if it has no files yet.
+    """
+    for files in manifest["partitions"].values():
+        if files:
+            schema = pq.read_schema(os.path.join(path, files[0]))
+            return schema.empty_table().to_pandas()
+
+    return pd.DataFrame(
+        {name: pd.Series(dtype=dtype) for name, dtype in COLUMNS.items()}
+    )
+
+
+def read_parquet_store(path: str, start_time: Optional[int] = None) -> pd.DataFrame:
+    """
+    Reads the rows of the store at `path`, the last written for each `uuid`,
+    as of the last commit.
+
+    Rows are only upserted within a `datestr` partition: if the timestamp of an
+    event is corrected across midnight, both versions are returned, each from
+    its own partition. The reader cannot tell which of the two was written
+    last, so they are left for the caller to deduplicate.
+
+    Args:
+        path (str): The directory of the store.
+        start_time (Optional[int]): If given, only the rows from this timestamp
+            on, in milliseconds, are read. Older partitions are skipped.
+
+    Returns:
+        pd.DataFrame: The rows, sorted by `timestamp`. An empty store still has
+            its columns.
+    """
+    with metrics.READ_SECONDS.labels("parquet").time():
+        manifest = read_manifest(path)
+        partitions = manifest["partitions"]
+
+        if start_time is not None:
+            start_date = pd.to_datetime(start_time, unit="ms").strftime("%Y-%m-%d")
+            partitions = {
+                datestr: files
+                for datestr, files in partitions.items()
+                if datestr >= start_date
+            }
+
+        if not partitions:
+            return empty_frame(path, manifest)
+
+        data = pd.concat(
+            [read_files(path, files) for _, files in sorted(partitions.items())],
+            ignore_index=True,
+        )
+
+    if start_time is not None:
+        data = data[data["timestamp"] >= start_time].reset_index(drop=True)
+
+    return data
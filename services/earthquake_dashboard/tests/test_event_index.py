@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+from src.event_index import EventIndex, haversine_km
+
+
+def earthquakes(n: int, seed: int = 0, prefix: str = "") -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+
+    return pd.DataFrame(
+        {
+            "uuid": [f"{prefix}{i}" for i in range(n)],
+            "timestamp": np.arange(n) * 1000,
+            "latitude": rng.uniform(-89, 89, n),
+            "longitude": rng.uniform(-179, 179, n),
+            "magnitude": rng.uniform(1, 7, n),
+        }
+    )
+
+
+def scan(data: pd.DataFrame, latitude, longitude, radius_km, start, end, min_mag):
+    distance = haversine_km(
+        latitude, longitude, data["latitude"].to_numpy(), data["longitude"].to_numpy()
+    )
+    mask = (
+        (distance <= radius_km)
+        & (data["timestamp"] >= start)
+        & (data["timestamp"] < end)
+        & (data["magnitude"] >= min_mag)
+    )
+    return set(data[mask]["uuid"])
+
+
+def test_query_matches_a_full_scan():
+    data = earthquakes(5000)
+    index = EventIndex(data, cell_deg=2.0)
+
+    for latitude, longitude in [(0, 0), (35, 139), (-60, -170), (88, 10), (10, 179)]:
+        result = index.query(
+            latitude=latitude,
+            longitude=longitude,
+            radius_km=1500,
+            start_time=1_000_000,
+            end_time=4_000_000,
+            min_magnitude=3,
+        )
+
+        expected = scan(data, latitude, longitude, 1500, 1_000_000, 4_000_000, 3)
+        assert set(result["uuid"]) == expected
+
+
+def test_query_without_a_point_filters_by_time_and_magnitude():
+    data = earthquakes(100)
+    index = EventIndex(data)
+
+    result = index.query(start_time=10_000, end_time=20_000, max_magnitude=4)
+
+    expected = data[
+        data["timestamp"].between(10_000, 19_999) & (data["magnitude"] <= 4)
+    ]
+    assert set(result["uuid"]) == set(expected["uuid"])
+
+
+def test_insert_replaces_events_by_uuid_before_and_after_a_merge():
+    data = earthquakes(1000)
+    index = EventIndex(data, max_pending=50)
+
+    index.insert(data.iloc[[3, 4]].assign(magnitude=9.5))
+
+    assert len(index) == 1000
+    assert sorted(index.query(min_magnitude=9)["uuid"]) == ["3", "4"]
+
+    # Enough new events to merge the pending ones into the sorted arrays
+    index.insert(earthquakes(200, seed=1, prefix="new"))
+    index.insert(data.iloc[[3]].assign(magnitude=9.9))
+
+    result = index.query()
+    assert len(index) == len(result) == 1200
+    assert not result["uuid"].duplicated().any()
+    assert index.query(min_magnitude=9).set_index("uuid")["magnitude"].to_dict() == {
+        "3": 9.9,
+        "4": 9.5,
+    }
+
+
+def test_empty_index():
+    index = EventIndex()
+
+    assert len(index) == 0
+    assert index.query().empty
+    assert index.query(latitude=0, longitude=0, radius_km=100, min_magnitude=1).empty
+
+    index.insert(earthquakes(5))
+
+    assert len(index.query()) == 5
@@ -0,0 +1,105 @@
+"""
+The dashboard's reader of the Parquet store is a copy of the one of the seismic
+data sink. These tests write a store with the sink, in a subprocess since both
+services are a `src` package, and check that both readers return the same rows.
+"""
+
+import subprocess
+import sys
+
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from src.parquet_store import read_parquet_store
+
+SINK_DIR = Path(__file__).resolve().parents[2] / "seismic_data_sink"
+
+# Writes batches to the store at argv[1] with the sink, and saves what the sink
+# reads back from it, from each `start_time` of argv[3:], to argv[2]
+WRITE_AND_READ = """
+import sys
+
+import pandas as pd
+
+from src.earthquake_batch import EarthquakeBatch
+from src.parquet_store import ParquetStore, read_parquet_store
+
+DAY_MS = 24 * 60 * 60 * 1000
+path, output, start_times = sys.argv[1], sys.argv[2], sys.argv[3:]
+
+
+def batch(rows):
+    batch = EarthquakeBatch()
+    batch.extend(
+        [
+            {
+                "timestamp": timestamp,
+                "datestr": pd.to_datetime(timestamp, unit="ms").strftime("%Y-%m-%d"),
+                "region": "SOUTHERN CALIFORNIA",
+                "magnitude": magnitude,
+                "depth": 7.9,
+                "latitude": 32.8632,
+                "longitude": -116.1513,
+                "uuid": uuid,
+            }
+            for uuid, timestamp, magnitude in rows
+        ]
+    )
+    return batch
+
+
+if start_times != ["empty"]:
+    store = ParquetStore(path, compact_every_sec=3600)
+    start = 1721088000000
+    store.push_data_to_feature_store(
+        batch([("a", start + 1000, 2.0), ("b", start + DAY_MS, 3.0)]), "offline"
+    )
+    # An upsert of a, and c on a third day
+    store.push_data_to_feature_store(
+        batch([("a", start + 1000, 2.5), ("c", start + 2 * DAY_MS, 4.0)]), "offline"
+    )
+    # b corrected into the day before, so that each partition has a version
+    store.push_data_to_feature_store(batch([("b", start + 5000, 3.1)]), "offline")
+    store.close()
+    start_times = [None if t == "none" else int(t) for t in start_times]
+else:
+    start_times = [None]
+
+pd.to_pickle([read_parquet_store(path, t) for t in start_times], output)
+"""
+
+
+def read_with_sink(tmp_path: Path, store: Path, *start_times: str) -> list:
+    output = tmp_path / "sink.pkl"
+
+    subprocess.run(
+        [sys.executable, "-c", WRITE_AND_READ, str(store), str(output), *start_times],
+        cwd=SINK_DIR,
+        check=True,
+    )
+
+    return pd.read_pickle(output)
+
+
+@pytest.mark.parametrize("start_time", [None, 1721088000000 + 24 * 60 * 60 * 1000])
+def test_reads_the_rows_the_sink_reads(tmp_path, start_time):
+    store = tmp_path / "store"
+
+    (expected,) = read_with_sink(
+        tmp_path, store, "none" if start_time is None else str(start_time)
+    )
+    data = read_parquet_store(str(store), start_time)
+
+    pd.testing.assert_frame_equal(data, expected)
+    assert len(data) > 0
+
+
+def test_empty_store_has_the_columns_of_the_sink(tmp_path):
+    store = tmp_path / "store"
+    store.mkdir()
+
+    (expected,) = read_with_sink(tmp_path, store, "empty")
+
+    pd.testing.assert_frame_equal(read_parquet_store(str(store)), expected)
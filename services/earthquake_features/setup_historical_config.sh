@@ -0,0 +1,8 @@
+export KAFKA_INPUT_TOPIC=earthquakes_historical
+export KAFKA_OUTPUT_TOPIC=earthquakes_historical_aggregated
+export KAFKA_CONSUMER_GROUP=earthquakes_historical_features_1d_consumer_group
+
+# one day windows, starting every hour
+export WINDOW_SEC=86400
+export WINDOW_STEP_SEC=3600
+export LIVE_OR_HISTORICAL=historical
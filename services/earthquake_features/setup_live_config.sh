@@ -0,0 +1,8 @@
+export KAFKA_INPUT_TOPIC=earthquakes
+export KAFKA_OUTPUT_TOPIC=earthquakes_aggregated
+export KAFKA_CONSUMER_GROUP=earthquakes_features_1h_consumer_group
+
+# one hour tumbling windows. Run another instance with a different
+# WINDOW_SEC and KAFKA_CONSUMER_GROUP for each horizon.
+export WINDOW_SEC=3600
+export LIVE_OR_HISTORICAL=live
@@ -0,0 +1,36 @@
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash(latitude: float, longitude: float, precision: int) -> str:
+    """
+    Returns the geohash of a point, with `precision` characters.
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+
+    chars = []
+    bits = 0
+    n_bits = 0
+    even = True
+
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude, starting with longitude
+        value, value_range = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (value_range[0] + value_range[1]) / 2
+
+        if value >= middle:
+            bits = (bits << 1) | 1
+            value_range[0] = middle
+        else:
+            bits = bits << 1
+            value_range[1] = middle
+
+        even = not even
+        n_bits += 1
+
+        if n_bits == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits = 0
+            n_bits = 0
+
+    return "".join(chars)
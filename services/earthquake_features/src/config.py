@@ -0,0 +1,47 @@
+from pydantic_settings import BaseSettings
+from pydantic import field_validator
+from typing import Optional
+
+
+class Config(BaseSettings):
+    kafka_broker_address: Optional[str] = None
+    kafka_input_topic: str
+    kafka_output_topic: str
+    kafka_consumer_group: str
+
+    live_or_historical: Optional[str] = "live"
+
+    # length of the windows, and how often a window starts. Windows are
+    # tumbling when both are equal, and hopping otherwise. Run one instance
+    # of the service per horizon, each with its own consumer group.
+    window_sec: int = 60 * 60
+    window_step_sec: Optional[int] = None
+
+    # how long to wait for late earthquakes before closing a window
+    window_grace_sec: int = 60
+
+    # spatial cells the features are computed for: geohash cells with this
+    # number of characters, e.g. 3 for cells of about 156 x 156 km
+    cell_geohash_precision: int = 3
+
+    # Gutenberg-Richter b-value: magnitude above which the catalog is
+    # complete, width of the magnitude bins, and the number of earthquakes
+    # above it we need for an estimate
+    completeness_magnitude: float = 2.0
+    magnitude_bin: float = 0.1
+    min_events_b_value: int = 10
+
+    # port of the Prometheus metrics endpoint, off if not set
+    metrics_port: Optional[int] = None
+
+    @field_validator("live_or_historical")
+    @classmethod
+    def validate_live_or_historical(cls, value):
+        assert value in {
+            "live",
+            "historical",
+        }, f"Invalid value for live_or_historical: {value}"
+        return value
+
+
+config = Config()
@@ -0,0 +1,161 @@
+import hashlib
+import math
+
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+
+class SeismicAggregator:
+    """
+    The window aggregation of the seismic features of a spatial cell.
+
+    The aggregate only holds counts, sums, a maximum and the first and last
+    timestamps, so that adding an earthquake to a window is O(1) whatever its
+    length, and the state stays small. The features are computed from it when
+    the window closes:
+
+    - the number of earthquakes, and their maximum and mean magnitude
+    - the Gutenberg-Richter b-value, with Aki's maximum likelihood estimate
+      over the earthquakes above the completeness magnitude
+    - the energy released, from log10(E) = 1.5 M + 4.8, in joules
+    - the mean time between earthquakes
+    """
+
+    def __init__(
+        self,
+        window_sec: int,
+        completeness_magnitude: float = 2.0,
+        magnitude_bin: float = 0.1,
+        min_events_b_value: int = 10,
+    ):
+        self.window_sec = window_sec
+        self.completeness_magnitude = completeness_magnitude
+        self.magnitude_bin = magnitude_bin
+        self.min_events_b_value = min_events_b_value
+
+    def initializer(self, earthquake: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Returns the aggregate of a window with its first earthquake.
+        """
+        aggregate = {
+            "count": 0,
+            "magnitude_sum": 0.0,
+            "magnitude_max": earthquake["magnitude"],
+            "depth_sum": 0.0,
+            "latitude_sum": 0.0,
+            "longitude_sum": 0.0,
+            "count_above_mc": 0,
+            "magnitude_sum_above_mc": 0.0,
+            "energy_joules": 0.0,
+            "first_timestamp": earthquake["timestamp"],
+            "last_timestamp": earthquake["timestamp"],
+        }
+
+        return self.reducer(aggregate, earthquake)
+
+    def reducer(
+        self, aggregate: Dict[str, Any], earthquake: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        Adds an earthquake to the aggregate of a window.
+        """
+        magnitude = earthquake["magnitude"]
+
+        aggregate["count"] += 1
+        aggregate["magnitude_sum"] += magnitude
+        aggregate["magnitude_max"] = max(aggregate["magnitude_max"], magnitude)
+        aggregate["depth_sum"] += earthquake["depth"]
+        aggregate["latitude_sum"] += earthquake["latitude"]
+        aggregate["longitude_sum"] += earthquake["longitude"]
+        aggregate["energy_joules"] += 10 ** (1.5 * magnitude + 4.8)
+
+        if magnitude >= self.completeness_magnitude:
+            aggregate["count_above_mc"] += 1
+            aggregate["magnitude_sum_above_mc"] += magnitude
+
+        # Earthquakes may arrive out of order within the window
+        aggregate["first_timestamp"] = min(
+            aggregate["first_timestamp"], earthquake["timestamp"]
+        )
+        aggregate["last_timestamp"] = max(
+            aggregate["last_timestamp"], earthquake["timestamp"]
+        )
+
+        return aggregate
+
+    def to_features(self, window: Dict[str, Any], cell: str) -> Dict[str, Any]:
+        """
+        Returns the features of a closed window of a cell.
+
+        Args:
+            window (Dict[str, Any]): The window, with its `start` and `end` in
+                milliseconds and its aggregate in `value`.
+            cell (str): The geohash of the cell.
+
+        Returns:
+            Dict[str, Any]: The features, with a `uuid` unique to the cell,
+                window length and window start, and the `timestamp` of the end
+                of the window.
+        """
+        aggregate = window["value"]
+        count = aggregate["count"]
+
+        mean_inter_event_sec = (
+            (aggregate["last_timestamp"] - aggregate["first_timestamp"])
+            / (count - 1)
+            / 1000
+            if count > 1
+            else None
+        )
+
+        return {
+            "timestamp": window["end"],
+            "datestr": datetime.fromtimestamp(
+                window["end"] / 1000, timezone.utc
+            ).strftime("%Y-%m-%d"),
+            "uuid": self._window_uuid(cell, window["start"]),
+            "cell": cell,
+            "window_sec": self.window_sec,
+            "window_start": window["start"],
+            "count": count,
+            "max_magnitude": aggregate["magnitude_max"],
+            "mean_magnitude": aggregate["magnitude_sum"] / count,
+            "mean_depth": aggregate["depth_sum"] / count,
+            "latitude": aggregate["latitude_sum"] / count,
+            "longitude": aggregate["longitude_sum"] / count,
+            "b_value": self._b_value(aggregate),
+            "energy_joules": aggregate["energy_joules"],
+            "mean_inter_event_sec": mean_inter_event_sec,
+        }
+
+    def _b_value(self, aggregate: Dict[str, Any]) -> Optional[float]:
+        """
+        Aki's maximum likelihood b-value, log10(e) / (mean(M) - (Mc - dM / 2)),
+        or None if there are too few earthquakes above the completeness magnitude.
+        """
+        count = aggregate["count_above_mc"]
+
+        if count < self.min_events_b_value:
+            return None
+
+        mean_magnitude = aggregate["magnitude_sum_above_mc"] / count
+        denominator = mean_magnitude - (
+            self.completeness_magnitude - self.magnitude_bin / 2
+        )
+
+        if denominator <= 0:
+            return None
+
+        return math.log10(math.e) / denominator
+
+    def _window_uuid(self, cell: str, window_start: int) -> str:
+        """
+        A deterministic UUID for the features of a window, so that writing them
+        again, e.g. after a restart, overwrites them.
+        """
+        digest = hashlib.md5(
+            f"{cell}-{self.window_sec}-{window_start}".encode("utf-8")
+        ).digest()
+
+        return str(UUID(bytes=digest))
@@ -0,0 +1,169 @@
+from loguru import logger
+from quixstreams import Application
+from typing import Any, Dict, List, Optional, Tuple
+
+from src import metrics
+from src.cells import geohash
+from src.features import SeismicAggregator
+from src.wire_format import EarthquakeDeserializer
+
+
+def custom_ts_extractor(
+    value: Any,
+    headers: Optional[List[Tuple[str, bytes]]],
+    timestamp: float,
+    timestamp_type,  #: TimestampType,
+) -> int:
+    """
+    Uses the `timestamp` field of the earthquake, when it happened, as the time
+    of the message, so that windows are in event time.
+    """
+    return value["timestamp"]
+
+
+def record_window(features: Dict[str, Any]) -> None:
+    """
+    Records the features of a closed window in the metrics, with the time since
+    the end of the window.
+    """
+    window_sec = str(features["window_sec"])
+
+    metrics.WINDOWS.labels(window_sec).inc()
+    metrics.observe_event_lag(
+        metrics.EMIT_LAG_SECONDS.labels(window_sec), [features["timestamp"]]
+    )
+
+
+def compute_features(
+    kafka_broker_address: str,
+    kafka_input_topic: str,
+    kafka_output_topic: str,
+    kafka_consumer_group: str,
+    live_or_historical: Optional[str] = "live",
+    window_sec: Optional[int] = 60 * 60,
+    window_step_sec: Optional[int] = None,
+    window_grace_sec: Optional[int] = 60,
+    cell_geohash_precision: Optional[int] = 3,
+    completeness_magnitude: Optional[float] = 2.0,
+    magnitude_bin: Optional[float] = 0.1,
+    min_events_b_value: Optional[int] = 10,
+    metrics_port: Optional[int] = None,
+) -> None:
+    """
+    Computes rolling seismic features per spatial cell from the earthquakes of
+    `kafka_input_topic`, and writes them to `kafka_output_topic`.
+
+    Earthquakes are regrouped by the geohash cell of their epicenter, and
+    aggregated in event-time windows of `window_sec`, with a new window every
+    `window_step_sec`. When a window closes, the features of its cell are
+    written, see `SeismicAggregator`.
+
+    Args:
+        kafka_broker_address: The address of the Kafka broker.
+        kafka_input_topic: The topic of the earthquakes.
+        kafka_output_topic: The topic to write the features to.
+        kafka_consumer_group: The consumer group, one per window length.
+        live_or_historical: Whether we read the live or historical earthquakes.
+        window_sec: The length of the windows.
+        window_step_sec: How often a window starts. Windows are tumbling if it is
+            None or `window_sec`, and hopping otherwise.
+        window_grace_sec: How long to wait for late earthquakes.
+        cell_geohash_precision: The number of characters of the geohash cells.
+        completeness_magnitude: The magnitude above which the catalog is complete.
+        magnitude_bin: The width of the magnitude bins of the catalog.
+        min_events_b_value: The number of earthquakes above the completeness
+            magnitude needed to estimate the b-value.
+        metrics_port: The port to serve the metrics of `src.metrics` on, if any.
+
+    Returns:
+        None
+    """
+    metrics.start_metrics_server(metrics_port)
+
+    app = Application(
+        broker_address=kafka_broker_address,
+        consumer_group=kafka_consumer_group,
+        auto_offset_reset="earliest"
+        if live_or_historical == "historical"
+        else "latest",
+        # Each window is written once, even if we restart
+        processing_guarantee="exactly-once",
+    )
+
+    input_topic = app.topic(
+        kafka_input_topic,
+        value_deserializer=EarthquakeDeserializer(),
+        timestamp_extractor=custom_ts_extractor,
+    )
+    output_topic = app.topic(kafka_output_topic, value_serializer="json")
+
+    aggregator = SeismicAggregator(
+        window_sec=window_sec,
+        completeness_magnitude=completeness_magnitude,
+        magnitude_bin=magnitude_bin,
+        min_events_b_value=min_events_b_value,
+    )
+
+    sdf = app.dataframe(input_topic)
+    sdf = sdf.update(lambda earthquake: metrics.EVENTS.inc())
+
+    # Key the earthquakes by their cell, so that windows are per cell
+    sdf = sdf.group_by(
+        lambda earthquake: geohash(
+            earthquake["latitude"], earthquake["longitude"], cell_geohash_precision
+        ),
+        name=f"geohash_{cell_geohash_precision}",
+    )
+
+    if window_step_sec is None or window_step_sec == window_sec:
+        window = sdf.tumbling_window(
+            duration_ms=window_sec * 1000, grace_ms=window_grace_sec * 1000
+        )
+    else:
+        window = sdf.hopping_window(
+            duration_ms=window_sec * 1000,
+            step_ms=window_step_sec * 1000,
+            grace_ms=window_grace_sec * 1000,
+        )
+
+    # Emit each window once, when it closes
+    sdf = window.reduce(aggregator.reducer, aggregator.initializer).final()
+
+    sdf = sdf.apply(
+        lambda window, cell, timestamp, headers: aggregator.to_features(window, cell),
+        metadata=True,
+    )
+    sdf = sdf.update(lambda features: logger.debug(f"Features: {features}"))
+    sdf = sdf.update(record_window)
+
+    sdf = sdf.to_topic(output_topic)
+
+    app.run(sdf)
+
+
+if __name__ == "__main__":
+    from src.config import config
+
+    logger.info(
+        f"Computing features over {config.window_sec}s windows "
+        f"from {config.kafka_input_topic} to {config.kafka_output_topic}."
+    )
+
+    try:
+        compute_features(
+            kafka_broker_address=config.kafka_broker_address,
+            kafka_input_topic=config.kafka_input_topic,
+            kafka_output_topic=config.kafka_output_topic,
+            kafka_consumer_group=config.kafka_consumer_group,
+            live_or_historical=config.live_or_historical,
+            window_sec=config.window_sec,
+            window_step_sec=config.window_step_sec,
+            window_grace_sec=config.window_grace_sec,
+            cell_geohash_precision=config.cell_geohash_precision,
+            completeness_magnitude=config.completeness_magnitude,
+            magnitude_bin=config.magnitude_bin,
+            min_events_b_value=config.min_events_b_value,
+            metrics_port=config.metrics_port,
+        )
+    except KeyboardInterrupt:
+        logger.info("Exiting...")
@@ -0,0 +1,58 @@
+"""
+Prometheus metrics of the earthquake features service, served over HTTP by
+`start_metrics_server` for Prometheus to scrape.
+
+Every service has its own copy of `start_metrics_server` and `observe_event_lag`,
+with the metrics of that service. Latencies are in seconds, and the emit lag
+is the time since the end of a window, i.e. how late its features are written.
+"""
+
+import time
+
+from loguru import logger
+from prometheus_client import Counter, Histogram, start_http_server
+from typing import Iterable, Optional
+
+# From a second to a day, since a window is written after its grace period,
+# and historical windows long after they ended
+EMIT_LAG_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 6 * 3600, 86400)
+
+EVENTS = Counter(
+    "earthquake_features_events_total",
+    "Earthquakes read from Kafka.",
+)
+WINDOWS = Counter(
+    "earthquake_features_windows_total",
+    "Windows of a cell that closed and whose features were written.",
+    ["window_sec"],
+)
+EMIT_LAG_SECONDS = Histogram(
+    "earthquake_features_emit_lag_seconds",
+    "Time from the end of a window to its features being written.",
+    ["window_sec"],
+    buckets=EMIT_LAG_BUCKETS,
+)
+
+
+def start_metrics_server(port: Optional[int]) -> None:
+    """
+    Serves the metrics on `http://0.0.0.0:{port}/metrics`, from a background
+    thread. Does nothing if `port` is None.
+    """
+    if port is None:
+        return
+
+    start_http_server(port)
+    logger.info(f"Serving metrics on port {port}.")
+
+
+def observe_event_lag(histogram: Histogram, timestamps_ms: Iterable[int]) -> None:
+    """
+    Records in `histogram` the time since each of the event `timestamps_ms`,
+    skipping the missing ones.
+    """
+    now_ms = time.time() * 1000
+
+    for timestamp_ms in timestamps_ms:
+        if timestamp_ms is not None:
+            histogram.observe((now_ms - timestamp_ms) / 1000)
@@ -0,0 +1,74 @@
+"""
+Deserializer of the messages of the earthquake topic, which are JSON or in the
+binary wire format described in `src/wire_format.py` of the earthquake
+producer, depending on their `content-type` header. Keep it in sync with the
+producer's encoder. `make bench` checks that they agree, and that `src.cells`
+computes the producer's geohashes, see `benchmarks/wire_check.py`.
+`tests/test_wire_format.py` checks both against fixed messages and geohashes
+of the producer.
+"""
+
+import json
+import struct
+
+from datetime import date, timedelta
+from quixstreams.models.serializers import (
+    Deserializer,
+    SerializationContext,
+    SerializationError,
+)
+from typing import Any, Dict
+
+CONTENT_TYPE_HEADER = "content-type"
+CONTENT_TYPE_BINARY = b"application/x-earthquake"
+
+VERSION = 1
+
+_HEADER = struct.Struct("<Bqdddd16siH")
+_EPOCH = date(1970, 1, 1)
+
+
+class EarthquakeDeserializer(Deserializer):
+    """
+    Deserializes JSON and binary earthquake messages to the same dicts.
+    """
+
+    def __call__(self, value: bytes, ctx: SerializationContext) -> Dict[str, Any]:
+        for name, header in ctx.headers or ():
+            if name == CONTENT_TYPE_HEADER and header == CONTENT_TYPE_BINARY:
+                return _decode_binary(value)
+
+        try:
+            return json.loads(value)
+        except ValueError as e:
+            raise SerializationError(str(e)) from e
+
+
+def _decode_binary(value: bytes) -> Dict[str, Any]:
+    try:
+        fields = _HEADER.unpack_from(value)
+
+        if fields[0] != VERSION:
+            raise ValueError(f"unsupported version {fields[0]}")
+
+        if len(value) != _HEADER.size + fields[-1]:
+            raise ValueError(f"expected {_HEADER.size + fields[-1]} bytes")
+
+        region = value[_HEADER.size :].decode("utf-8")
+
+    except (struct.error, UnicodeDecodeError, ValueError) as e:
+        raise SerializationError(str(e)) from e
+
+    _, timestamp, magnitude, depth, latitude, longitude, uuid, days, _ = fields
+    h = uuid.hex()
+
+    return {
+        "timestamp": timestamp,
+        "datestr": (_EPOCH + timedelta(days=days)).isoformat(),
+        "region": region,
+        "magnitude": magnitude,
+        "depth": depth,
+        "latitude": latitude,
+        "longitude": longitude,
+        "uuid": f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}",
+    }
@@ -0,0 +1,108 @@
+import math
+
+import pytest
+
+from src.features import SeismicAggregator
+
+START = 1721167200000
+HOUR_MS = 60 * 60 * 1000
+
+
+def earthquake(magnitude: float, timestamp: int = START, **fields) -> dict:
+    return {
+        "timestamp": timestamp,
+        "magnitude": magnitude,
+        "depth": 10.0,
+        "latitude": 32.0,
+        "longitude": -116.0,
+        **fields,
+    }
+
+
+def aggregate(aggregator: SeismicAggregator, earthquakes) -> dict:
+    value = aggregator.initializer(earthquakes[0])
+
+    for quake in earthquakes[1:]:
+        value = aggregator.reducer(value, quake)
+
+    return {"start": START, "end": START + HOUR_MS, "value": value}
+
+
+def test_features_of_a_window():
+    aggregator = SeismicAggregator(window_sec=3600, min_events_b_value=2)
+    earthquakes = [
+        earthquake(2.0, START + 60_000, depth=5.0, latitude=31.0),
+        earthquake(4.0, START, depth=15.0, latitude=33.0),
+        earthquake(1.0, START + 180_000),
+    ]
+
+    features = aggregator.to_features(aggregate(aggregator, earthquakes), "9mv")
+
+    assert features["count"] == 3
+    assert features["max_magnitude"] == 4.0
+    assert features["mean_magnitude"] == pytest.approx(7 / 3)
+    assert features["mean_depth"] == pytest.approx(10.0)
+    assert features["latitude"] == pytest.approx(32.0)
+    assert features["mean_inter_event_sec"] == pytest.approx(90.0)
+    assert features["timestamp"] == START + HOUR_MS
+    assert features["datestr"] == "2024-07-16"
+    assert features["cell"] == "9mv"
+    assert features["window_sec"] == 3600
+
+
+def test_b_value_is_aki_estimate_above_the_completeness_magnitude():
+    aggregator = SeismicAggregator(
+        window_sec=3600,
+        completeness_magnitude=2.0,
+        magnitude_bin=0.1,
+        min_events_b_value=4,
+    )
+    # The earthquake below the completeness magnitude is left out
+    magnitudes = [2.0, 2.2, 2.5, 3.3, 1.0]
+
+    features = aggregator.to_features(
+        aggregate(aggregator, [earthquake(m) for m in magnitudes]), "9mv"
+    )
+
+    expected = math.log10(math.e) / (2.5 - (2.0 - 0.05))
+    assert features["b_value"] == pytest.approx(expected)
+
+
+def test_no_b_value_below_the_minimum_number_of_earthquakes():
+    aggregator = SeismicAggregator(window_sec=3600, min_events_b_value=10)
+    window = aggregate(aggregator, [earthquake(3.0) for _ in range(9)])
+
+    assert aggregator.to_features(window, "9mv")["b_value"] is None
+
+
+def test_window_of_a_single_earthquake():
+    aggregator = SeismicAggregator(window_sec=3600)
+
+    features = aggregator.to_features(aggregate(aggregator, [earthquake(0.5)]), "9mv")
+
+    assert features["count"] == 1
+    assert features["b_value"] is None
+    assert features["mean_inter_event_sec"] is None
+
+
+def test_energy_released():
+    aggregator = SeismicAggregator(window_sec=3600)
+    window = aggregate(aggregator, [earthquake(2.0), earthquake(4.0)])
+
+    features = aggregator.to_features(window, "9mv")
+
+    assert features["energy_joules"] == pytest.approx(10**7.8 + 10**10.8)
+
+
+def test_uuid_is_deterministic_per_cell_horizon_and_window():
+    hourly = SeismicAggregator(window_sec=3600)
+    window = aggregate(hourly, [earthquake(2.0)])
+
+    uuid = hourly.to_features(window, "9mv")["uuid"]
+
+    daily = SeismicAggregator(window_sec=86400)
+
+    assert SeismicAggregator(window_sec=3600).to_features(window, "9mv")["uuid"] == uuid
+    assert hourly.to_features(window, "9mw")["uuid"] != uuid
+    assert hourly.to_features(dict(window, start=START + 1), "9mv")["uuid"] != uuid
+    assert daily.to_features(window, "9mv")["uuid"] != uuid
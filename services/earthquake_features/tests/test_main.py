@@ -0,0 +1,21 @@
+import time
+
+from prometheus_client import REGISTRY
+
+from src.main import record_window
+
+
+def sample(name: str, window_sec: str) -> float:
+    return REGISTRY.get_sample_value(name, {"window_sec": window_sec}) or 0.0
+
+
+def test_record_window_counts_windows_and_their_emit_lag():
+    windows = sample("earthquake_features_windows_total", "60")
+    lag_sum = sample("earthquake_features_emit_lag_seconds_sum", "60")
+
+    end_ms = int(time.time() * 1000) - 30_000
+    record_window({"window_sec": 60, "timestamp": end_ms})
+
+    assert sample("earthquake_features_windows_total", "60") == windows + 1
+    assert sample("earthquake_features_emit_lag_seconds_count", "60") >= 1
+    assert 30 <= sample("earthquake_features_emit_lag_seconds_sum", "60") - lag_sum < 60
@@ -0,0 +1,65 @@
+import pytest
+
+from quixstreams.models.serializers import SerializationContext, SerializationError
+
+from src.cells import geohash
+from src.wire_format import CONTENT_TYPE_BINARY, EarthquakeDeserializer
+
+# Messages the earthquake producer encodes for one earthquake, and the geohashes
+# it computes, copied from its `tests/test_wire_format.py`, keep the copies equal
+BINARY = bytes.fromhex(
+    "0150729dbd9001000066666666666602409a99999999991f401ff46c567d6e4040a1f831e6ae"
+    "095dc016601f822b8de4b5a1044caa6256c027d04d00001300534f55544845524e2043414c49"
+    "464f524e4941"
+)
+
+JSON = (
+    b'{"timestamp":1721168130640,"datestr":"2024-07-16","region":"SOUTHERN '
+    b'CALIFORNIA","magnitude":2.3,"depth":7.9,"latitude":32.8632,"longitude":'
+    b'-116.1513,"uuid":"16601f82-2b8d-e4b5-a104-4caa6256c027"}'
+)
+
+GEOHASHES = [
+    (32.8632, -116.1513, 1, "9"),
+    (32.8632, -116.1513, 2, "9m"),
+    (32.8632, -116.1513, 3, "9mv"),
+    (32.8632, -116.1513, 5, "9mv6u"),
+    (-33.8688, 151.2093, 5, "r3gx2"),
+    (0.0, 0.0, 3, "s00"),
+    (90.0, 180.0, 3, "zzz"),
+]
+
+EARTHQUAKE = {
+    "timestamp": 1721168130640,
+    "datestr": "2024-07-16",
+    "region": "SOUTHERN CALIFORNIA",
+    "magnitude": 2.3,
+    "depth": 7.9,
+    "latitude": 32.8632,
+    "longitude": -116.1513,
+    "uuid": "16601f82-2b8d-e4b5-a104-4caa6256c027",
+}
+
+
+def context(headers=None) -> SerializationContext:
+    return SerializationContext("earthquakes", "value", headers=headers)
+
+
+def test_decodes_the_producer_messages_to_the_same_dict():
+    deserialize = EarthquakeDeserializer()
+    binary_headers = [("content-type", CONTENT_TYPE_BINARY)]
+
+    assert deserialize(BINARY, context(binary_headers)) == EARTHQUAKE
+    assert deserialize(JSON, context()) == EARTHQUAKE
+
+
+def test_rejects_a_truncated_binary_message():
+    with pytest.raises(SerializationError):
+        EarthquakeDeserializer()(
+            BINARY[:-1], context([("content-type", CONTENT_TYPE_BINARY)])
+        )
+
+
+def test_geohash_matches_the_producer():
+    for latitude, longitude, precision, expected in GEOHASHES:
+        assert geohash(latitude, longitude, precision) == expected
@@ -2,3 +2,8 @@ export KAFKA_TOPIC=earthquakes_historical
 export LIVE_OR_HISTORICAL=historical
 export LAST_N_DAYS=365
 export LIMIT=20000
+export WINDOW_DAYS=90
+export MAX_WORKERS=4
+export WINDOW_RETRIES=3
+export CHECKPOINT_PATH=historical_checkpoint.json
+export FDSN_CACHE_DIR=fdsn_cache
@@ -0,0 +1,4 @@
+export KAFKA_TOPIC=earthquakes_replay
+export LIVE_OR_HISTORICAL=replay
+export REPLAY_PATH=archive
+export REPLAY_SPEEDUP=100
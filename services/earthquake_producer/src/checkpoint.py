@@ -0,0 +1,47 @@
+import json
+import os
+
+from datetime import datetime
+from loguru import logger
+from typing import Optional
+
+
+class Checkpoint:
+    """
+    The progress of a historical backfill, saved in a local file so that a
+    restarted backfill resumes where the last one stopped instead of from
+    `last_n_days` ago.
+
+    It records the end of the range of windows that have all been produced, so
+    only save it once the producer has been flushed. Delete the file to run the
+    whole backfill again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Optional[datetime]:
+        """
+        Returns the date up to which every earthquake was produced, or None if
+        there is no checkpoint yet.
+        """
+        if not os.path.exists(self.path):
+            return None
+
+        with open(self.path) as f:
+            completed_until = datetime.fromisoformat(json.load(f)["completed_until"])
+
+        logger.info(f"Loaded checkpoint from {self.path}: completed until {completed_until}.")
+
+        return completed_until
+
+    def save(self, completed_until: datetime) -> None:
+        """
+        Atomically saves the date up to which every earthquake was produced.
+        """
+        tmp_path = f"{self.path}.tmp"
+
+        with open(tmp_path, "w") as f:
+            json.dump({"completed_until": completed_until.isoformat()}, f)
+
+        os.replace(tmp_path, self.path)
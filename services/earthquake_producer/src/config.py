@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
 from pydantic import field_validator
-from typing import Optional
+from typing import List, Optional
 
 
 class Config(BaseSettings):
@@ -13,14 +13,139 @@ class Config(BaseSettings):
     limit: int = 20000
     time_interval: int = 60 * 5
 
+    # historical backfill: size of the query windows and number of windows
+    # downloaded concurrently
+    window_days: int = 90
+    max_workers: int = 4
+
+    # historical backfill: how many times a window that failed is downloaded
+    # again before the backfill gives up on it and exits with an error
+    window_retries: int = 3
+
+    # historical backfill: set `checkpoint_path` to save the windows already
+    # produced, so that a restarted backfill resumes after them. With
+    # `catch_up`, it only fetches the earthquakes newer than the newest one
+    # already in the topic.
+    checkpoint_path: Optional[str] = None
+    catch_up: bool = False
+
+    # historical backfill: set `fdsn_cache_dir` to keep the responses of the
+    # windows that ended before today on disk, up to `fdsn_cache_max_bytes`,
+    # so that repeated backfills read them from there instead of the network
+    fdsn_cache_dir: Optional[str] = None
+    fdsn_cache_max_bytes: int = 1024 * 1024 * 1024
+
+    # replay: the archive to replay, a file or a directory of JSONL, Parquet or
+    # saved FDSN windows, the speed-up over the pace at which the earthquakes
+    # happened (0 for as fast as possible), and the most earthquakes per batch
+    replay_path: Optional[str] = None
+    replay_speedup: float = 1.0
+    replay_batch_size: int = 1000
+
+    # FDSN response formats in order of preference. The first one the API
+    # serves is used.
+    fdsn_formats: List[str] = ["text", "json", "xml"]
+
+    # live websocket client: size of the queue between the client and the
+    # producer, keepalive ping interval and maximum delay between reconnects
+    websocket_queue_size: int = 1000
+    websocket_ping_interval_sec: int = 30
+    websocket_max_backoff_sec: int = 60
+    # live websocket client: how far before the latest earthquake received the
+    # backfill after a reconnect starts, to recover the earthquakes published
+    # late, with an earlier origin time. The ones we had are dropped as duplicates.
+    websocket_backfill_margin_sec: int = 60 * 60
+
+    # cache of the earthquake UUIDs already produced, used to drop duplicates.
+    # Set `dedup_cache_path` to keep the cache across restarts.
+    dedup_max_size: int = 100_000
+    dedup_ttl_sec: int = 7 * 24 * 60 * 60
+    dedup_cache_path: Optional[str] = None
+
+    # kafka producer batching: how long to wait for more messages before sending
+    # a batch, the maximum batch size in bytes, and the batch compression codec
+    producer_linger_ms: int = 100
+    producer_batch_size: int = 1024 * 1024
+    producer_compression: str = "lz4"
+
+    # how often to log the producer throughput
+    log_throughput_every_sec: int = 10
+
+    # port of the Prometheus metrics endpoint, off if not set
+    metrics_port: Optional[int] = None
+
+    # set to write each batch of earthquakes in a Kafka transaction. Must be
+    # unique per producer instance, and stable across its restarts.
+    producer_transactional_id: Optional[str] = None
+
+    # key of the messages, which decides their partition: "region", "uuid" for
+    # an even spread, or "geohash" for the cell of the epicenter, with
+    # `geohash_precision` characters
+    partition_strategy: str = "region"
+    geohash_precision: int = 2
+
+    # format of the messages: "json", or "binary" for the compact format of
+    # `src.wire_format`, which the sink can read alongside JSON
+    wire_format: str = "json"
+
     @field_validator("live_or_historical")
     @classmethod
     def validate_live_or_historical(cls, value):
         assert value in {
             "live",
             "historical",
+            "replay",
         }, f"Invalid value for live_or_historical: {value}"
         return value
 
+    @field_validator("replay_speedup")
+    @classmethod
+    def validate_replay_speedup(cls, value):
+        assert value >= 0, f"Invalid value for replay_speedup: {value}"
+        return value
+
+    @field_validator("producer_compression")
+    @classmethod
+    def validate_producer_compression(cls, value):
+        assert value in {
+            "none",
+            "gzip",
+            "snappy",
+            "lz4",
+            "zstd",
+        }, f"Invalid value for producer_compression: {value}"
+        return value
+
+    @field_validator("wire_format")
+    @classmethod
+    def validate_wire_format(cls, value):
+        assert value in {
+            "json",
+            "binary",
+        }, f"Invalid value for wire_format: {value}"
+        return value
+
+    @field_validator("partition_strategy")
+    @classmethod
+    def validate_partition_strategy(cls, value):
+        assert value in {
+            "region",
+            "uuid",
+            "geohash",
+        }, f"Invalid value for partition_strategy: {value}"
+        return value
+
+    @field_validator("fdsn_formats")
+    @classmethod
+    def validate_fdsn_formats(cls, value):
+        assert value, "fdsn_formats must not be empty"
+        for format in value:
+            assert format in {
+                "text",
+                "json",
+                "xml",
+            }, f"Invalid value for fdsn_formats: {format}"
+        return value
+
 
 config = Config()
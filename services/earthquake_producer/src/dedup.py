@@ -0,0 +1,169 @@
+import json
+import os
+import time
+
+from loguru import logger
+from uuid import UUID
+
+from collections import OrderedDict
+from typing import Optional
+from src import metrics
+from src.seismic_portal_api.earthquake import EarthquakeBatch
+
+
+class DedupCache:
+    """
+    A bounded, time-windowed cache of the earthquake UUIDs we have already
+    produced, used to drop the copies of an earthquake that the live feed,
+    overlapping backfills and reconnects send more than once.
+
+    UUIDs are evicted once `max_size` is reached, least recently seen first,
+    and once they have not been seen for `ttl_sec`. If `path` is given, the
+    cache is loaded from that file and can be saved to it, so that it survives
+    restarts. Only save it once the earthquakes it holds have been delivered,
+    otherwise a crash would make us skip them after the restart, and `forget`
+    the ones the broker rejected.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 100_000,
+        ttl_sec: float = 7 * 24 * 60 * 60,
+        path: Optional[str] = None,
+        save_every_sec: float = 60,
+    ):
+        self.max_size = max_size
+        self.ttl_sec = ttl_sec
+        self.path = path
+        self.save_every_sec = save_every_sec
+
+        self.hits = 0
+        self.misses = 0
+
+        # Timestamp of the oldest earthquake forgotten since the start, if any
+        self.oldest_forgotten: Optional[int] = None
+
+        # UUID -> wall-clock time it was last seen, least recently seen first
+        self._entries: OrderedDict[UUID, float] = OrderedDict()
+        self._last_save_time = time.monotonic()
+
+        if path is not None:
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def filter(self, earthquakes: EarthquakeBatch) -> EarthquakeBatch:
+        """
+        Returns the earthquakes of the batch whose UUID is not in the cache, and
+        adds them to it.
+
+        Args:
+            earthquakes (EarthquakeBatch): A batch of earthquakes.
+
+        Returns:
+            EarthquakeBatch: The earthquakes we have not produced yet.
+        """
+        now = time.time()
+        self._expire(now)
+
+        keep = []
+
+        for index, uuid in enumerate(earthquakes.uuid):
+            if uuid in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(uuid)
+            else:
+                self.misses += 1
+                keep.append(index)
+
+            self._entries[uuid] = now
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+        metrics.DUPLICATES.inc(len(earthquakes) - len(keep))
+
+        if len(keep) == len(earthquakes):
+            return earthquakes
+
+        return earthquakes.take(keep)
+
+    def forget(self, uuid: UUID, timestamp: int) -> None:
+        """
+        Removes an earthquake that was not delivered, so that it is produced
+        again the next time it is fetched.
+
+        Args:
+            uuid (UUID): The UUID of the earthquake.
+            timestamp (int): The time of the earthquake, in milliseconds.
+        """
+        self._entries.pop(uuid, None)
+
+        if self.oldest_forgotten is None or timestamp < self.oldest_forgotten:
+            self.oldest_forgotten = timestamp
+
+    def log(self) -> None:
+        """
+        Logs the hit and miss counts and the size of the cache.
+        """
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+
+        logger.info(
+            f"Dedup cache: {self.hits} hits, {self.misses} misses "
+            f"({hit_rate:.1%} hit rate), {len(self)} entries."
+        )
+
+    def should_save(self) -> bool:
+        """
+        Whether `save_every_sec` have passed since the cache was last saved.
+        """
+        return time.monotonic() - self._last_save_time >= self.save_every_sec
+
+    def load(self) -> None:
+        """
+        Loads the entries saved in `path`, if the file exists.
+        """
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path) as f:
+            entries = json.load(f)
+
+        self._entries = OrderedDict(
+            (UUID(uuid), seen_at) for uuid, seen_at in entries
+        )
+        self._expire(time.time())
+
+        logger.info(f"Loaded {len(self)} entries into the dedup cache from {self.path}.")
+
+    def save(self) -> None:
+        """
+        Atomically saves the entries to `path`, if one was given, and logs the
+        cache metrics.
+        """
+        self._last_save_time = time.monotonic()
+        self.log()
+
+        if self.path is None:
+            return
+
+        tmp_path = f"{self.path}.tmp"
+
+        with open(tmp_path, "w") as f:
+            json.dump([[str(uuid), seen_at] for uuid, seen_at in self._entries.items()], f)
+
+        os.replace(tmp_path, self.path)
+
+    def _expire(self, now: float) -> None:
+        """
+        Evicts the entries that have not been seen for `ttl_sec`.
+        """
+        while self._entries:
+            _, seen_at = next(iter(self._entries.items()))
+
+            if now - seen_at < self.ttl_sec:
+                break
+
+            self._entries.popitem(last=False)
@@ -1,11 +1,173 @@
+import time
+
+from confluent_kafka import KafkaException, Message, TopicPartition
+from datetime import datetime, timezone
+from functools import partial
 from loguru import logger
 from quixstreams import Application
+from quixstreams.kafka import Producer
 from typing import Optional, List
 
+from src import metrics
+from src import wire_format as wire
+from src.checkpoint import Checkpoint
 from src.config import config
-from src.seismic_portal_api.earthquake import Earthquake
+from src.dedup import DedupCache
+from src.partitioning import partition_key
+from src.throughput import ThroughputMeter
+from src.seismic_portal_api.earthquake import EarthquakeBatch
 from src.seismic_portal_api.websocket import SeismicPortalAPI
 from src.seismic_portal_api.historical_data import HistoricalEarthquakes
+from src.seismic_portal_api.replay import ReplayEarthquakes
+from src.seismic_portal_api.response_cache import ResponseCache
+
+
+def commit_transaction(
+    producer: Producer, timeout: float = 60, max_retry_sec: float = 5 * 60
+) -> None:
+    """
+    Commits the open transaction of `producer`, which first waits for all its
+    messages to be delivered.
+
+    Retriable errors, e.g. a timeout, are retried for up to `max_retry_sec`
+    seconds. Past that, or on any other error, the transaction is aborted and
+    the error raised, so that the service restarts from the last committed
+    transaction and the dedup cache saved with it.
+    """
+    deadline = time.monotonic() + max_retry_sec
+
+    # The quixstreams Producer only exposes `produce`, `poll` and `flush`, so we
+    # use the transactional API of the confluent_kafka producer it wraps
+    while True:
+        try:
+            producer._producer.commit_transaction(timeout)
+            return
+
+        except KafkaException as e:
+            error = e.args[0]
+
+            if error.retriable() and time.monotonic() < deadline:
+                logger.warning(f"Retrying to commit the transaction: {error}")
+                continue
+
+            if error.retriable() or error.txn_requires_abort():
+                logger.error(f"Aborting the transaction: {error}")
+                producer._producer.abort_transaction(timeout)
+
+            raise
+
+
+def forget_undelivered(dedup_cache: DedupCache, msg: Message) -> None:
+    """
+    Removes the earthquake of a message the broker rejected from the dedup
+    cache, so that it is produced again once fetched again, e.g. by a restarted
+    backfill.
+    """
+    uuid, timestamp = wire.decode_uuid_and_timestamp(msg.value())
+    dedup_cache.forget(uuid, timestamp)
+
+
+def get_completed_until(
+    historical: HistoricalEarthquakes, dedup_cache: DedupCache
+) -> datetime:
+    """
+    Returns the date up to which every earthquake of the backfill was delivered:
+    the end of the windows returned so far, or the oldest earthquake the broker
+    rejected, if it is older.
+    """
+    completed_until = historical.completed_until
+
+    if dedup_cache.oldest_forgotten is not None:
+        completed_until = min(
+            completed_until,
+            datetime.fromtimestamp(dedup_cache.oldest_forgotten / 1000, timezone.utc),
+        )
+
+    return completed_until
+
+
+def get_newest_timestamp(
+    app: Application, topic_name: str, tail: int = 10, timeout: float = 10
+) -> Optional[int]:
+    """
+    Returns the newest message timestamp of a topic, in milliseconds, or None if
+    it is empty. The producer uses the time of the earthquakes as the message
+    timestamps, so it is the time of the newest earthquake in the topic.
+
+    It reads the last `tail` messages of each partition, rather than only the
+    last one, since the last offsets may be transaction markers.
+    """
+    with app.get_consumer(auto_commit_enable=False) as consumer:
+        metadata = consumer.list_topics(topic_name, timeout=timeout)
+
+        if topic_name not in metadata.topics or metadata.topics[topic_name].error:
+            return None
+
+        ends = {}
+        partitions = []
+        for partition in metadata.topics[topic_name].partitions:
+            low, high = consumer.get_watermark_offsets(
+                TopicPartition(topic_name, partition), timeout=timeout
+            )
+            if high > low:
+                ends[partition] = high
+                partitions.append(
+                    TopicPartition(topic_name, partition, max(low, high - tail))
+                )
+
+        if not partitions:
+            return None
+
+        consumer.incremental_assign(partitions)
+
+        newest_timestamp = None
+        deadline = datetime.now().timestamp() + timeout
+
+        while ends and datetime.now().timestamp() < deadline:
+            message = consumer.poll(1)
+
+            if message is None or message.error():
+                continue
+
+            _, timestamp = message.timestamp()
+            newest_timestamp = max(newest_timestamp or timestamp, timestamp)
+
+            if message.offset() >= ends.get(message.partition(), 0) - 1:
+                ends.pop(message.partition(), None)
+
+        return newest_timestamp
+
+
+def get_start_date(
+    app: Application,
+    topic_name: str,
+    checkpoint: Optional[Checkpoint],
+    catch_up: bool,
+) -> Optional[datetime]:
+    """
+    Returns the date the historical backfill starts from: the newest of the
+    checkpoint and, in catch-up mode, of the newest earthquake in the topic. It
+    is None, i.e. `last_n_days` ago, if there are neither.
+    """
+    start_dates = []
+
+    if checkpoint is not None:
+        completed_until = checkpoint.load()
+        if completed_until is not None:
+            start_dates.append(completed_until)
+
+    if catch_up:
+        newest_timestamp = get_newest_timestamp(app, topic_name)
+        logger.info(f"Newest earthquake in {topic_name}: {newest_timestamp}.")
+
+        if newest_timestamp is not None:
+            # The FDSN queries are to the second, so this earthquake is fetched
+            # again and dropped by the dedup cache or upserted by the sink
+            start_dates.append(
+                datetime.fromtimestamp(newest_timestamp / 1000, timezone.utc)
+            )
+
+    return max(start_dates) if start_dates else None
 
 
 def produce_earthquakes(
@@ -14,12 +176,95 @@ def produce_earthquakes(
     live_or_historical: str,
     last_n_days: Optional[int],
     limit: Optional[int],
+    window_days: Optional[int] = 90,
+    max_workers: Optional[int] = 4,
+    window_retries: Optional[int] = 3,
+    fdsn_formats: Optional[List[str]] = None,
+    websocket_queue_size: Optional[int] = 1000,
+    websocket_ping_interval_sec: Optional[int] = 30,
+    websocket_max_backoff_sec: Optional[int] = 60,
+    websocket_backfill_margin_sec: Optional[int] = 60 * 60,
+    dedup_max_size: Optional[int] = 100_000,
+    dedup_ttl_sec: Optional[int] = 7 * 24 * 60 * 60,
+    dedup_cache_path: Optional[str] = None,
+    producer_linger_ms: Optional[int] = 100,
+    producer_batch_size: Optional[int] = 1024 * 1024,
+    producer_compression: Optional[str] = "lz4",
+    log_throughput_every_sec: Optional[int] = 10,
+    wire_format: Optional[str] = "json",
+    producer_transactional_id: Optional[str] = None,
+    partition_strategy: Optional[str] = "region",
+    geohash_precision: Optional[int] = 2,
+    checkpoint_path: Optional[str] = None,
+    catch_up: Optional[bool] = False,
+    metrics_port: Optional[int] = None,
+    replay_path: Optional[str] = None,
+    replay_speedup: Optional[float] = 1.0,
+    replay_batch_size: Optional[int] = 1000,
+    fdsn_cache_dir: Optional[str] = None,
+    fdsn_cache_max_bytes: Optional[int] = 1024 * 1024 * 1024,
 ) -> None:
     """
     Main function that runs the Earthquake Producer.
+
+    Messages are produced asynchronously: the producer batches them for up to
+    `producer_linger_ms` or `producer_batch_size` bytes, compresses each batch
+    with `producer_compression`, and reports deliveries through a callback
+    that keeps track of the throughput.
+
+    Earthquakes whose UUID was already produced are dropped by a dedup cache,
+    which is saved to `dedup_cache_path` after the producer has been flushed.
+    The earthquakes the broker rejects are removed from it first, and the
+    checkpoint of a backfill stops before the oldest of them, so that a restart
+    produces them again.
+
+    Messages are written as JSON, or in the compact binary format of
+    `src.wire_format` if `wire_format` is "binary", with a content-type header
+    telling the consumers which one it is.
+
+    The producer is idempotent, so retries never write a message twice. If
+    `producer_transactional_id` is set, each batch of earthquakes is also
+    written in a transaction, and the dedup cache is only saved once it is
+    committed: after a crash, consumers reading committed messages only see
+    whole batches, and we produce again exactly the batches they did not see.
+
+    Messages are keyed, and so partitioned, by region, UUID or geohash cell
+    depending on `partition_strategy`, see `src.partitioning.partition_key`.
+
+    A historical backfill raises an error at the end if some of its windows
+    could not be downloaded, after producing all the others.
+
+    The progress of a historical backfill is saved to `checkpoint_path` along
+    with the dedup cache, and a restarted backfill resumes from it. In
+    `catch_up` mode, the backfill starts from the newest earthquake already in
+    the topic, so only the gap between it and now is fetched.
+
+    If `fdsn_cache_dir` is set, the historical windows that ended before today
+    are cached there, see `ResponseCache`.
+
+    In "replay" mode, the earthquakes of the archive at `replay_path` are
+    produced in the order they happened, at `replay_speedup` times their pace,
+    see `ReplayEarthquakes`.
+
+    If `metrics_port` is set, the metrics of `src.metrics` are served on it.
     """
+    metrics.start_metrics_server(metrics_port)
+
+    producer_extra_config = {
+        "linger.ms": producer_linger_ms,
+        "batch.size": producer_batch_size,
+        "compression.type": producer_compression,
+        "enable.idempotence": True,
+        "acks": "all",
+    }
+
+    if producer_transactional_id:
+        producer_extra_config["transactional.id"] = producer_transactional_id
 
-    app = Application(broker_address=kafka_broker_address)
+    app = Application(
+        broker_address=kafka_broker_address,
+        producer_extra_config=producer_extra_config,
+    )
     topic = app.topic(
         name=kafka_topic,
         value_serializer="json",
@@ -27,32 +272,123 @@ def produce_earthquakes(
 
     logger.info(f"Creating a service to fetch {live_or_historical} earthquake data.")
 
+    checkpoint = None
+
     if live_or_historical == "live":
-        seismic_portal_api = SeismicPortalAPI()
+        seismic_portal_api = SeismicPortalAPI(
+            queue_size=websocket_queue_size,
+            ping_interval_sec=websocket_ping_interval_sec,
+            max_backoff_sec=websocket_max_backoff_sec,
+            backfill_margin_sec=websocket_backfill_margin_sec,
+            fdsn_formats=fdsn_formats,
+        )
+
+    elif live_or_historical == "replay":
+        if not replay_path:
+            raise ValueError("Set replay_path to the archive to replay.")
+
+        seismic_portal_api = ReplayEarthquakes(
+            replay_path, speedup=replay_speedup, batch_size=replay_batch_size
+        )
 
     else:
-        seismic_portal_api = HistoricalEarthquakes(last_n_days, limit)
+        if checkpoint_path:
+            checkpoint = Checkpoint(checkpoint_path)
+
+        cache = None
+        if fdsn_cache_dir:
+            cache = ResponseCache(fdsn_cache_dir, max_bytes=fdsn_cache_max_bytes)
+
+        seismic_portal_api = HistoricalEarthquakes(
+            last_n_days,
+            limit,
+            window_days=window_days,
+            max_workers=max_workers,
+            formats=fdsn_formats,
+            window_retries=window_retries,
+            start_date=get_start_date(app, topic.name, checkpoint, catch_up),
+            cache=cache,
+        )
+
+    headers = wire.headers(wire_format)
 
     logger.info("Creating the kafka producer.")
     logger.debug(topic.name)
 
+    dedup_cache = DedupCache(
+        max_size=dedup_max_size,
+        ttl_sec=dedup_ttl_sec,
+        path=dedup_cache_path,
+        save_every_sec=log_throughput_every_sec,
+    )
+    throughput = ThroughputMeter(
+        log_every_sec=log_throughput_every_sec,
+        on_failure=partial(forget_undelivered, dedup_cache),
+    )
+
     with app.get_producer() as producer:
-        while True:
+        if producer_transactional_id:
+            # Fences off older producers with the same id and aborts their
+            # open transactions
+            producer._producer.init_transactions()
+
+        while not seismic_portal_api.is_done():
             # Get earthquakes from the seismic portal API
-            earthquakes: List[Earthquake] = seismic_portal_api.get_earthquakes()
+            earthquakes: EarthquakeBatch = seismic_portal_api.get_earthquakes()
+            earthquakes = dedup_cache.filter(earthquakes)
+
+            if producer_transactional_id and len(earthquakes) > 0:
+                producer._producer.begin_transaction()
+
+            for earthquake in earthquakes.to_records():
+                key = partition_key(earthquake, partition_strategy, geohash_precision)
+
+                if wire_format == "binary":
+                    value = wire.encode(earthquake)
+                else:
+                    message = topic.serialize(key=key, value=earthquake)
+                    key, value = message.key, message.value
 
-            for earthquake in earthquakes:
-                message = topic.serialize(
-                    key=earthquake.region, value=earthquake.model_dump()
-                )
                 producer.produce(
                     topic=topic.name,
-                    value=message.value,
-                    key=message.key,
-                    timestamp=earthquake.timestamp,
+                    value=value,
+                    key=key,
+                    headers=headers,
+                    timestamp=earthquake["timestamp"],
                     poll_timeout=600,
+                    on_delivery=throughput.on_delivery,
                 )
-                logger.info(earthquake)
+
+            if producer_transactional_id and len(earthquakes) > 0:
+                commit_transaction(producer)
+
+            # Serve the delivery reports of the batches sent so far
+            producer.poll(0)
+
+            if dedup_cache.should_save():
+                producer.flush()
+                dedup_cache.save()
+
+                if checkpoint is not None:
+                    checkpoint.save(get_completed_until(seismic_portal_api, dedup_cache))
+
+        producer.flush()
+        dedup_cache.save()
+
+        if checkpoint is not None:
+            checkpoint.save(get_completed_until(seismic_portal_api, dedup_cache))
+        throughput.log()
+
+    # Exit with an error rather than as if the backfill were complete. The
+    # checkpoint stops before the first failed window, so a rerun fetches it.
+    if (
+        isinstance(seismic_portal_api, HistoricalEarthquakes)
+        and seismic_portal_api.failed_windows
+    ):
+        raise RuntimeError(
+            f"Failed to download {len(seismic_portal_api.failed_windows)} "
+            f"historical windows."
+        )
 
 
 if __name__ == "__main__":
@@ -63,6 +399,33 @@ if __name__ == "__main__":
             live_or_historical=config.live_or_historical,
             last_n_days=config.last_n_days,
             limit=config.limit,
+            window_days=config.window_days,
+            max_workers=config.max_workers,
+            window_retries=config.window_retries,
+            fdsn_formats=config.fdsn_formats,
+            websocket_queue_size=config.websocket_queue_size,
+            websocket_ping_interval_sec=config.websocket_ping_interval_sec,
+            websocket_max_backoff_sec=config.websocket_max_backoff_sec,
+            websocket_backfill_margin_sec=config.websocket_backfill_margin_sec,
+            dedup_max_size=config.dedup_max_size,
+            dedup_ttl_sec=config.dedup_ttl_sec,
+            dedup_cache_path=config.dedup_cache_path,
+            producer_linger_ms=config.producer_linger_ms,
+            producer_batch_size=config.producer_batch_size,
+            producer_compression=config.producer_compression,
+            log_throughput_every_sec=config.log_throughput_every_sec,
+            wire_format=config.wire_format,
+            producer_transactional_id=config.producer_transactional_id,
+            partition_strategy=config.partition_strategy,
+            geohash_precision=config.geohash_precision,
+            checkpoint_path=config.checkpoint_path,
+            catch_up=config.catch_up,
+            metrics_port=config.metrics_port,
+            replay_path=config.replay_path,
+            replay_speedup=config.replay_speedup,
+            replay_batch_size=config.replay_batch_size,
+            fdsn_cache_dir=config.fdsn_cache_dir,
+            fdsn_cache_max_bytes=config.fdsn_cache_max_bytes,
         )
     except KeyboardInterrupt:
         logger.info("Exiting...")
@@ -0,0 +1,90 @@
+"""
+Prometheus metrics of the earthquake producer, served over HTTP by
+`start_metrics_server` for Prometheus to scrape.
+
+Every service has its own copy of `start_metrics_server` and `observe_event_lag`,
+with the metrics of that service. Latencies are in seconds, and the event lag
+is the time since the `timestamp` of the earthquake, i.e. since it happened.
+"""
+
+import time
+
+from loguru import logger
+from prometheus_client import Counter, Histogram, start_http_server
+from typing import Iterable, Optional
+
+# From a second to a month, since historical earthquakes are produced long
+# after they happened
+EVENT_LAG_BUCKETS = (
+    1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 6 * 3600, 86400, 7 * 86400, 30 * 86400,
+)
+
+FETCH_SECONDS = Histogram(
+    "earthquake_producer_fetch_seconds",
+    "Time until the Seismic Portal answers the query of a historical window.",
+    ["format"],
+)
+PARSE_SECONDS = Histogram(
+    "earthquake_producer_parse_seconds",
+    "Time to download and decode the earthquakes of a window or websocket message.",
+    ["format"],
+)
+FDSN_CACHE_REQUESTS = Counter(
+    "earthquake_producer_fdsn_cache_requests_total",
+    "Historical windows looked up in the FDSN response cache, by hit or miss.",
+    ["result"],
+)
+FAILED_WINDOWS = Counter(
+    "earthquake_producer_failed_windows_total",
+    "Historical windows that could not be downloaded or parsed.",
+)
+WINDOW_EARTHQUAKES = Histogram(
+    "earthquake_producer_window_earthquakes",
+    "Number of earthquakes in a historical window.",
+    buckets=(0, 10, 100, 1000, 5000, 10000, 20000),
+)
+DUPLICATES = Counter(
+    "earthquake_producer_duplicates_total",
+    "Earthquakes dropped because they were already produced.",
+)
+PRODUCED = Counter(
+    "earthquake_producer_produced_total",
+    "Messages acknowledged by the broker.",
+)
+PRODUCED_BYTES = Counter(
+    "earthquake_producer_produced_bytes_total",
+    "Bytes of the messages acknowledged by the broker.",
+)
+DELIVERY_FAILURES = Counter(
+    "earthquake_producer_delivery_failures_total",
+    "Messages the broker rejected.",
+)
+EVENT_LAG_SECONDS = Histogram(
+    "earthquake_producer_event_lag_seconds",
+    "Time from an earthquake to its message being acknowledged by the broker.",
+    buckets=EVENT_LAG_BUCKETS,
+)
+
+
+def start_metrics_server(port: Optional[int]) -> None:
+    """
+    Serves the metrics on `http://0.0.0.0:{port}/metrics`, from a background
+    thread. Does nothing if `port` is None.
+    """
+    if port is None:
+        return
+
+    start_http_server(port)
+    logger.info(f"Serving metrics on port {port}.")
+
+
+def observe_event_lag(histogram: Histogram, timestamps_ms: Iterable[int]) -> None:
+    """
+    Records in `histogram` the time since each of the event `timestamps_ms`,
+    skipping the missing ones.
+    """
+    now_ms = time.time() * 1000
+
+    for timestamp_ms in timestamps_ms:
+        if timestamp_ms is not None:
+            histogram.observe((now_ms - timestamp_ms) / 1000)
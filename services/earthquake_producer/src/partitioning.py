@@ -0,0 +1,70 @@
+from typing import Any, Dict
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def partition_key(
+    earthquake: Dict[str, Any],
+    strategy: str = "region",
+    geohash_precision: int = 2,
+) -> str:
+    """
+    Returns the Kafka message key of an earthquake, which decides its partition.
+
+    Args:
+        earthquake (Dict[str, Any]): The earthquake, as returned by
+            `EarthquakeBatch.to_records`.
+        strategy (str): "region" keeps the earthquakes of a region in order in
+            one partition, but a few busy regions get most of the load. "uuid"
+            spreads the earthquakes evenly, without any ordering. "geohash"
+            keys by the geohash cell of the epicenter, which spreads nearby
+            regions over partitions while keeping each cell in order.
+        geohash_precision (int): The number of characters of the geohash cells.
+
+    Returns:
+        str: The message key.
+    """
+    if strategy == "uuid":
+        return str(earthquake["uuid"])
+
+    if strategy == "geohash":
+        return geohash(
+            earthquake["latitude"], earthquake["longitude"], geohash_precision
+        )
+
+    return earthquake["region"]
+
+
+def geohash(latitude: float, longitude: float, precision: int) -> str:
+    """
+    Returns the geohash of a point, with `precision` characters.
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+
+    chars = []
+    bits = 0
+    n_bits = 0
+    even = True
+
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude, starting with longitude
+        value, value_range = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (value_range[0] + value_range[1]) / 2
+
+        if value >= middle:
+            bits = (bits << 1) | 1
+            value_range[0] = middle
+        else:
+            bits = bits << 1
+            value_range[1] = middle
+
+        even = not even
+        n_bits += 1
+
+        if n_bits == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits = 0
+            n_bits = 0
+
+    return "".join(chars)
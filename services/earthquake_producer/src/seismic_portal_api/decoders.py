@@ -0,0 +1,213 @@
+import itertools
+
+import orjson
+
+from loguru import logger
+
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Dict, Iterable, Iterator, Optional, Tuple
+from src.seismic_portal_api.earthquake import EarthquakeBatch
+from src.seismic_portal_api.quakeml import EventFields, iter_events
+
+
+class Decoder(ABC):
+    """
+    Decodes an FDSN event query response into an EarthquakeBatch.
+
+    The events are decoded in chunks of `CHUNK_SIZE` while the response is being
+    read, so that only one chunk of raw fields is held at a time, next to the
+    columnar batches of the chunks before it.
+    """
+
+    # Value of the `format` query parameter that selects this decoder's format
+    format: str
+
+    # Number of events turned into a batch at a time
+    CHUNK_SIZE = 10_000
+
+    def decode(self, stream: BinaryIO) -> EarthquakeBatch:
+        """
+        Decodes the response body in `stream` into a batch of earthquakes.
+
+        Args:
+            stream (BinaryIO): A file-like object with the response body.
+
+        Returns:
+            EarthquakeBatch: The earthquakes in the response, in response order.
+        """
+        return self.decode_and_count(stream)[0]
+
+    def decode_and_count(self, stream: BinaryIO) -> Tuple[EarthquakeBatch, int]:
+        """
+        Decodes the response body in `stream` like `decode`, and counts the events
+        of the response, including the ones skipped for missing data or dropped
+        as invalid, to compare with the `limit` of the query.
+
+        Returns:
+            Tuple[EarthquakeBatch, int]: The earthquakes in the response, and the
+                number of events it has.
+        """
+        batches = []
+        events = 0
+
+        for batch, chunk_events in self.decode_chunks(stream):
+            batches.append(batch)
+            events += chunk_events
+
+        return EarthquakeBatch.concat(batches), events
+
+    def decode_chunks(
+        self, stream: BinaryIO, chunk_size: Optional[int] = None
+    ) -> Iterator[Tuple[EarthquakeBatch, int]]:
+        """
+        Decodes the response body in `stream` into batches of up to `chunk_size`
+        earthquakes, as the events are read.
+
+        Args:
+            stream (BinaryIO): A file-like object with the response body.
+            chunk_size (Optional[int]): The number of events per batch,
+                `CHUNK_SIZE` if None.
+
+        Returns:
+            Iterator[Tuple[EarthquakeBatch, int]]: The earthquakes of each chunk,
+                in response order, and the number of events of the response in
+                the chunk.
+        """
+        events = self.iter_events(stream)
+
+        while True:
+            chunk = list(itertools.islice(events, chunk_size or self.CHUNK_SIZE))
+
+            if not chunk:
+                return
+
+            yield to_batch(chunk), len(chunk)
+
+    @abstractmethod
+    def iter_events(self, stream: BinaryIO) -> Iterator[Optional[EventFields]]:
+        """
+        Yields the raw fields of each event in the response body in `stream`, or
+        None for an event with missing data.
+        """
+
+
+class FDSNTextDecoder(Decoder):
+    """
+    Decodes the pipe-separated FDSN text format, one event per line:
+
+        #EventID|Time|Latitude|Longitude|Depth/km|...|Magnitude|...|EventLocationName
+    """
+
+    format = "text"
+
+    def iter_events(self, stream: BinaryIO) -> Iterator[Optional[EventFields]]:
+        columns = None
+
+        for line in stream:
+            line = line.decode("utf-8").strip()
+
+            if not line:
+                continue
+
+            fields = [field.strip() for field in line.split("|")]
+
+            if line.startswith("#"):
+                fields[0] = fields[0].lstrip("#").strip()
+                columns = {name: index for index, name in enumerate(fields)}
+                continue
+
+            if columns is None:
+                raise ValueError("FDSN text response has no header line.")
+
+            try:
+                time_str = fields[columns["Time"]]
+
+                # FDSN text times are UTC but carry no zone designator
+                if not time_str.endswith("Z"):
+                    time_str += "Z"
+
+                yield (
+                    time_str,
+                    fields[columns["EventLocationName"]],
+                    fields[columns["Magnitude"]],
+                    fields[columns["Depth/km"]],
+                    fields[columns["Latitude"]],
+                    fields[columns["Longitude"]],
+                )
+
+            except (IndexError, KeyError):
+                logger.warning(f"Skipping earthquake with missing data: {line}")
+                yield None
+
+
+class GeoJSONDecoder(Decoder):
+    """
+    Decodes the seismicportal GeoJSON format, a FeatureCollection whose feature
+    properties have the same shape as the websocket messages.
+
+    Unlike the other formats, the document is read and parsed whole before the
+    first event is yielded, as orjson has no incremental parser.
+    """
+
+    format = "json"
+
+    def iter_events(self, stream: BinaryIO) -> Iterator[Optional[EventFields]]:
+        document = orjson.loads(stream.read())
+
+        for feature in document.get("features", []):
+            fields = properties_to_event_fields(feature.get("properties", {}))
+
+            if fields is None:
+                logger.warning(f"Skipping earthquake with missing data: {feature}")
+
+            yield fields
+
+
+class QuakeMLDecoder(Decoder):
+    """
+    Decodes QuakeML XML, the default format of the FDSN event service.
+    """
+
+    format = "xml"
+
+    def iter_events(self, stream: BinaryIO) -> Iterator[Optional[EventFields]]:
+        return iter_events(stream)
+
+
+def properties_to_event_fields(properties: dict) -> Optional[EventFields]:
+    """
+    Extracts the fields of an event from the properties of a seismicportal
+    GeoJSON feature or websocket message. Returns None if any is missing.
+    """
+    try:
+        return (
+            properties["time"],
+            properties["flynn_region"],
+            properties["mag"],
+            properties["depth"],
+            properties["lat"],
+            properties["lon"],
+        )
+
+    except KeyError:
+        return None
+
+
+def to_batch(events: Iterable[Optional[EventFields]]) -> EarthquakeBatch:
+    """
+    Transposes the fields of a sequence of events into an EarthquakeBatch,
+    skipping the events with missing data.
+    """
+    columns = list(zip(*(fields for fields in events if fields is not None)))
+
+    if not columns:
+        return EarthquakeBatch.empty()
+
+    return EarthquakeBatch.from_columns(*columns)
+
+
+# Decoders by format, from the cheapest to the most expensive to decode
+DECODERS: Dict[str, Decoder] = {
+    decoder.format: decoder
+    for decoder in (FDSNTextDecoder(), GeoJSONDecoder(), QuakeMLDecoder())
+}
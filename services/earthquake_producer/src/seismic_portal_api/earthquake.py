@@ -1,6 +1,13 @@
+import numpy as np
+
+from loguru import logger
 from pydantic import BaseModel
 from uuid import UUID
 
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Sequence, Union
+from src.seismic_portal_api.utils import to_ms_batch, generate_earthquake_uuids
+
 
 class Earthquake(BaseModel):
     """
@@ -15,3 +22,219 @@ class Earthquake(BaseModel):
     latitude: float
     longitude: float
     uuid: UUID
+
+
+@dataclass
+class EarthquakeBatch:
+    """
+    A class that represents a batch of earthquakes as one typed numpy array per
+    field of the Earthquake model. The columns are cast once per batch, instead
+    of once per earthquake.
+
+    The batch only checks its structure. Rows with coordinates out of range or
+    values that are not finite are dropped by `from_columns` and `drop_invalid`,
+    so that one bad event does not cost the rest of its window.
+    """
+
+    timestamp: np.ndarray
+    datestr: np.ndarray
+    region: np.ndarray
+    magnitude: np.ndarray
+    depth: np.ndarray
+    latitude: np.ndarray
+    longitude: np.ndarray
+    uuid: np.ndarray
+
+    DTYPES = {
+        "timestamp": np.int64,
+        "datestr": object,
+        "region": object,
+        "magnitude": np.float64,
+        "depth": np.float64,
+        "latitude": np.float64,
+        "longitude": np.float64,
+        "uuid": object,
+    }
+
+    def __post_init__(self):
+        self.validate()
+
+    def validate(self) -> None:
+        """
+        Casts every column to its dtype and checks that they all have the same
+        length.
+
+        Raises:
+            ValueError: If the columns have different lengths.
+        """
+        for name, dtype in self.DTYPES.items():
+            setattr(self, name, np.asarray(getattr(self, name), dtype=dtype))
+
+        lengths = {len(getattr(self, name)) for name in self.DTYPES}
+        if len(lengths) > 1:
+            raise ValueError(f"Columns of different lengths: {lengths}")
+
+    @classmethod
+    def from_columns(
+        cls,
+        time_strs: Sequence[str],
+        regions: Sequence[str],
+        magnitudes: Sequence[Union[str, float]],
+        depths: Sequence[Union[str, float]],
+        latitudes: Sequence[Union[str, float]],
+        longitudes: Sequence[Union[str, float]],
+    ) -> "EarthquakeBatch":
+        """
+        Builds a batch from the raw fields of a window of events, whatever format
+        they were decoded from. Events with a field that is not a number, or with
+        coordinates out of range, are dropped.
+
+        Args:
+            time_strs (Sequence[str]): The UTC origin times, e.g. '2024-06-17T09:36:39.467866Z'.
+            regions (Sequence[str]): The Flinn-Engdahl region names.
+            magnitudes (Sequence[Union[str, float]]): The magnitudes, as received.
+            depths (Sequence[Union[str, float]]): The depths in kilometers.
+            latitudes (Sequence[Union[str, float]]): The latitudes in degrees.
+            longitudes (Sequence[Union[str, float]]): The longitudes in degrees.
+
+        Returns:
+            EarthquakeBatch: A batch with one earthquake per valid event.
+        """
+        numbers = np.vstack(
+            [_to_float_array(column) for column in (magnitudes, depths, latitudes, longitudes)]
+        ).reshape(4, len(time_strs))
+        valid = _valid_rows(*numbers)
+
+        if not np.all(valid):
+            logger.warning(
+                f"Skipping {np.count_nonzero(~valid)} earthquakes with invalid data."
+            )
+            keep = np.flatnonzero(valid)
+            time_strs = [time_strs[i] for i in keep]
+            regions = [regions[i] for i in keep]
+            numbers = numbers[:, valid]
+
+        timestamps = to_ms_batch(time_strs)
+
+        return cls(
+            timestamp=timestamps,
+            datestr=[time_str[:10] for time_str in time_strs],
+            region=regions,
+            magnitude=numbers[0],
+            depth=numbers[1],
+            latitude=numbers[2],
+            longitude=numbers[3],
+            uuid=generate_earthquake_uuids(regions, timestamps, numbers[0]),
+        )
+
+    @classmethod
+    def from_earthquakes(cls, earthquakes: Sequence[Earthquake]) -> "EarthquakeBatch":
+        """
+        Builds a batch from a sequence of Earthquake models.
+        """
+        return cls(
+            **{
+                name: [getattr(earthquake, name) for earthquake in earthquakes]
+                for name in cls.DTYPES
+            }
+        )
+
+    @classmethod
+    def empty(cls) -> "EarthquakeBatch":
+        return cls(**{name: [] for name in cls.DTYPES})
+
+    @classmethod
+    def concat(cls, batches: Sequence["EarthquakeBatch"]) -> "EarthquakeBatch":
+        """
+        Concatenates batches into one, in the given order.
+        """
+        if not batches:
+            return cls.empty()
+
+        return cls(
+            **{
+                name: np.concatenate([getattr(batch, name) for batch in batches])
+                for name in cls.DTYPES
+            }
+        )
+
+    def __len__(self) -> int:
+        return len(self.timestamp)
+
+    def __iter__(self) -> Iterator[Earthquake]:
+        """
+        Iterates over the batch as Earthquake models. Prefer `to_records` on hot
+        paths, since this validates every earthquake again.
+        """
+        for record in self.to_records():
+            yield Earthquake(**record)
+
+    def drop_invalid(self) -> "EarthquakeBatch":
+        """
+        Returns the earthquakes of the batch with finite values and coordinates
+        in range, and logs how many were dropped.
+        """
+        valid = _valid_rows(self.magnitude, self.depth, self.latitude, self.longitude)
+
+        if np.all(valid):
+            return self
+
+        logger.warning(f"Skipping {np.count_nonzero(~valid)} earthquakes with invalid data.")
+
+        return self.take(valid)
+
+    def take(self, indices: Union[np.ndarray, Sequence[int]]) -> "EarthquakeBatch":
+        """
+        Returns a new batch with the rows at `indices`, or where a boolean mask is True.
+        """
+        return EarthquakeBatch(
+            **{name: getattr(self, name)[indices] for name in self.DTYPES}
+        )
+
+    def sort_by_timestamp(self) -> "EarthquakeBatch":
+        return self.take(np.argsort(self.timestamp, kind="stable"))
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """
+        Returns the batch as a list of dicts with plain Python values, in the same
+        shape as `Earthquake.model_dump()`.
+        """
+        columns = {name: getattr(self, name).tolist() for name in self.DTYPES}
+
+        return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+
+def _valid_rows(
+    magnitudes: np.ndarray,
+    depths: np.ndarray,
+    latitudes: np.ndarray,
+    longitudes: np.ndarray,
+) -> np.ndarray:
+    """
+    Returns a mask of the rows with finite values and coordinates in range.
+    """
+    with np.errstate(invalid="ignore"):
+        return (
+            np.isfinite(magnitudes)
+            & np.isfinite(depths)
+            & (np.abs(latitudes) <= 90)
+            & (np.abs(longitudes) <= 180)
+        )
+
+
+def _to_float_array(values: Sequence[Union[str, float]]) -> np.ndarray:
+    """
+    Converts `values` to floats, with NaN for the values that are not numbers.
+    """
+    try:
+        return np.asarray(values, dtype=np.float64)
+
+    except (TypeError, ValueError):
+        return np.array([_to_float(value) for value in values], dtype=np.float64)
+
+
+def _to_float(value: Union[str, float]) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
@@ -1,39 +1,109 @@
 import requests
-import xmltodict
+import time
 
 from loguru import logger
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from typing import List, Tuple
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, Dict, List, Optional, Tuple
 from datetime import datetime, timedelta, timezone
-from src.seismic_portal_api.earthquake import Earthquake
-from src.seismic_portal_api.utils import to_ms, generate_earthquake_uuid
+from src import metrics
+from src.seismic_portal_api.earthquake import EarthquakeBatch
+from src.seismic_portal_api.decoders import DECODERS, Decoder
+from src.seismic_portal_api.response_cache import CachingReader, ResponseCache
+
+Window = Tuple[datetime, datetime]
 
 
 class HistoricalEarthquakes:
     """
     A class to query the Seismic Portal API for historical earthquakes.
+
+    The range `[now - last_n_days, now)` is split into windows of `window_days`
+    that are downloaded concurrently over a pooled HTTP session. Windows are
+    handed out strictly in chronological order, so the earthquakes still reach
+    Kafka sorted by timestamp.
+
+    The response format is the first of `formats` that the API serves, so we
+    use the cheapest one to decode.
+
+    If `start_date` is given, the range starts there instead of `last_n_days` ago.
+
+    A window that fails, once the session has retried its requests, is queued
+    again up to `window_retries` times, `RETRY_BACKOFF` apart and doubling, and
+    before any later window. The windows that still fail are in
+    `failed_windows` once the backfill is done.
+
+    `completed_until` is the end of the windows returned so far, up to the first
+    window that failed, so that a checkpoint of it never skips earthquakes.
+
+    If a `cache` is given, the responses of the windows that ended before today
+    (UTC) are read from it, or stored in it once downloaded. The windows of
+    today are always downloaded, since the catalog is still being updated.
     """
 
-    URL = "https://www.seismicportal.eu/fdsnws/event/1/query?limit={limit}&start={start_date}&end={end_date}"
+    URL = "https://www.seismicportal.eu/fdsnws/event/1/query?limit={limit}&start={start_date}&end={end_date}&format={format}"
+
+    # Windows shorter than this are never split further, even if truncated.
+    MIN_WINDOW = timedelta(minutes=1)
+
+    # Delay before the first retry of a failed window, doubled on each retry.
+    RETRY_BACKOFF = timedelta(seconds=30)
 
     def __init__(
         self,
         last_n_days: int = 30,
         limit: int = 20000,
+        window_days: int = 90,
+        max_workers: int = 4,
+        formats: Optional[List[str]] = None,
+        start_date: Optional[datetime] = None,
+        cache: Optional[ResponseCache] = None,
+        window_retries: int = 3,
     ):
         self.last_n_days = last_n_days
         self.limit = limit
-        self.start_date, self.end_date = self._init_from_to_dates(self.last_n_days)
+        self.window_days = window_days
+        self.max_workers = max_workers
+        self.formats = formats or list(DECODERS)
+        self.cache = cache
+        self.window_retries = window_retries
+        self.start_date, self.end_date = self._init_from_to_dates(
+            self.last_n_days, start_date
+        )
+
+        # Windows waiting to be downloaded, and windows being downloaded, both
+        # in chronological order. The head of `_in_flight` is always the oldest
+        # window that has not been returned yet.
+        self._pending: Deque[Window] = deque(
+            self._split_into_windows(self.start_date, self.end_date, window_days)
+        )
+        self._in_flight: Deque[Tuple[Window, Future]] = deque()
+        self.failed_windows: List[Window] = []
+        self._retries: Dict[Window, int] = {}
+        self.completed_until = self.start_date
+
+        self._session = self._init_session(max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._decoder: Optional[Decoder] = None
+
+    def is_done(self) -> bool:
+        """
+        Whether every window in the requested range has been returned.
+        """
+        return not self._pending and not self._in_flight
 
-    def get_earthquakes(self) -> List[Earthquake]:
+    def get_earthquakes(self) -> EarthquakeBatch:
         """
-        Query the Seismic Portal API for historical earthquakes.
+        Returns the earthquakes of the next window, in chronological order.
 
         Args:
             None
 
         Returns:
-            List[Earthquake]: A list of Earthquake models, each with the format:
+            EarthquakeBatch: A batch of earthquakes, each row with the format:
                 {
                     "timestamp_ms": 1721081730640,
                     "datestr": 2024-07-16
@@ -44,93 +114,355 @@ class HistoricalEarthquakes:
                     "longitude": -116.1513
                 }
         """
-        # The query always pulls the latest data first. We need to query from the start so that
-        # we can get the oldest data first and process the data via Quixstreams. To do this, we
-        # need to query the data in chunks of 90 days. That will provide a safe buffer to ensure
-        # that we don't miss any data given the batch limit of 20,000.
+        if self._decoder is None and not self.is_done():
+            self._decoder = self._select_decoder()
 
-        start_of_batch = self.start_date
-        end_of_batch = min(start_of_batch + timedelta(days=90), self.end_date)
+        while not self.is_done():
+            self._fill_in_flight()
 
-        try:
-            logger.info("Running query to Seismic Portal API.")
-            response = requests.get(
-                self.URL.format(
-                    limit=self.limit,
-                    start_date=start_of_batch,
-                    end_date=end_of_batch,
+            window, future = self._in_flight.popleft()
+            result = future.result()
+
+            if result is None:
+                metrics.FAILED_WINDOWS.inc()
+                retries = self._retries.get(window, 0)
+
+                if retries < self.window_retries:
+                    delay = self.RETRY_BACKOFF * 2**retries
+                    self._retries[window] = retries + 1
+                    logger.warning(
+                        f"Retrying window {window[0]} to {window[1]} in {delay} "
+                        f"({retries + 1}/{self.window_retries})."
+                    )
+                    self._in_flight.appendleft((window, self._submit(window, delay)))
+                else:
+                    self.failed_windows.append(window)
+
+                continue
+
+            start_of_batch, end_of_batch = window
+            earthquakes, events = result
+
+            # The API returns at most `limit` earthquakes per query, latest first. If we
+            # hit the cap the window was truncated, so we split it in two and download
+            # both halves before anything that comes after them. We count the events
+            # of the response, before the invalid ones and the ones on the end of the
+            # window are dropped.
+            if events >= self.limit:
+                if end_of_batch - start_of_batch > self.MIN_WINDOW:
+                    first, second = self._split_in_two(window)
+                    logger.info(
+                        f"Window {start_of_batch} to {end_of_batch} hit the limit "
+                        f"of {self.limit} earthquakes. Splitting it in two."
+                    )
+                    self._in_flight.appendleft((second, self._submit(second)))
+                    self._in_flight.appendleft((first, self._submit(first)))
+                    continue
+
+                logger.warning(
+                    f"Window {start_of_batch} to {end_of_batch} is truncated at "
+                    f"{self.limit} earthquakes and cannot be split any further."
                 )
+
+            logger.info(
+                f"Downloaded {len(earthquakes)} earthquakes from {start_of_batch} "
+                f"to {end_of_batch}."
             )
-            response.raise_for_status()
 
-        except Exception as e:
-            logger.info(f"Failed to query Seismic Portal API. Status code: {e}.")
-            exit(1)
+            metrics.WINDOW_EARTHQUAKES.observe(len(earthquakes))
 
-        # We have no earthquakes to fetch if:
-        # 1. The response status code is 204, i.e. our query returned no results.
-        # 2. The start timestamp is greater than the end timestamp.
-        # 3. The batch size is less than the limit, meaning we have fetched all the earthquakes.
+            if not self.failed_windows:
+                self.completed_until = end_of_batch
 
-        if response.status_code == 204 or start_of_batch > end_of_batch:
-            logger.info("No more earthquakes to fetch.")
-            exit(0)
+            if self.is_done():
+                self._finish()
 
-        else:
+            # Sort the earthquakes by timestamp on the way out to ensure that
+            # the data is processed by kafka in the correct order.
+            return earthquakes.sort_by_timestamp()
+
+        self._finish()
+
+        return EarthquakeBatch.empty()
+
+    def close(self) -> None:
+        """
+        Stops the download workers, cancelling the windows not started yet, and
+        closes the HTTP session. Called once every window has been returned, or
+        by the caller if it stops before.
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._session.close()
+
+    def _finish(self) -> None:
+        """
+        Logs the outcome of the backfill and closes it, once every window has
+        been returned.
+        """
+        logger.info("No more earthquakes to fetch.")
+        if self.cache is not None:
             logger.info(
-                f"Downloading earthquakes from {start_of_batch} to {end_of_batch}."
+                f"Read {self.cache.hits} windows from the FDSN cache, downloaded "
+                f"{self.cache.misses}."
             )
-            response_dict = xmltodict.parse(response.text)
+        if self.failed_windows:
+            logger.error(
+                f"Failed to download {len(self.failed_windows)} windows after "
+                f"{self.window_retries} retries: {self.failed_windows}"
+            )
+
+        self.close()
+
+    def _select_decoder(self) -> Decoder:
+        """
+        Returns the decoder of the first format in `formats` for which the API
+        answers a one-event query with a response we can decode, or in which
+        some of the windows are already cached.
+        """
+        for format in self.formats:
+            decoder = DECODERS[format]
 
-            # Extract the earthquakes from the response
-            earthquakes = []
+            if self.cache is not None and any(
+                self._cache_key(window, decoder) in self.cache for window in self._pending
+            ):
+                logger.info(f"Reading cached earthquakes in '{format}' format.")
+                return decoder
 
-            for earthquake in response_dict["q:quakeml"]["eventParameters"]["event"]:
-                time_str = earthquake["origin"]["time"]["value"]
+            try:
+                response = self._query(self.start_date, self.end_date, decoder, limit=1)
+                response.raise_for_status()
 
-                try:
-                    region = earthquake["description"]["text"]
-                    timestamp = to_ms(time_str)
-                    magnitude = earthquake["magnitude"]["mag"]["value"]
+                if response.status_code != 204:
+                    response.raw.decode_content = True
+                    decoder.decode(response.raw)
 
-                    uuid = generate_earthquake_uuid(
-                        region,
-                        timestamp,
-                        magnitude
-                    )
-                    earthquakes.append(
-                        Earthquake(
-                            timestamp=timestamp,
-                            datestr=time_str[:10],
-                            latitude=earthquake["origin"]["latitude"]["value"],
-                            longitude=earthquake["origin"]["longitude"]["value"],
-                            depth=float(earthquake["origin"]["depth"]["value"]) / 1000,
-                            magnitude=magnitude,
-                            region=region,
-                            uuid=uuid
-                        )
-                    )
+                response.close()
 
-                except KeyError:
-                    logger.warning(
-                        f"Skipping earthquake with missing data: {earthquake}"
+            except Exception as e:
+                logger.warning(f"Format '{format}' is not available: {e}.")
+                continue
+
+            logger.info(f"Downloading earthquakes in '{format}' format.")
+            return decoder
+
+        logger.error(f"None of the formats {self.formats} is available.")
+        return DECODERS[self.formats[-1]]
+
+    def _query(
+        self,
+        start_of_batch: datetime,
+        end_of_batch: datetime,
+        decoder: Decoder,
+        limit: int,
+    ) -> requests.Response:
+        """
+        Sends a streamed query for the earthquakes between the two dates.
+        """
+        return self._session.get(
+            self._url(start_of_batch, end_of_batch, decoder, limit), stream=True
+        )
+
+    def _url(
+        self,
+        start_of_batch: datetime,
+        end_of_batch: datetime,
+        decoder: Decoder,
+        limit: int,
+    ) -> str:
+        return self.URL.format(
+            limit=limit,
+            start_date=start_of_batch.strftime("%Y-%m-%dT%H:%M:%S"),
+            end_date=end_of_batch.strftime("%Y-%m-%dT%H:%M:%S"),
+            format=decoder.format,
+        )
+
+    def _cache_key(self, window: Window, decoder: Decoder) -> Optional[str]:
+        """
+        Returns the cache key of the response of `window`, or None if it is not
+        cached: there is no cache, or the window has not ended before today.
+        """
+        start_of_batch, end_of_batch = window
+        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+        if self.cache is None or end_of_batch > today:
+            return None
+
+        return ResponseCache.key(
+            self._url(start_of_batch, end_of_batch, decoder, self.limit)
+        )
+
+
+    def _fill_in_flight(self) -> None:
+        """
+        Submits pending windows until `max_workers` downloads are in flight.
+        """
+        while self._pending and len(self._in_flight) < self.max_workers:
+            window = self._pending.popleft()
+            self._in_flight.append((window, self._submit(window)))
+
+    def _submit(self, window: Window, delay: timedelta = timedelta(0)) -> Future:
+        return self._executor.submit(self._fetch_window, window, delay)
+
+    def _fetch_window(
+        self, window: Window, delay: timedelta = timedelta(0)
+    ) -> Optional[Tuple[EarthquakeBatch, int]]:
+        """
+        Downloads and parses the earthquakes in `window`, after `delay`.
+
+        Returns:
+            Optional[Tuple[EarthquakeBatch, int]]: The earthquakes in the window and
+            the number of events in the response, or None if the window could not
+            be downloaded.
+        """
+        start_of_batch, end_of_batch = window
+        time.sleep(delay.total_seconds())
+        start = time.perf_counter()
+
+        # Windows that ended before today are read from the cache if it has them
+        cache_key = self._cache_key(window, self._decoder)
+        response = self.cache.get(cache_key) if cache_key else None
+        cached = response is not None
+
+        if not cached:
+            try:
+                response = self._query(
+                    start_of_batch, end_of_batch, self._decoder, limit=self.limit
+                )
+                response.raise_for_status()
+
+            except Exception as e:
+                logger.error(
+                    f"Failed to query Seismic Portal API for {start_of_batch} to "
+                    f"{end_of_batch}: {e}."
+                )
+                return None
+
+            metrics.FETCH_SECONDS.labels(self._decoder.format).observe(
+                time.perf_counter() - start
+            )
+
+        # A 204 means that our query returned no results.
+        if response.status_code == 204:
+            if cache_key and not cached:
+                self.cache.put_empty(cache_key)
+
+            return EarthquakeBatch.empty(), 0
+
+        start_ms = int(start_of_batch.timestamp() * 1000)
+        end_ms = int(end_of_batch.timestamp() * 1000)
+
+        # Parse the body while it is being downloaded instead of buffering the
+        # whole document. `decode_content` undoes any gzip transfer encoding.
+        response.raw.decode_content = True
+        body = response.raw
+
+        # A copy of the body is written as it is parsed, and cached if it parses
+        if cache_key and not cached:
+            body = self.cache.record(cache_key, body)
+
+        try:
+            batches = []
+            events = 0
+
+            # The body is decoded in chunks as it is downloaded, and only the
+            # columns of the earthquakes are kept. The window is returned whole:
+            # the API returns it latest first, and we only know that it was not
+            # truncated once all of it has been read.
+            with metrics.PARSE_SECONDS.labels(self._decoder.format).time():
+                for chunk, chunk_events in self._decoder.decode_chunks(body):
+                    # The API treats both ends of the window as inclusive. We keep
+                    # the windows half-open so that an earthquake on a boundary is
+                    # only produced once.
+                    timestamp = chunk.timestamp
+                    batches.append(
+                        chunk.take((timestamp >= start_ms) & (timestamp < end_ms))
                     )
-                    continue
+                    events += chunk_events
 
-            self.start_date = end_of_batch + timedelta(days=1)
+            if isinstance(body, CachingReader):
+                body.commit()
 
-            # Sort the earthquakes by timestamp on the way out to ensure that
-            # the data is processed by kafka in the correct order.
-            earthquakes = sorted(earthquakes, key=lambda x: x.timestamp)
+            return EarthquakeBatch.concat(batches), events
+
+        except Exception as e:
+            logger.error(
+                f"Failed to parse earthquakes from {start_of_batch} to "
+                f"{end_of_batch}: {e}."
+            )
+            return None
+
+        finally:
+            body.close()
+            response.close()
+
+    @staticmethod
+    def _init_session(max_workers: int) -> requests.Session:
+        """
+        Creates an HTTP session with a connection per worker that retries
+        transient failures with exponential backoff.
+        """
+        retries = Retry(
+            total=5,
+            backoff_factor=1,
+            status_forcelist=[429, 500, 502, 503, 504],
+        )
+        adapter = HTTPAdapter(pool_maxsize=max_workers, max_retries=retries)
+
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+        return session
 
-            return earthquakes
+    @staticmethod
+    def _split_into_windows(
+        start_date: datetime, end_date: datetime, window_days: int
+    ) -> List[Window]:
+        """
+        Splits `[start_date, end_date)` into consecutive windows of `window_days`.
+
+        The windows are aligned to multiples of `window_days` since the epoch, so
+        that every run queries the same past windows, which can then be cached.
+        Only the first and last windows may be shorter.
+        """
+        windows = []
+        window = timedelta(days=window_days)
+        epoch = datetime(1970, 1, 1, tzinfo=start_date.tzinfo)
+        start_of_window = start_date
+
+        while start_of_window < end_date:
+            end_of_window = min(
+                epoch + ((start_of_window - epoch) // window + 1) * window, end_date
+            )
+            windows.append((start_of_window, end_of_window))
+            start_of_window = end_of_window
+
+        return windows
 
     @staticmethod
-    def _init_from_to_dates(last_n_days: int) -> Tuple[datetime, datetime]:
+    def _split_in_two(window: Window) -> Tuple[Window, Window]:
+        """
+        Splits a window in two halves, rounding the midpoint to whole seconds
+        since that is the precision of the query.
+        """
+        start, end = window
+        half = timedelta(seconds=int((end - start).total_seconds() // 2))
+        middle = start + half
+
+        return (start, middle), (middle, end)
+
+    @staticmethod
+    def _init_from_to_dates(
+        last_n_days: int, start_date: Optional[datetime] = None
+    ) -> Tuple[datetime, datetime]:
         """
         Initializes the start and end dates for the query.
         """
-        end_date = datetime.now(timezone.utc).date()
-        start_date = end_date - timedelta(days=last_n_days)
+        end_date = datetime.now(timezone.utc).replace(microsecond=0)
+
+        if start_date is None:
+            start_date = end_date - timedelta(days=last_n_days)
+        else:
+            start_date = start_date.replace(microsecond=0)
 
         return start_date, end_date
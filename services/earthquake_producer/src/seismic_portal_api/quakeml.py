@@ -0,0 +1,122 @@
+from xml.etree import ElementTree
+
+from loguru import logger
+
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+# The raw fields of an event: time, region, magnitude, depth in kilometers,
+# latitude and longitude.
+EventFields = Tuple[str, str, str, float, str, str]
+
+
+def iter_events(stream: BinaryIO) -> Iterator[Optional[EventFields]]:
+    """
+    Incrementally parses a QuakeML document and yields the fields of each
+    `event` element, as soon as the element has been read from `stream`, or
+    None for an event with missing data, so that the events can be counted.
+
+    Every event is dropped from the tree once it has been converted, so memory
+    usage stays flat no matter how many events the document holds.
+
+    Args:
+        stream (BinaryIO): A file-like object with the QuakeML document, e.g. the
+            raw body of a streamed HTTP response.
+
+    Returns:
+        Iterator[Optional[EventFields]]: The fields of the events in document order.
+    """
+    event_parameters = None
+
+    for event, element in ElementTree.iterparse(stream, events=("start", "end")):
+        tag = _local_name(element.tag)
+
+        if event == "start":
+            if tag == "eventParameters":
+                event_parameters = element
+            continue
+
+        if tag != "event":
+            continue
+
+        fields = _to_event_fields(element)
+
+        if fields is None:
+            logger.warning(
+                f"Skipping earthquake with missing data: {element.get('publicID')}"
+            )
+
+        yield fields
+
+        # Release the events we have already converted
+        if event_parameters is not None:
+            event_parameters.clear()
+
+
+def _to_event_fields(event: ElementTree.Element) -> Optional[EventFields]:
+    """
+    Extracts the fields of a QuakeML `event` element, using the preferred
+    origin and magnitude when the event has more than one.
+    """
+    origin = _preferred(event, "origin", "preferredOriginID")
+    magnitude_element = _preferred(event, "magnitude", "preferredMagnitudeID")
+
+    if origin is None or magnitude_element is None:
+        return None
+
+    time_str = _find_text(origin, "time", "value")
+    region = _find_text(event, "description", "text")
+    magnitude = _find_text(magnitude_element, "mag", "value")
+    latitude = _find_text(origin, "latitude", "value")
+    longitude = _find_text(origin, "longitude", "value")
+    depth = _find_text(origin, "depth", "value")
+
+    if None in (time_str, region, magnitude, latitude, longitude, depth):
+        return None
+
+    # QuakeML depths are expressed in meters
+    try:
+        depth_km = float(depth) / 1000
+    except ValueError:
+        return None
+
+    return time_str, region, magnitude, depth_km, latitude, longitude
+
+
+def _preferred(
+    event: ElementTree.Element, tag: str, preferred_id_tag: str
+) -> Optional[ElementTree.Element]:
+    """
+    Returns the child `tag` whose publicID is referenced by `preferred_id_tag`,
+    falling back to the first `tag` child.
+    """
+    preferred_id = _find_text(event, preferred_id_tag)
+    first = None
+
+    for child in event:
+        if _local_name(child.tag) != tag:
+            continue
+        if preferred_id is None or child.get("publicID") == preferred_id:
+            return child
+        if first is None:
+            first = child
+
+    return first
+
+
+def _find_text(element: ElementTree.Element, *path: str) -> Optional[str]:
+    """
+    Follows `path` through the first child with each local name and returns
+    the text of the last one, ignoring XML namespaces.
+    """
+    for name in path:
+        element = next(
+            (child for child in element if _local_name(child.tag) == name), None
+        )
+        if element is None:
+            return None
+
+    return element.text
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
@@ -0,0 +1,253 @@
+import gzip
+import os
+import time
+import orjson
+import numpy as np
+import pandas as pd
+
+from loguru import logger
+from uuid import UUID
+
+from typing import BinaryIO, List
+from src.seismic_portal_api.earthquake import EarthquakeBatch
+from src.seismic_portal_api.decoders import DECODERS, properties_to_event_fields, to_batch
+from src.seismic_portal_api.utils import generate_earthquake_uuids
+
+# Decoders of the saved FDSN windows, by file extension
+WINDOW_DECODERS = {
+    ".xml": DECODERS["xml"],
+    ".quakeml": DECODERS["xml"],
+    ".json": DECODERS["json"],
+    ".geojson": DECODERS["json"],
+    ".txt": DECODERS["text"],
+}
+JSONL_EXTENSIONS = {".jsonl", ".ndjson"}
+PARQUET_EXTENSIONS = {".parquet"}
+
+# Columns an archive of produced earthquakes must have
+RECORD_COLUMNS = ["timestamp", "region", "magnitude", "depth", "latitude", "longitude"]
+
+
+class ReplayEarthquakes:
+    """
+    A class to replay the earthquakes of a local archive, in the order they
+    happened, without any network.
+
+    The archive is a file, or a directory whose files are all read, in any of
+    these formats, optionally gzipped:
+
+    - JSONL: one earthquake per line, either a Seismic Portal websocket message
+      or GeoJSON feature, or an earthquake as the producer writes it.
+    - Parquet: one earthquake per row, with the columns the producer writes.
+    - Saved FDSN windows: QuakeML (.xml), GeoJSON (.json) or FDSN text (.txt).
+
+    The earthquakes are handed out at `speedup` times the pace at which they
+    happened, e.g. 1 for real time or 100 to replay a day in under 15 minutes,
+    or as fast as possible if `speedup` is 0.
+    """
+
+    def __init__(self, path: str, speedup: float = 1.0, batch_size: int = 1000):
+        self.path = path
+        self.speedup = speedup
+        self.batch_size = batch_size
+
+        self.earthquakes = load_archive(path).sort_by_timestamp()
+        logger.info(f"Replaying {len(self.earthquakes)} earthquakes from {path}.")
+
+        # Position of the next earthquake to hand out, and the wall-clock and
+        # event times the replay started at
+        self._position = 0
+        self._wall_start = None
+        self._event_start = None
+
+    def is_done(self) -> bool:
+        """
+        Whether every earthquake of the archive has been returned.
+        """
+        return self._position >= len(self.earthquakes)
+
+    def get_earthquakes(self, timeout: float = 1.0) -> EarthquakeBatch:
+        """
+        Returns the next earthquakes that are due, at most `batch_size`.
+
+        Waits up to `timeout` seconds for the next earthquake to be due, and
+        returns an empty batch if it is not, so that the producer keeps serving
+        its delivery reports during the quiet periods of the replay.
+
+        Args:
+            timeout (float): How long to wait for an earthquake, in seconds.
+
+        Returns:
+            EarthquakeBatch: The earthquakes, in chronological order.
+        """
+        if self.is_done():
+            return EarthquakeBatch.empty()
+
+        timestamps = self.earthquakes.timestamp
+        end = min(self._position + self.batch_size, len(self.earthquakes))
+
+        if self.speedup > 0:
+            if self._wall_start is None:
+                self._wall_start = time.monotonic()
+                self._event_start = int(timestamps[self._position])
+
+            wait = self._due(timestamps[self._position]) - time.monotonic()
+
+            if wait > timeout:
+                time.sleep(timeout)
+                return EarthquakeBatch.empty()
+
+            if wait > 0:
+                time.sleep(wait)
+
+            # Every earthquake up to the replay clock is due
+            replay_clock = self._event_start + (
+                (time.monotonic() - self._wall_start) * 1000 * self.speedup
+            )
+            due = int(np.searchsorted(timestamps, replay_clock, side="right"))
+            end = min(end, max(due, self._position + 1))
+
+        earthquakes = self.earthquakes.take(np.arange(self._position, end))
+        self._position = end
+
+        if self.is_done():
+            logger.info(f"Replayed the {len(self.earthquakes)} earthquakes of {self.path}.")
+
+        return earthquakes
+
+    def _due(self, timestamp: int) -> float:
+        """
+        The wall-clock time at which the earthquake at `timestamp` is due.
+        """
+        return self._wall_start + (timestamp - self._event_start) / 1000 / self.speedup
+
+
+def load_archive(path: str) -> EarthquakeBatch:
+    """
+    Loads the earthquakes of an archive file, or of all the files of an archive
+    directory, in no particular order.
+
+    Args:
+        path (str): The archive file or directory.
+
+    Returns:
+        EarthquakeBatch: The earthquakes of the archive.
+    """
+    if os.path.isdir(path):
+        paths = sorted(
+            os.path.join(directory, name)
+            for directory, _, names in os.walk(path)
+            for name in names
+            if not name.startswith(".")
+        )
+    else:
+        paths = [path]
+
+    return EarthquakeBatch.concat([load_file(path) for path in paths])
+
+
+def load_file(path: str) -> EarthquakeBatch:
+    """
+    Loads the earthquakes of one archive file, whose format is given by its
+    extension, before any `.gz`.
+    """
+    name = path[:-3] if path.endswith(".gz") else path
+    extension = os.path.splitext(name)[1].lower()
+
+    if extension in PARQUET_EXTENSIONS:
+        return records_to_batch(pd.read_parquet(path))
+
+    if extension not in JSONL_EXTENSIONS and extension not in WINDOW_DECODERS:
+        raise ValueError(f"Unknown archive format: {path}")
+
+    with _open(path) as stream:
+        if extension in JSONL_EXTENSIONS:
+            return _load_jsonl(stream)
+
+        return WINDOW_DECODERS[extension].decode(stream)
+
+
+def records_to_batch(records: pd.DataFrame) -> EarthquakeBatch:
+    """
+    Builds a batch from earthquakes with the columns the producer writes. The
+    `datestr` and `uuid` columns are derived like the producer does if they are
+    missing.
+
+    Args:
+        records (pd.DataFrame): The earthquakes, one per row.
+
+    Returns:
+        EarthquakeBatch: The earthquakes, in the same order, without the ones
+            with invalid data.
+    """
+    missing = set(RECORD_COLUMNS) - set(records.columns)
+    if missing:
+        raise ValueError(f"Earthquakes without the columns {sorted(missing)}.")
+
+    timestamps = records["timestamp"]
+    if pd.api.types.is_datetime64_any_dtype(timestamps):
+        timestamps = (
+            pd.to_datetime(timestamps, utc=True) - pd.Timestamp(0, tz="UTC")
+        ) // pd.Timedelta(milliseconds=1)
+    timestamps = timestamps.to_numpy(dtype=np.int64)
+
+    if "datestr" in records.columns:
+        datestrs = records["datestr"].astype(str).to_numpy()
+    else:
+        datestrs = np.datetime_as_string(timestamps.astype("datetime64[ms]"), unit="D")
+
+    if "uuid" in records.columns:
+        uuids = [UUID(str(uuid)) for uuid in records["uuid"]]
+    else:
+        uuids = generate_earthquake_uuids(
+            records["region"].tolist(), timestamps.tolist(), records["magnitude"].tolist()
+        )
+
+    return EarthquakeBatch(
+        timestamp=timestamps,
+        datestr=datestrs,
+        region=records["region"].to_numpy(),
+        magnitude=records["magnitude"].to_numpy(),
+        depth=records["depth"].to_numpy(),
+        latitude=records["latitude"].to_numpy(),
+        longitude=records["longitude"].to_numpy(),
+        uuid=uuids,
+    ).drop_invalid()
+
+
+def _load_jsonl(stream: BinaryIO) -> EarthquakeBatch:
+    """
+    Loads a JSONL archive, whose lines are Seismic Portal messages or features,
+    or earthquakes as the producer writes them.
+    """
+    events = []
+    records: List[dict] = []
+
+    for line in stream:
+        if not line.strip():
+            continue
+
+        document = orjson.loads(line)
+        properties = document.get("data", document).get("properties", document)
+
+        if "timestamp" in properties:
+            records.append(properties)
+            continue
+
+        fields = properties_to_event_fields(properties)
+
+        if fields is None:
+            logger.warning(f"Skipping earthquake with missing data: {document}")
+            continue
+
+        events.append(fields)
+
+    batches = [to_batch(events)]
+    if records:
+        batches.append(records_to_batch(pd.DataFrame.from_records(records)))
+
+    return EarthquakeBatch.concat(batches)
+
+
+def _open(path: str) -> BinaryIO:
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
@@ -0,0 +1,230 @@
+import gzip
+import hashlib
+import io
+import os
+import tempfile
+import threading
+
+from loguru import logger
+
+from collections import OrderedDict
+from typing import BinaryIO, Optional
+from src import metrics
+
+
+class ResponseCache:
+    """
+    A local cache of raw FDSN responses, so that repeated backfills read the
+    windows they already downloaded from disk instead of the network.
+
+    Responses are stored gzipped under the SHA-256 of their query URL, which
+    holds the start, end, limit and format of the window. The cache is bounded
+    to `max_bytes` on disk, evicting the least recently used responses first.
+    Only cache responses that can no longer change, i.e. windows that ended in
+    the past.
+
+    The last use of a response is the modification time of its file, which is
+    touched on every read, so that the eviction order survives restarts.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 1024 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+
+        # Key -> size of its file, least recently used first
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def key(url: str) -> str:
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key: str) -> Optional["CachedResponse"]:
+        """
+        Returns the cached response of `key`, or None if it is not cached.
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                metrics.FDSN_CACHE_REQUESTS.labels("miss").inc()
+                return None
+
+            self.hits += 1
+            metrics.FDSN_CACHE_REQUESTS.labels("hit").inc()
+            self._entries.move_to_end(key)
+            size = self._entries[key]
+
+        path = self._path(key)
+
+        try:
+            os.utime(path)
+
+            # Windows without earthquakes are stored as empty files
+            if not size:
+                return CachedResponse(204, io.BytesIO())
+
+            return CachedResponse(200, gzip.open(path, "rb"))
+
+        except FileNotFoundError:
+            # Evicted by another worker in the meantime
+            return None
+
+    def record(self, key: str, body: BinaryIO) -> "CachingReader":
+        """
+        Returns a stream of `body` that writes a copy of it for the cache as it
+        is read. The copy is only added to the cache by `CachingReader.commit`,
+        once the body was parsed, and dropped if the stream is closed before.
+        """
+        return CachingReader(self, key, body)
+
+    def put_empty(self, key: str) -> None:
+        """
+        Caches the response of a window without earthquakes.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+
+        self._commit(key, tmp_path)
+
+    def _commit(self, key: str, tmp_path: str) -> None:
+        """
+        Moves a downloaded response into the cache, then evicts the least
+        recently used responses until the cache fits in `max_bytes`.
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+
+        with self._lock:
+            self._size += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+
+            evicted = []
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                old_key, old_size = self._entries.popitem(last=False)
+                self._size -= old_size
+                evicted.append(old_key)
+
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except FileNotFoundError:
+                pass
+
+        if evicted:
+            logger.debug(f"Evicted {len(evicted)} responses from the FDSN cache.")
+
+    def _load(self) -> None:
+        """
+        Indexes the responses already on disk, from the least recently used.
+        """
+        files = []
+
+        for directory, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".gz"):
+                    stat = os.stat(os.path.join(directory, name))
+                    files.append((stat.st_mtime, name[: -len(".gz")], stat.st_size))
+
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._size += size
+
+        logger.info(
+            f"Loaded {len(self._entries)} responses ({self._size} bytes) from the "
+            f"FDSN cache in {self.directory}."
+        )
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.gz")
+
+
+class CachedResponse:
+    """
+    A response read from the cache, with the parts of `requests.Response` that
+    `HistoricalEarthquakes` uses.
+    """
+
+    def __init__(self, status_code: int, raw: BinaryIO):
+        self.status_code = status_code
+        self.raw = raw
+
+    def raise_for_status(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.raw.close()
+
+
+class CachingReader(io.BufferedReader):
+    """
+    Reads a response body while writing a gzipped copy of it to a temporary
+    file, which `commit` adds to the cache.
+    """
+
+    def __init__(self, cache: ResponseCache, key: str, body: BinaryIO):
+        self.cache = cache
+        self.key = key
+
+        fd, self.tmp_path = tempfile.mkstemp(dir=cache.directory, suffix=".tmp")
+        self.tmp_file = os.fdopen(fd, "wb")
+        self.copy = gzip.GzipFile(fileobj=self.tmp_file, mode="wb")
+        self.committed = False
+
+        super().__init__(_Tee(body, self.copy))
+
+    def commit(self) -> None:
+        """
+        Reads the rest of the body, e.g. after the end of the document, and
+        adds the copy to the cache.
+        """
+        while self.raw.read(io.DEFAULT_BUFFER_SIZE):
+            pass
+
+        self.copy.close()
+        self.tmp_file.close()
+        self.cache._commit(self.key, self.tmp_path)
+        self.committed = True
+
+    def close(self) -> None:
+        if self.closed:
+            return
+
+        super().close()
+
+        if not self.committed:
+            self.copy.close()
+            self.tmp_file.close()
+            os.remove(self.tmp_path)
+
+
+class _Tee(io.RawIOBase):
+    """
+    A raw stream that reads from `source` and writes what it read to `sink`.
+    """
+
+    def __init__(self, source: BinaryIO, sink: BinaryIO):
+        self.source = source
+        self.sink = sink
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.source.read(len(buffer))
+        buffer[: len(data)] = data
+        self.sink.write(data)
+
+        return len(data)
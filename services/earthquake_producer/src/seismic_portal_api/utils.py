@@ -1,16 +1,25 @@
 from dateutil import parser
-from datetime import timezone
-from src.seismic_portal_api.earthquake import Earthquake
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 
+import numpy as np
 import uuid
 import hashlib
 
+from typing import List, Sequence, Union
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
 def to_ms(timestamp: str) -> int:
     """
     A function that transforms a UTC timestamp expressed
     as a string like this '2024-06-17T09:36:39.467866Z'
     into a timestamp expressed in milliseconds such as
-    1718616999000.
+    1718616999467.
+
+    Timestamps with that exact shape are parsed by slicing, everything else
+    falls back to `dateutil`. Timestamps without a timezone are taken as UTC.
 
     Args:
         timestamp (str): A timestamp expressed as a string.
@@ -18,22 +27,129 @@ def to_ms(timestamp: str) -> int:
     Returns:
         int: A timestamp expressed in milliseconds.
     """
+    if _is_utc_iso_timestamp(timestamp):
+        fraction = timestamp[20:-1]
+
+        return (
+            _days_since_epoch(timestamp[:10]) * 86_400_000
+            + int(timestamp[11:13]) * 3_600_000
+            + int(timestamp[14:16]) * 60_000
+            + int(timestamp[17:19]) * 1000
+            + (int((fraction + "00")[:3]) if fraction else 0)
+        )
+
+    parsed = parser.isoparse(timestamp)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+
+    return (parsed - EPOCH) // timedelta(milliseconds=1)
+
+
+def to_ms_batch(timestamps: Sequence[str]) -> List[int]:
+    """
+    A vectorized version of `to_ms` for a whole window of timestamps.
+
+    Timestamps shaped like '2024-06-17T09:36:39.467866Z' are converted at once
+    by numpy, the rest go through `to_ms` one by one.
+
+    Args:
+        timestamps (Sequence[str]): Timestamps expressed as strings.
+
+    Returns:
+        List[int]: The timestamps expressed in milliseconds, in the same order.
+    """
+    if all(_is_utc_iso_timestamp(timestamp) for timestamp in timestamps):
+        # numpy parses naive ISO timestamps as UTC, so we drop the trailing 'Z'
+        return (
+            np.array([timestamp[:-1] for timestamp in timestamps], dtype="datetime64[ms]")
+            .astype(np.int64)
+            .tolist()
+        )
+
+    return [to_ms(timestamp) for timestamp in timestamps]
 
-    timestamp = parser.isoparse(timestamp).astimezone(timezone.utc)
-    return int(timestamp.timestamp()) * 1000
 
-def generate_earthquake_uuid(region: str, timestamp: int, magnitude: float) -> str:
+def generate_earthquake_uuid(
+    region: str, timestamp: int, magnitude: Union[str, float]
+) -> uuid.UUID:
     """
     A function that generates a unique identifier for an earthquake.
 
+    The timestamp is truncated to whole seconds, which is the precision the
+    identifiers were originally generated with, so that an earthquake keeps the
+    same UUID now that timestamps have millisecond precision. The magnitude is
+    rounded to one decimal, so that every format yields the same UUID, e.g.
+    "2.30" in the FDSN text format and 2.3 in GeoJSON.
+
+    Args:
+        region (str): The region of the earthquake.
+        timestamp (int): The timestamp of the earthquake in milliseconds.
+        magnitude (Union[str, float]): The magnitude of the earthquake.
+
+    Returns:
+        uuid.UUID: A unique identifier (UUID) for the earthquake.
+    """
+    return uuid.UUID(
+        bytes=hashlib.md5(
+            f"{region}-{timestamp - timestamp % 1000}-{float(magnitude):.1f}".encode()
+        ).digest()
+    )
+
+
+def generate_earthquake_uuids(
+    regions: Sequence[str],
+    timestamps: Sequence[int],
+    magnitudes: Sequence[Union[str, float]],
+) -> List[uuid.UUID]:
+    """
+    A batched version of `generate_earthquake_uuid` that returns exactly the
+    same identifiers for a whole window of earthquakes.
+
     Args:
-        earthquake (Earthquake): An Earthquake model.
+        regions (Sequence[str]): The regions of the earthquakes.
+        timestamps (Sequence[int]): The timestamps of the earthquakes in milliseconds.
+        magnitudes (Sequence[Union[str, float]]): The magnitudes of the earthquakes.
 
     Returns:
-        str: A unique identifier (UUID) for the earthquake.
+        List[uuid.UUID]: The unique identifiers, in the same order.
     """
-    uuid_str = hashlib.md5(
-        f"{region}-{str(timestamp)}-{str(magnitude)}".encode()
-    ).hexdigest()
+    md5 = hashlib.md5
+    UUID = uuid.UUID
 
-    return uuid.UUID(hex=uuid_str)
+    return [
+        UUID(
+            bytes=md5(
+                f"{region}-{timestamp - timestamp % 1000}-{float(magnitude):.1f}".encode()
+            ).digest()
+        )
+        for region, timestamp, magnitude in zip(regions, timestamps, magnitudes)
+    ]
+
+
+def _is_utc_iso_timestamp(timestamp: str) -> bool:
+    """
+    Whether `timestamp` looks like 'YYYY-MM-DDTHH:MM:SS[.ffffff]Z'.
+    """
+    return (
+        len(timestamp) >= 20
+        and timestamp[-1] == "Z"
+        and timestamp[4] == "-"
+        and timestamp[7] == "-"
+        and timestamp[10] == "T"
+        and timestamp[13] == ":"
+        and timestamp[16] == ":"
+        and timestamp[19] in ".Z"
+    )
+
+
+@lru_cache(maxsize=4096)
+def _days_since_epoch(date_str: str) -> int:
+    """
+    Number of days between 1970-01-01 and a 'YYYY-MM-DD' date. Events of the
+    same window share few dates, so the result is cached.
+    """
+    return (
+        datetime(int(date_str[0:4]), int(date_str[5:7]), int(date_str[8:10]))
+        .toordinal()
+        - EPOCH.toordinal()
+    )
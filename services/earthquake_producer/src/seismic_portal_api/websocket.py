@@ -1,33 +1,86 @@
+import asyncio
 import json
-import ssl
+import queue
+import random
+import threading
 
 from loguru import logger
-from websocket import create_connection
-from src.seismic_portal_api.earthquake import Earthquake
-from src.seismic_portal_api.utils import to_ms, generate_earthquake_uuid
+from tornado.httpclient import HTTPRequest
+from tornado.websocket import websocket_connect
+
+from datetime import datetime, timezone
+from typing import List, Optional
+from src import metrics
+from src.seismic_portal_api.earthquake import EarthquakeBatch
+from src.seismic_portal_api.decoders import properties_to_event_fields, to_batch
+from src.seismic_portal_api.historical_data import HistoricalEarthquakes
 
 
 class SeismicPortalAPI:
     """
     Class that interacts with the Seismic Portal API.
+
+    The websocket is read by an asyncio client running in a background thread,
+    which hands the decoded earthquakes to `get_earthquakes` through a bounded
+    queue, so that reading the socket overlaps with producing to Kafka. The
+    client keeps the connection alive with pings, reconnects with exponential
+    backoff, and after a reconnect backfills the earthquakes it missed from the
+    FDSN query endpoint.
+
+    An earthquake can be published after others with a later origin time, so
+    the backfill starts `backfill_margin_sec` before the latest earthquake we
+    received. The earthquakes we already had are dropped by the dedup cache of
+    the producer.
     """
 
     URL = "wss://www.seismicportal.eu/standing_order/websocket"
 
-    def __init__(self):
-        logger.info("Connecting to websocket.")
-        self._ws = create_connection(self.URL, sslopt={"cert_reqs": ssl.CERT_NONE})
-        logger.info("Successfully connected to the websocket.")
+    def __init__(
+        self,
+        queue_size: int = 1000,
+        ping_interval_sec: float = 30,
+        min_backoff_sec: float = 1,
+        max_backoff_sec: float = 60,
+        backfill_margin_sec: float = 60 * 60,
+        fdsn_formats: Optional[List[str]] = None,
+    ):
+        self.ping_interval_sec = ping_interval_sec
+        self.min_backoff_sec = min_backoff_sec
+        self.max_backoff_sec = max_backoff_sec
+        self.backfill_margin_sec = backfill_margin_sec
+        self.fdsn_formats = fdsn_formats
 
-    def get_earthquakes(self) -> Earthquake:
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+
+        # Timestamp of the latest earthquake we received, which the backfill
+        # after a reconnect starts from, minus the margin
+        self._last_timestamp: Optional[int] = None
+
+        self._thread = threading.Thread(
+            target=lambda: asyncio.run(self._listen()),
+            name="seismic-portal-websocket",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def is_done(self) -> bool:
+        """
+        The live feed never runs out of earthquakes.
+        """
+        return False
+
+    def get_earthquakes(self, timeout: float = 1.0) -> EarthquakeBatch:
         """
         Fetches the earthquake data from the Seismic Portal Websocket API.
 
+        Waits up to `timeout` seconds for the first earthquake, then returns it
+        together with any other earthquake that is already queued.
+
         Args:
-            None
+            timeout (float): How long to wait for an earthquake, in seconds.
 
         Returns:
-            Earthquake: An Earthquake model with the format:
+            EarthquakeBatch: A batch of earthquakes, each row with the format:
                 {
                     "timestamp": 1721270674000,
                     "datestr": 2024-07-18,
@@ -38,32 +91,124 @@ class SeismicPortalAPI:
                     "longitude": 26.07
                 }
         """
-        logger.info("Listening...")
-        msg = self._ws.recv()
-        msg = json.loads(msg)
+        try:
+            batches = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return EarthquakeBatch.empty()
 
-        logger.debug("Received data.")
+        while True:
+            try:
+                batches.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return EarthquakeBatch.concat(batches)
+
+    async def _listen(self) -> None:
+        """
+        Reads the websocket forever, reconnecting whenever the connection drops.
+        """
+        backoff_sec = self.min_backoff_sec
+
+        while True:
+            try:
+                logger.info("Connecting to websocket.")
+                connection = await websocket_connect(
+                    HTTPRequest(self.URL, validate_cert=False),
+                    ping_interval=self.ping_interval_sec,
+                    ping_timeout=self.ping_interval_sec,
+                )
+                logger.info("Successfully connected to the websocket.")
+                backoff_sec = self.min_backoff_sec
+
+                if self._last_timestamp is not None:
+                    await self._backfill()
+
+                while True:
+                    msg = await connection.read_message()
+
+                    # read_message returns None once the connection is closed
+                    if msg is None:
+                        raise ConnectionError("the server closed the connection")
 
-        msg_contents = msg["data"]["properties"]
+                    try:
+                        with metrics.PARSE_SECONDS.labels("websocket").time():
+                            earthquakes = self._decode(msg)
+                    except (KeyError, TypeError, ValueError) as e:
+                        logger.warning(f"Skipping malformed message: {e}")
+                        continue
 
-        region = msg_contents["flynn_region"]
-        timestamp = to_ms(msg_contents["time"])
-        magnitude = msg_contents["mag"]
+                    await self._put(earthquakes)
 
-        uuid = generate_earthquake_uuid(
-            region,
-            timestamp,
-            magnitude,
+            except Exception as e:
+                # Add some jitter so that restarted replicas do not reconnect in lockstep
+                delay_sec = backoff_sec * random.uniform(1, 1.5)
+                logger.warning(
+                    f"Websocket connection lost: {e}. Reconnecting in {delay_sec:.1f} seconds."
+                )
+                await asyncio.sleep(delay_sec)
+                backoff_sec = min(backoff_sec * 2, self.max_backoff_sec)
+
+    async def _backfill(self) -> None:
+        """
+        Queries the FDSN endpoint for the earthquakes from `backfill_margin_sec`
+        before the latest one we received, to get the ones we missed while
+        disconnected.
+        """
+        start_date = datetime.fromtimestamp(
+            self._last_timestamp / 1000 - self.backfill_margin_sec, timezone.utc
+        )
+        logger.info(f"Backfilling earthquakes since {start_date}.")
+
+        historical = HistoricalEarthquakes(
+            max_workers=1, formats=self.fdsn_formats, start_date=start_date
         )
-        earthquake = Earthquake(
-            timestamp=timestamp,
-            datestr=msg_contents["time"][:10],
-            latitude=msg_contents["lat"],
-            longitude=msg_contents["lon"],
-            depth=msg_contents["depth"],
-            magnitude=magnitude,
-            region=region,
-            uuid=uuid,
+
+        # Closed even if the connection drops again before the backfill is done,
+        # so that reconnects do not leak its workers and connections
+        try:
+            while not historical.is_done():
+                earthquakes = await asyncio.to_thread(historical.get_earthquakes)
+                await self._put(earthquakes)
+
+        finally:
+            historical.close()
+
+        # The live feed goes on, so we do not stop on the windows we could not
+        # download, but their earthquakes are missing
+        if historical.failed_windows:
+            logger.error(
+                f"Failed to backfill {len(historical.failed_windows)} windows after "
+                f"the reconnect: {historical.failed_windows}. Their earthquakes are "
+                "missing from the live feed."
+            )
+
+    async def _put(self, earthquakes: EarthquakeBatch) -> None:
+        """
+        Hands a batch over to `get_earthquakes`, waiting for room in the queue
+        without blocking the event loop, so that pings keep being answered.
+        """
+        if len(earthquakes) == 0:
+            return
+
+        self._last_timestamp = max(
+            self._last_timestamp or 0, int(earthquakes.timestamp.max())
         )
+        await asyncio.to_thread(self._queue.put, earthquakes)
+
+    @staticmethod
+    def _decode(msg: str) -> EarthquakeBatch:
+        """
+        Decodes a websocket message into a batch with one earthquake.
+        """
+        msg = json.loads(msg)
+
+        logger.debug("Received data.")
+
+        fields = properties_to_event_fields(msg["data"]["properties"])
+
+        if fields is None:
+            logger.warning(f"Skipping earthquake with missing data: {msg}")
+            return EarthquakeBatch.empty()
 
-        return [earthquake]
+        return to_batch([fields])
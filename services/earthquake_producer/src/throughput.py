@@ -0,0 +1,80 @@
+import time
+
+from loguru import logger
+from typing import Callable, Optional
+from confluent_kafka import KafkaError, Message
+
+from src import metrics
+
+
+class ThroughputMeter:
+    """
+    Counts the messages and bytes acknowledged by the broker and periodically
+    logs the throughput, instead of logging every message. The same counts,
+    and the time from each earthquake to its delivery, are exported as metrics.
+
+    Its `on_delivery` method is meant to be passed as the delivery callback of
+    `producer.produce`. The messages the broker rejects are also passed to
+    `on_failure`, if given.
+    """
+
+    def __init__(
+        self,
+        log_every_sec: float = 10.0,
+        on_failure: Optional[Callable[[Message], None]] = None,
+    ):
+        self.log_every_sec = log_every_sec
+        self.on_failure = on_failure
+
+        self.messages = 0
+        self.bytes = 0
+        self.failed = 0
+
+        self._last_log_time = time.monotonic()
+        self._last_log_messages = 0
+        self._last_log_bytes = 0
+
+    def on_delivery(self, err: Optional[KafkaError], msg: Message) -> None:
+        """
+        Delivery report callback, called from `producer.poll()` and
+        `producer.flush()` once the broker acknowledges or rejects a message.
+        """
+        if err is not None:
+            self.failed += 1
+            metrics.DELIVERY_FAILURES.inc()
+            logger.error(f"Failed to deliver message to {msg.topic()}: {err}")
+
+            if self.on_failure is not None:
+                self.on_failure(msg)
+        else:
+            size = len(msg.value() or b"") + len(msg.key() or b"")
+            self.messages += 1
+            self.bytes += size
+
+            metrics.PRODUCED.inc()
+            metrics.PRODUCED_BYTES.inc(size)
+            # The message timestamp is the time of the earthquake
+            metrics.observe_event_lag(metrics.EVENT_LAG_SECONDS, [msg.timestamp()[1]])
+
+        if time.monotonic() - self._last_log_time >= self.log_every_sec:
+            self.log()
+
+    def log(self) -> None:
+        """
+        Logs the throughput since the last call, and the running totals.
+        """
+        now = time.monotonic()
+        elapsed = max(now - self._last_log_time, 1e-9)
+
+        messages_per_sec = (self.messages - self._last_log_messages) / elapsed
+        bytes_per_sec = (self.bytes - self._last_log_bytes) / elapsed
+
+        logger.info(
+            f"Produced {messages_per_sec:.1f} msgs/s, {bytes_per_sec:.1f} bytes/s. "
+            f"Total: {self.messages} messages, {self.bytes} bytes, "
+            f"{self.failed} failed."
+        )
+
+        self._last_log_time = now
+        self._last_log_messages = self.messages
+        self._last_log_bytes = self.bytes
@@ -0,0 +1,98 @@
+"""
+The binary wire format of the messages of the earthquake topic, an
+alternative to JSON that is about a third of its size.
+
+Version 1 is a fixed-size little-endian header followed by the region:
+
+    version      uint8    1
+    timestamp    int64    milliseconds since the epoch
+    magnitude    float64
+    depth        float64
+    latitude     float64
+    longitude    float64
+    uuid         16 bytes
+    datestr      int32    days since the epoch of the "YYYY-MM-DD" date
+    region_size  uint16   size of the region, in bytes
+    region       utf-8
+
+Every message carries a `content-type` header, so that consumers can read
+JSON and binary messages from the same topic while we migrate. The seismic
+data sink and the features service have copies of the decoder, keep them in
+sync. `make bench` checks that they decode this encoder's messages, see
+`benchmarks/wire_check.py`, and the `tests/test_wire_format.py` of each service
+decode the same fixed messages.
+"""
+
+import json
+import struct
+
+from datetime import date
+from typing import Any, Dict, List, Tuple
+from uuid import UUID
+
+CONTENT_TYPE_HEADER = "content-type"
+CONTENT_TYPE_JSON = b"application/json"
+CONTENT_TYPE_BINARY = b"application/x-earthquake"
+
+VERSION = 1
+
+_HEADER = struct.Struct("<Bqdddd16siH")
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def content_type(wire_format: str) -> bytes:
+    """
+    Returns the content type of the messages written in `wire_format`.
+    """
+    return CONTENT_TYPE_BINARY if wire_format == "binary" else CONTENT_TYPE_JSON
+
+
+def headers(wire_format: str) -> List[Tuple[str, bytes]]:
+    """
+    Returns the Kafka headers of the messages written in `wire_format`.
+    """
+    return [(CONTENT_TYPE_HEADER, content_type(wire_format))]
+
+
+def encode(earthquake: Dict[str, Any]) -> bytes:
+    """
+    Encodes an earthquake, as returned by `EarthquakeBatch.to_records`, in the
+    binary wire format.
+
+    Args:
+        earthquake (Dict[str, Any]): The earthquake to encode.
+
+    Returns:
+        bytes: The encoded earthquake.
+    """
+    region = earthquake["region"].encode("utf-8")
+
+    return (
+        _HEADER.pack(
+            VERSION,
+            earthquake["timestamp"],
+            earthquake["magnitude"],
+            earthquake["depth"],
+            earthquake["latitude"],
+            earthquake["longitude"],
+            earthquake["uuid"].bytes,
+            date.fromisoformat(earthquake["datestr"]).toordinal() - _EPOCH_ORDINAL,
+            len(region),
+        )
+        + region
+    )
+
+
+def decode_uuid_and_timestamp(value: bytes) -> Tuple[UUID, int]:
+    """
+    Returns the UUID and the timestamp of the earthquake of a message, in JSON
+    or in the binary wire format. The format is told by the first byte, since
+    the delivery reports of the producer have no headers.
+    """
+    if value[:1] == b"{":
+        earthquake = json.loads(value)
+        return UUID(earthquake["uuid"]), earthquake["timestamp"]
+
+    _, timestamp, _, _, _, _, uuid, _, _ = _HEADER.unpack_from(value)
+
+    return UUID(bytes=uuid), timestamp
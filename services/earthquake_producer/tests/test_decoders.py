@@ -0,0 +1,71 @@
+import io
+
+import orjson
+
+from src.seismic_portal_api.decoders import DECODERS, properties_to_event_fields, to_batch
+from src.seismic_portal_api.utils import generate_earthquake_uuid
+
+# The same earthquake in each format of the FDSN event service, with its
+# magnitude written as each format writes it
+TEXT = b"""#EventID|Time|Latitude|Longitude|Depth/km|Author|Catalog|Contributor|ContributorID|MagType|Magnitude|MagAuthor|EventLocationName
+20240716_0000123|2024-07-16T22:15:30.64|32.8632|-116.1513|7.9|SCSN|EMSC-RTS|SCSN|123|ml|2.30|SCSN|SOUTHERN CALIFORNIA
+"""
+
+PROPERTIES = {
+    "time": "2024-07-16T22:15:30.64Z",
+    "flynn_region": "SOUTHERN CALIFORNIA",
+    "mag": 2.3,
+    "depth": 7.9,
+    "lat": 32.8632,
+    "lon": -116.1513,
+}
+
+GEOJSON = orjson.dumps(
+    {"type": "FeatureCollection", "features": [{"properties": PROPERTIES}]}
+)
+
+QUAKEML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<q:quakeml xmlns="http://quakeml.org/xmlns/bed/1.2" xmlns:q="http://quakeml.org/xmlns/quakeml/1.2">
+  <eventParameters publicID="smi:eu.emsc/query">
+    <event publicID="smi:eu.emsc/20240716_0000123">
+      <description><text>SOUTHERN CALIFORNIA</text></description>
+      <origin publicID="smi:eu.emsc/origin/1">
+        <time><value>2024-07-16T22:15:30.64Z</value></time>
+        <latitude><value>32.8632</value></latitude>
+        <longitude><value>-116.1513</value></longitude>
+        <depth><value>7900</value></depth>
+      </origin>
+      <magnitude publicID="smi:eu.emsc/magnitude/1">
+        <mag><value>2.3</value></mag>
+      </magnitude>
+    </event>
+  </eventParameters>
+</q:quakeml>
+"""
+
+
+def test_every_format_yields_the_same_uuid():
+    batches = {
+        "text": DECODERS["text"].decode(io.BytesIO(TEXT)),
+        "json": DECODERS["json"].decode(io.BytesIO(GEOJSON)),
+        "xml": DECODERS["xml"].decode(io.BytesIO(QUAKEML)),
+        "websocket": to_batch([properties_to_event_fields(PROPERTIES)]),
+    }
+
+    uuids = {name: list(batch.uuid) for name, batch in batches.items()}
+
+    assert all(len(batch) == 1 for batch in batches.values())
+    assert len({tuple(uuid) for uuid in uuids.values()}) == 1, uuids
+
+
+def test_uuid_ignores_how_the_magnitude_is_written():
+    timestamp = 1721168130640
+
+    assert (
+        generate_earthquake_uuid("REGION", timestamp, "2.30")
+        == generate_earthquake_uuid("REGION", timestamp, 2.3)
+        == generate_earthquake_uuid("REGION", timestamp, "2.3")
+    )
+    assert generate_earthquake_uuid("REGION", timestamp, 2.3) != generate_earthquake_uuid(
+        "REGION", timestamp, 2.4
+    )
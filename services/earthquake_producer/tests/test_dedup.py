@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta, timezone
+
+from src.dedup import DedupCache
+from src.seismic_portal_api.decoders import properties_to_event_fields, to_batch
+from src.seismic_portal_api.earthquake import EarthquakeBatch
+
+ORIGIN = datetime(2024, 7, 16, 22, 15, 30, tzinfo=timezone.utc)
+
+
+def batch(*minutes: int) -> EarthquakeBatch:
+    """
+    A batch with one earthquake per number of `minutes` after ORIGIN, the same
+    earthquake for the same number.
+    """
+    return to_batch(
+        [
+            properties_to_event_fields(
+                {
+                    "time": (ORIGIN + timedelta(minutes=m)).isoformat(),
+                    "flynn_region": "SOUTHERN CALIFORNIA",
+                    "mag": 2.3,
+                    "depth": 7.9,
+                    "lat": 32.8632,
+                    "lon": -116.1513,
+                }
+            )
+            for m in minutes
+        ]
+    )
+
+
+def test_drops_the_earthquakes_already_produced():
+    cache = DedupCache()
+
+    assert len(cache.filter(batch(0, 1))) == 2
+    assert list(cache.filter(batch(1, 2, 0)).uuid) == list(batch(2).uuid)
+    assert (cache.hits, cache.misses) == (2, 3)
+
+
+def test_evicts_the_least_recently_seen_beyond_max_size():
+    cache = DedupCache(max_size=2)
+
+    cache.filter(batch(0, 1))
+    cache.filter(batch(0))
+    cache.filter(batch(2))
+
+    # 1 was seen least recently, so it was evicted and is new again
+    assert len(cache.filter(batch(1))) == 1
+    assert len(cache.filter(batch(2))) == 0
+
+
+def test_evicts_after_the_ttl():
+    cache = DedupCache(ttl_sec=0)
+
+    cache.filter(batch(0))
+
+    assert len(cache.filter(batch(0))) == 1
+
+
+def test_forgotten_earthquakes_are_produced_again():
+    cache = DedupCache()
+    earthquakes = batch(0, 1)
+    cache.filter(earthquakes)
+
+    cache.forget(earthquakes.uuid[1], int(earthquakes.timestamp[1]))
+
+    assert list(cache.filter(earthquakes).uuid) == [earthquakes.uuid[1]]
+    assert cache.oldest_forgotten == int(earthquakes.timestamp[1])
+
+
+def test_survives_a_restart(tmp_path):
+    path = str(tmp_path / "dedup.json")
+    cache = DedupCache(path=path)
+    cache.filter(batch(0, 1))
+    cache.save()
+
+    restarted = DedupCache(path=path)
+
+    assert len(restarted) == 2
+    assert list(restarted.filter(batch(0, 1, 2)).uuid) == list(batch(2).uuid)
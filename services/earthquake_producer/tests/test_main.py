@@ -0,0 +1,65 @@
+from itertools import repeat
+from types import SimpleNamespace
+
+import pytest
+
+from confluent_kafka import KafkaError, KafkaException
+
+from src.main import commit_transaction
+
+
+class FakeProducer:
+    """
+    A transactional producer whose commits fail with `errors`, one per attempt,
+    and then succeed.
+    """
+
+    def __init__(self, errors):
+        self.errors = iter(errors)
+        self.commits = 0
+        self.aborts = 0
+        self._producer = SimpleNamespace(
+            commit_transaction=self._commit, abort_transaction=self._abort
+        )
+
+    def _commit(self, timeout):
+        self.commits += 1
+
+        error = next(self.errors, None)
+        if error is not None:
+            raise KafkaException(error)
+
+    def _abort(self, timeout):
+        self.aborts += 1
+
+
+def timed_out() -> KafkaError:
+    return KafkaError(KafkaError._TIMED_OUT, "timed out", retriable=True)
+
+
+def test_retries_a_retriable_commit():
+    producer = FakeProducer([timed_out(), timed_out()])
+
+    commit_transaction(producer, timeout=0)
+
+    assert (producer.commits, producer.aborts) == (3, 0)
+
+
+def test_aborts_once_retriable_errors_last_past_the_deadline():
+    producer = FakeProducer(repeat(timed_out()))
+
+    with pytest.raises(KafkaException):
+        commit_transaction(producer, timeout=0, max_retry_sec=0.01)
+
+    assert producer.aborts == 1
+
+
+def test_aborts_on_an_error_that_requires_it():
+    producer = FakeProducer(
+        [KafkaError(KafkaError._FENCED, "fenced", txn_requires_abort=True)]
+    )
+
+    with pytest.raises(KafkaException):
+        commit_transaction(producer, timeout=0)
+
+    assert (producer.commits, producer.aborts) == (1, 1)
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import threading
+import time
+
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from tornado.web import Application
+from tornado.websocket import WebSocketHandler
+
+from src.seismic_portal_api.historical_data import HistoricalEarthquakes
+from src.seismic_portal_api.websocket import SeismicPortalAPI
+
+TEXT_HEADER = (
+    "#EventID|Time|Latitude|Longitude|Depth/km|Author|Catalog|Contributor|"
+    "ContributorID|MagType|Magnitude|MagAuthor|EventLocationName\n"
+)
+
+
+def properties(origin: datetime, region: str) -> dict:
+    return {
+        "time": origin.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z",
+        "flynn_region": region,
+        "mag": 2.3,
+        "depth": 10.0,
+        "lat": 38.96,
+        "lon": 26.07,
+    }
+
+
+class FakeWebsocket:
+    """
+    Sends the messages of `connections[i]` on the i-th connection, then closes
+    every connection but the last one.
+    """
+
+    def __init__(self, connections: List[List[dict]]):
+        self.connections = connections
+        self.opened = 0
+        self._started = threading.Event()
+        threading.Thread(target=lambda: asyncio.run(self._serve()), daemon=True).start()
+        self._started.wait()
+
+    async def _serve(self) -> None:
+        server = self
+
+        class Handler(WebSocketHandler):
+            def open(self):
+                index = min(server.opened, len(server.connections) - 1)
+                server.opened += 1
+
+                for props in server.connections[index]:
+                    self.write_message(json.dumps({"data": {"properties": props}}))
+
+                if index < len(server.connections) - 1:
+                    self.close()
+
+        http_server = Application([(r"/", Handler)]).listen(0, "127.0.0.1")
+        self.port = next(iter(http_server._sockets.values())).getsockname()[1]
+        self._started.set()
+
+        await asyncio.Event().wait()
+
+
+class FakeFDSN:
+    """
+    Answers FDSN text queries with the earthquakes of `events` between the
+    `start` and `end` of the query, both included.
+    """
+
+    def __init__(self, events: List[dict]):
+        self.events = events
+        self.queries = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                server.queries.append(query)
+                body = server._render(query["start"][0], query["end"][0])
+
+                self.send_response(200 if body else 204)
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self.url = (
+            f"http://127.0.0.1:{self._server.server_port}/query?limit={{limit}}"
+            "&start={start_date}&end={end_date}&format={format}"
+        )
+
+    def _render(self, start: str, end: str) -> bytes:
+        lines = [
+            f"id|{props['time'].rstrip('Z')}|{props['lat']}|{props['lon']}|"
+            f"{props['depth']}|a|c|c|1|ml|{props['mag']}|a|{props['flynn_region']}\n"
+            for props in self.events
+            if start <= props["time"][:19] <= end
+        ]
+
+        return (TEXT_HEADER + "".join(lines)).encode() if lines else b""
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def fake_fdsn(monkeypatch):
+    servers = []
+
+    def start(events):
+        server = FakeFDSN(events)
+        monkeypatch.setattr(HistoricalEarthquakes, "URL", server.url)
+        servers.append(server)
+        return server
+
+    yield start
+
+    for server in servers:
+        server.stop()
+
+
+def receive(api: SeismicPortalAPI, count: int, timeout_sec: float = 20) -> List[str]:
+    regions = []
+    deadline = time.monotonic() + timeout_sec
+
+    while len(regions) < count and time.monotonic() < deadline:
+        regions.extend(api.get_earthquakes(timeout=0.1).region)
+
+    return regions
+
+
+def test_reconnect_backfills_earthquakes_published_late(monkeypatch, fake_fdsn):
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    first = properties(now - timedelta(minutes=10), "FIRST")
+    # Published while we were disconnected, with an earlier origin time than
+    # the latest earthquake we received
+    late = properties(now - timedelta(minutes=20), "LATE")
+    after = properties(now - timedelta(minutes=5), "AFTER RECONNECT")
+
+    fdsn = fake_fdsn([late, first])
+    websocket = FakeWebsocket([[first], [after]])
+    monkeypatch.setattr(SeismicPortalAPI, "URL", f"ws://127.0.0.1:{websocket.port}/")
+
+    api = SeismicPortalAPI(
+        min_backoff_sec=0.05, backfill_margin_sec=60 * 60, fdsn_formats=["text"]
+    )
+    regions = receive(api, count=4)
+
+    assert websocket.opened >= 2
+    assert regions[0] == "FIRST"
+    # The backfill starts before the first earthquake, which comes again and
+    # is left for the dedup cache of the producer
+    assert sorted(regions[1:3]) == ["FIRST", "LATE"]
+    assert regions[3] == "AFTER RECONNECT"
+    assert fdsn.queries[-1]["start"][0] <= late["time"][:19]
+
+
+def test_no_backfill_before_the_first_earthquake(monkeypatch, fake_fdsn):
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+
+    fdsn = fake_fdsn([properties(now - timedelta(minutes=20), "OLD")])
+    websocket = FakeWebsocket([[], [properties(now, "LIVE")]])
+    monkeypatch.setattr(SeismicPortalAPI, "URL", f"ws://127.0.0.1:{websocket.port}/")
+
+    api = SeismicPortalAPI(min_backoff_sec=0.05, fdsn_formats=["text"])
+
+    assert receive(api, count=1) == ["LIVE"]
+    assert fdsn.queries == []
@@ -0,0 +1,63 @@
+from uuid import UUID
+
+from quixstreams.models.serializers import JSONSerializer, SerializationContext
+
+from src import wire_format
+from src.partitioning import geohash
+
+# An earthquake as `EarthquakeBatch.to_records` returns it, and its messages in
+# each wire format. The seismic data sink and the features service decode the
+# same bytes in their `tests/test_wire_format.py`, keep the copies equal.
+EARTHQUAKE = {
+    "timestamp": 1721168130640,
+    "datestr": "2024-07-16",
+    "region": "SOUTHERN CALIFORNIA",
+    "magnitude": 2.3,
+    "depth": 7.9,
+    "latitude": 32.8632,
+    "longitude": -116.1513,
+    "uuid": UUID("16601f82-2b8d-e4b5-a104-4caa6256c027"),
+}
+
+BINARY = bytes.fromhex(
+    "0150729dbd9001000066666666666602409a99999999991f401ff46c567d6e4040a1f831e6ae"
+    "095dc016601f822b8de4b5a1044caa6256c027d04d00001300534f55544845524e2043414c49"
+    "464f524e4941"
+)
+
+JSON = (
+    b'{"timestamp":1721168130640,"datestr":"2024-07-16","region":"SOUTHERN '
+    b'CALIFORNIA","magnitude":2.3,"depth":7.9,"latitude":32.8632,"longitude":'
+    b'-116.1513,"uuid":"16601f82-2b8d-e4b5-a104-4caa6256c027"}'
+)
+
+# Points, a precision and their geohash, which the features service computes
+# again for its cells
+GEOHASHES = [
+    (32.8632, -116.1513, 1, "9"),
+    (32.8632, -116.1513, 2, "9m"),
+    (32.8632, -116.1513, 3, "9mv"),
+    (32.8632, -116.1513, 5, "9mv6u"),
+    (-33.8688, 151.2093, 5, "r3gx2"),
+    (0.0, 0.0, 3, "s00"),
+    (90.0, 180.0, 3, "zzz"),
+]
+
+
+def test_encodes_the_messages_the_consumers_decode():
+    context = SerializationContext("earthquakes", "value")
+
+    assert wire_format.encode(EARTHQUAKE) == BINARY
+    assert JSONSerializer()(EARTHQUAKE, context) == JSON
+
+
+def test_decodes_the_uuid_and_timestamp_of_either_format():
+    expected = (EARTHQUAKE["uuid"], EARTHQUAKE["timestamp"])
+
+    assert wire_format.decode_uuid_and_timestamp(BINARY) == expected
+    assert wire_format.decode_uuid_and_timestamp(JSON) == expected
+
+
+def test_geohash():
+    for latitude, longitude, precision, expected in GEOHASHES:
+        assert geohash(latitude, longitude, precision) == expected
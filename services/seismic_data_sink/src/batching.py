@@ -0,0 +1,187 @@
+import bisect
+import threading
+import time
+
+from abc import ABC, abstractmethod
+from loguru import logger
+from typing import Dict, List
+
+
+class Histogram:
+    """
+    A fixed-bucket histogram, counting the observations that fall under each
+    upper bound, and over the last one.
+    """
+
+    def __init__(self, name: str, bounds: List[float]):
+        self.name = name
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+
+    def __str__(self) -> str:
+        labels = [f"<={bound}" for bound in self.bounds] + [f">{self.bounds[-1]}"]
+        buckets = ", ".join(
+            f"{label}: {count}" for label, count in zip(labels, self.counts) if count
+        )
+        observations = sum(self.counts)
+        mean = self.total / observations if observations else 0.0
+
+        return f"{self.name}: mean={mean:.3f} [{buckets}]"
+
+
+class BatchingPolicy(ABC):
+    """
+    Decides when the sink's buffer is flushed to the feature store, and keeps
+    histograms of the size and latency of the flushes.
+    """
+
+    def __init__(self, log_every_sec: float = 60):
+        self.log_every_sec = log_every_sec
+
+        self.flush_sizes = Histogram(
+            "flush size (rows)", [1, 10, 100, 1000, 10_000, 100_000]
+        )
+        self.flush_latencies = Histogram(
+            "flush latency (s)", [0.01, 0.1, 0.5, 1, 5, 10, 60]
+        )
+        self._last_log_time = time.monotonic()
+
+        # Flushes are recorded by the writer thread
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def should_flush(self, rows: int, nbytes: int, age_sec: float) -> bool:
+        """
+        Whether to flush a buffer.
+
+        Args:
+            rows (int): The number of messages in the buffer.
+            nbytes (int): The size of the messages in the buffer, in bytes.
+            age_sec (float): Seconds since the oldest message entered the buffer.
+
+        Returns:
+            bool: Whether the buffer should be flushed now.
+        """
+
+    def record_flush(self, rows: int, latency_sec: float) -> None:
+        """
+        Records that a flush of `rows` rows took `latency_sec` seconds to write.
+        """
+        with self._lock:
+            self.flush_sizes.observe(rows)
+            self.flush_latencies.observe(latency_sec)
+
+            if time.monotonic() - self._last_log_time >= self.log_every_sec:
+                logger.info(str(self.flush_sizes))
+                logger.info(str(self.flush_latencies))
+                self._last_log_time = time.monotonic()
+
+
+class ThresholdPolicy(BatchingPolicy):
+    """
+    Flushes when the buffer reaches `max_rows` messages or `max_bytes` bytes,
+    or when its oldest message is `max_age_sec` seconds old.
+    """
+
+    def __init__(
+        self,
+        max_rows: int,
+        max_bytes: int,
+        max_age_sec: float,
+        log_every_sec: float = 60,
+    ):
+        super().__init__(log_every_sec)
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_age_sec = max_age_sec
+
+    def should_flush(self, rows: int, nbytes: int, age_sec: float) -> bool:
+        if rows == 0:
+            return False
+
+        return (
+            rows >= self.max_rows
+            or nbytes >= self.max_bytes
+            or age_sec >= self.max_age_sec
+        )
+
+
+class AdaptivePolicy(ThresholdPolicy):
+    """
+    A ThresholdPolicy whose row threshold tunes itself between `min_rows` and
+    `max_rows`.
+
+    The threshold starts at `min_rows` and doubles as long as the insert latency
+    per row keeps improving by more than `tolerance`, and halves when a smaller
+    batch was measured to be cheaper per row. Only flushes that reached the row
+    threshold are taken into account, since the ones triggered by age or size
+    say nothing about it. This gives large batches during backfills, while the
+    age threshold keeps live data fresh.
+    """
+
+    def __init__(
+        self,
+        min_rows: int,
+        max_rows: int,
+        max_bytes: int,
+        max_age_sec: float,
+        tolerance: float = 0.1,
+        log_every_sec: float = 60,
+    ):
+        super().__init__(max_rows, max_bytes, max_age_sec, log_every_sec)
+        self.min_rows = min_rows
+        self.tolerance = tolerance
+        self.target_rows = min_rows
+
+        # Moving average of the insert latency per row, by row threshold
+        self._latency_per_row: Dict[int, float] = {}
+
+    def should_flush(self, rows: int, nbytes: int, age_sec: float) -> bool:
+        if rows == 0:
+            return False
+
+        return (
+            rows >= self.target_rows
+            or nbytes >= self.max_bytes
+            or age_sec >= self.max_age_sec
+        )
+
+    def record_flush(self, rows: int, latency_sec: float) -> None:
+        super().record_flush(rows, latency_sec)
+
+        with self._lock:
+            target = self.target_rows
+
+            if rows < target:
+                return
+
+            latency_per_row = latency_sec / rows
+            previous = self._latency_per_row.get(target)
+            self._latency_per_row[target] = (
+                latency_per_row
+                if previous is None
+                else 0.5 * previous + 0.5 * latency_per_row
+            )
+            current = self._latency_per_row[target]
+
+            bigger = min(target * 2, self.max_rows)
+            smaller = max(target // 2, self.min_rows)
+
+            if bigger != target and (
+                bigger not in self._latency_per_row
+                or self._latency_per_row[bigger] < current * (1 - self.tolerance)
+            ):
+                self.target_rows = bigger
+
+            elif smaller != target and self._latency_per_row.get(
+                smaller, float("inf")
+            ) < current * (1 - self.tolerance):
+                self.target_rows = smaller
+
+            if self.target_rows != target:
+                logger.info(f"Changed the flush size from {target} to {self.target_rows} rows.")
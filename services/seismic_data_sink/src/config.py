@@ -14,8 +14,24 @@ class Config(BaseSettings):
 
     create_new_consumer_group: Optional[bool] = False
 
-    hopsworks_project_name: str
-    hopsworks_api_key: str
+    hopsworks_project_name: Optional[str] = None
+    hopsworks_api_key: Optional[str] = None
+
+    # write to an in-memory stub of Hopsworks, to run the sink offline
+    use_hopsworks_stub: Optional[bool] = False
+
+    # where the data is written: "hopsworks", or "parquet" for a local store of
+    # Parquet files partitioned by datestr under `parquet_store_path`, e.g. to
+    # land historical backfills at disk speed
+    sink_backend: str = "hopsworks"
+    parquet_store_path: str = "data/offline_store"
+
+    # Parquet store: how often partitions with at least
+    # `parquet_compact_min_files` files are compacted into one, and how long the
+    # files they replace are kept for the readers still using them
+    parquet_compact_every_sec: float = 60
+    parquet_compact_min_files: int = 8
+    parquet_retention_sec: float = 600
 
     # buffer size to store messages in memory before writing
     # to the feature store
@@ -23,7 +39,34 @@ class Config(BaseSettings):
     partition_key: str = "datestr"
 
     # force save to feature store every n seconds
-    save_every_n_sec: int = 1
+    save_every_n_sec: float = 1
+
+    # size of the messages in the buffer, in bytes, that triggers a write
+    buffer_max_bytes: int = 64 * 1024 * 1024
+
+    # "threshold" writes at the thresholds above. "adaptive" tunes the number of
+    # messages per write between `adaptive_min_buffer_size` and `buffer_size`,
+    # growing it while the insert time per message keeps improving.
+    batching_policy: str = "threshold"
+    adaptive_min_buffer_size: int = 100
+
+    # number of consumer processes in the consumer group, at most the number of
+    # partitions of the topic
+    num_workers: int = 1
+
+    # how often to log the lag of each partition
+    log_lag_every_sec: int = 30
+
+    # port of the Prometheus metrics endpoint, off if not set. With several
+    # workers, each one uses the next port.
+    metrics_port: Optional[int] = None
+
+    # maximum number of messages read from Kafka in one call
+    consume_batch_size: int = 500
+
+    # number of full buffers of a partition that can wait to be written to the
+    # feature store before we stop consuming that partition
+    max_pending_flushes: int = 2
 
     @field_validator("live_or_historical")
     @classmethod
@@ -34,5 +77,23 @@ class Config(BaseSettings):
         }, f"Invalid value for live_or_historical: {value}"
         return value
 
+    @field_validator("sink_backend")
+    @classmethod
+    def validate_sink_backend(cls, value):
+        assert value in {
+            "hopsworks",
+            "parquet",
+        }, f"Invalid value for sink_backend: {value}"
+        return value
+
+    @field_validator("batching_policy")
+    @classmethod
+    def validate_batching_policy(cls, value):
+        assert value in {
+            "threshold",
+            "adaptive",
+        }, f"Invalid value for batching_policy: {value}"
+        return value
+
 
 config = Config()
@@ -0,0 +1,271 @@
+import time
+
+import orjson
+import pandas as pd
+
+from collections import defaultdict
+from itertools import chain
+from loguru import logger
+from typing import Dict, List, Tuple
+
+from src import wire_format
+
+_NONE = type(None)
+_INT64_MIN, _INT64_MAX = -(2**63), 2**63 - 1
+
+
+class EarthquakeBatch:
+    """
+    A columnar buffer of the messages read from the Kafka topic.
+
+    Each message is appended field by field to one list per column, and the
+    DataFrame we write to the feature store is built once per batch, with
+    explicit dtypes for the Earthquake fields. Fields we do not know about,
+    e.g. the ones of aggregated topics, keep the dtype pandas infers for them.
+    """
+
+    DTYPES = {
+        "timestamp": "int64",
+        "datestr": "object",
+        "region": "object",
+        "magnitude": "float64",
+        "depth": "float64",
+        "latitude": "float64",
+        "longitude": "float64",
+        "uuid": "object",
+    }
+
+    # Python types the Earthquake fields of a JSON message may have, for them to
+    # convert to the DTYPES above. Only the timestamp is required.
+    JSON_TYPES = {
+        "timestamp": {int},
+        "datestr": {str, _NONE},
+        "region": {str, _NONE},
+        "magnitude": {int, float, _NONE},
+        "depth": {int, float, _NONE},
+        "latitude": {int, float, _NONE},
+        "longitude": {int, float, _NONE},
+        "uuid": {str, _NONE},
+    }
+
+    def __init__(self):
+        self.columns: Dict[str, List] = defaultdict(list)
+        self._length = 0
+
+        # Size of the messages, in bytes, and monotonic time of the first one
+        self.nbytes = 0
+        self._created_at = None
+
+    def append(self, record: dict, nbytes: int = 0) -> None:
+        """
+        Appends one message of `nbytes` bytes to the batch. Fields missing from
+        the message are filled with None.
+        """
+        if self._created_at is None:
+            self._created_at = time.monotonic()
+
+        self.nbytes += nbytes
+
+        for name, value in record.items():
+            column = self.columns[name]
+
+            # A field we see for the first time is missing from earlier rows
+            if len(column) < self._length:
+                column.extend([None] * (self._length - len(column)))
+
+            column.append(value)
+
+        self._length += 1
+
+        for column in self.columns.values():
+            if len(column) < self._length:
+                column.append(None)
+
+    def extend(self, records: List[dict]) -> None:
+        for record in records:
+            self.append(record)
+
+    def extend_json(self, values: List[bytes]) -> None:
+        """
+        Decodes a list of JSON messages and appends them to the batch, one
+        column at a time.
+
+        The messages are decoded with a single `orjson.loads` call, as one JSON
+        array, and each column is then filled with one list comprehension, so
+        that there is no Python work per message and field. If a message is
+        not a valid JSON object, e.g. a tombstone or a bare number, we fall
+        back to decoding them one by one and skip the invalid ones, so that
+        one bad message does not stop the sink. Messages whose Earthquake fields
+        have the wrong type, e.g. no timestamp or a string magnitude, are
+        skipped too, see `JSON_TYPES`.
+
+        Args:
+            values (List[bytes]): The values of the Kafka messages.
+        """
+        if not values:
+            return
+
+        try:
+            records = orjson.loads(b"[" + b",".join(values) + b"]")
+            columns = self._to_columns(records)
+        except (orjson.JSONDecodeError, TypeError, AttributeError):
+            records = self._decode_one_by_one(values)
+            columns = self._to_columns(records)
+
+        columns, rows = self._drop_invalid_rows(columns, rows=len(records))
+
+        self._extend_columns(
+            columns,
+            rows=rows,
+            nbytes=sum(len(value or b"") for value in values),
+        )
+
+    def extend_binary(self, values: List[bytes]) -> None:
+        """
+        Decodes a list of messages in the binary wire format of `src.wire_format`
+        and appends them to the batch. Invalid messages are skipped.
+
+        Args:
+            values (List[bytes]): The values of the Kafka messages.
+        """
+        if not values:
+            return
+
+        columns = wire_format.decode_columns(values)
+
+        self._extend_columns(
+            columns,
+            rows=len(columns["timestamp"]),
+            nbytes=sum(len(value) for value in values),
+        )
+
+    def _extend_columns(self, columns: Dict[str, List], rows: int, nbytes: int) -> None:
+        """
+        Appends `rows` rows, given as one list of values per field, to the batch.
+        """
+        if rows == 0:
+            return
+
+        if self._created_at is None:
+            self._created_at = time.monotonic()
+
+        self.nbytes += nbytes
+
+        for name, values in columns.items():
+            column = self.columns[name]
+
+            if len(column) < self._length:
+                column.extend([None] * (self._length - len(column)))
+
+            column.extend(values)
+
+        self._length += rows
+
+        for column in self.columns.values():
+            if len(column) < self._length:
+                column.extend([None] * (self._length - len(column)))
+
+    @staticmethod
+    def _to_columns(records: List[dict]) -> Dict[str, List]:
+        """
+        Transposes decoded messages into one list of values per field.
+        """
+        # Messages usually have the same fields, but some may have more or fewer
+        names = dict.fromkeys(chain.from_iterable(records))
+
+        return {name: [record.get(name) for record in records] for name in names}
+
+    @classmethod
+    def _drop_invalid_rows(
+        cls, columns: Dict[str, List], rows: int
+    ) -> Tuple[Dict[str, List], int]:
+        """
+        Drops the rows whose Earthquake fields do not have the types of
+        `JSON_TYPES`, or whose timestamp does not fit in an int64, so that they
+        do not fail the write of the whole batch.
+
+        The types of each column are checked at once, and the rows are only
+        checked one by one if a column has a value of the wrong type.
+        """
+        if rows == 0:
+            return columns, rows
+
+        columns.setdefault("timestamp", [None] * rows)
+        names = [name for name in cls.JSON_TYPES if name in columns]
+
+        if all(
+            set(map(type, columns[name])) <= cls.JSON_TYPES[name] for name in names
+        ):
+            timestamps = columns["timestamp"]
+
+            if _INT64_MIN <= min(timestamps) and max(timestamps) <= _INT64_MAX:
+                return columns, rows
+
+        valid, invalid = [], []
+        for i in range(rows):
+            if (
+                all(type(columns[name][i]) in cls.JSON_TYPES[name] for name in names)
+                and _INT64_MIN <= columns["timestamp"][i] <= _INT64_MAX
+            ):
+                valid.append(i)
+            else:
+                invalid.append(i)
+
+        example = {name: column[invalid[0]] for name, column in columns.items()}
+        logger.error(
+            f"Skipping {len(invalid)} messages whose fields have the wrong type, "
+            f"e.g. {example}"
+        )
+
+        columns = {
+            name: [column[i] for i in valid] for name, column in columns.items()
+        }
+
+        return columns, len(valid)
+
+    @staticmethod
+    def _decode_one_by_one(values: List[bytes]) -> List[dict]:
+        """
+        Decodes the messages one by one, skipping the ones that are not JSON
+        objects.
+        """
+        records = []
+
+        for value in values:
+            try:
+                record = orjson.loads(value)
+            except orjson.JSONDecodeError as e:
+                logger.error(f"Skipping message that is not valid JSON: {e}")
+                continue
+
+            if not isinstance(record, dict):
+                logger.error(f"Skipping message that is not a JSON object: {value[:100]!r}")
+                continue
+
+            records.append(record)
+
+        return records
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def age_sec(self) -> float:
+        """
+        Seconds since the first message was appended, 0 if the batch is empty.
+        """
+        if self._created_at is None:
+            return 0.0
+
+        return time.monotonic() - self._created_at
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Builds the DataFrame of the batch, with one typed column per field.
+        """
+        return pd.DataFrame(
+            {
+                name: pd.Series(column, dtype=self.DTYPES.get(name))
+                for name, column in self.columns.items()
+            }
+        )
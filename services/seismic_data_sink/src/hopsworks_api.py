@@ -1,65 +1,183 @@
-import hopsworks
-import pandas as pd
-from typing import List
+import threading
+import time
 
-from src.config import config
+from loguru import logger
+from typing import TYPE_CHECKING, Callable, Optional
 
+from src.earthquake_batch import EarthquakeBatch
+from src.sink_backend import SinkBackend
 
-def push_data_to_feature_store(
-    feature_group_name: str,
-    feature_group_version: int,
-    data: List[dict],
-    online_or_offline: str,
-    partition_key: str = "datestr",
-) -> None:
+if TYPE_CHECKING:
+    from hsfs.feature_group import FeatureGroup
+
+
+class HopsworksApi(SinkBackend):
     """
-    Pushes the given `data` to the feature store, writing it to the feature group
-    with name `feature_group_name` and version `feature_group_version`.
-
-    Args:
-        feature_group_name (str): The name of the feature group to write to.
-        feature_group_version (int): The version of the feature group to write to.
-        data (List[dict]): The data to write to the feature store.
-        online_or_offline (str): Whether we are saving the `data` to the online or offline
-        feature group
-
-    Returns:
-        None
+    A long-lived client for the feature group we write to.
+
+    The project, feature store and feature group are opened on the first push
+    and reused for every push after it. We only log in again when Hopsworks
+    rejects a request because the session expired.
+
+    The writers of the partitions push concurrently, so connecting, dropping
+    an expired feature group and the timings are guarded by a lock.
+
+    `hopsworks` is only imported when we connect without a `login`, so the
+    sink runs against the stub without it.
     """
-    # Authenticate with Hopsworks API
-    project = hopsworks.login(
-        project=config.hopsworks_project_name,
-        api_key_value=config.hopsworks_api_key,
-    )
-
-    # Get the feature store
-    feature_store = project.get_feature_store()
-
-    # Get or create the feature group we will be saving feature data to
-    # Get or create the 'transactions' feature group
-    feature_group = feature_store.get_or_create_feature_group(
-        name=feature_group_name,
-        version=feature_group_version,
-        description="Earthquake data from Seismic Portal",
-        primary_key=["uuid"],
-        partition_key=[partition_key],
-        event_time="timestamp",
-        online_enabled=True,
-        offline_backfill_every_hr=3,
-    )
-
-    # transform the data (dict) into a pandas dataframe
-    data = pd.DataFrame(data)
-
-    # Write the data to the feature group
-
-    feature_group.insert(
-        data,
-        overwrite=False,
-        operation="upsert",
-        write_options={
-            "start_offline_materialization": True
-            if online_or_offline == "offline"
-            else False
-        },
-    )
+
+    def __init__(
+        self,
+        api_key: str,
+        project_name: str,
+        feature_group_name: str,
+        feature_group_version: int,
+        partition_key: str = "datestr",
+        login: Optional[Callable] = None,
+    ):
+        self.api_key = api_key
+        self.project_name = project_name
+        self.feature_group_name = feature_group_name
+        self.feature_group_version = feature_group_version
+        self.partition_key = partition_key
+
+        # The `login` of a stub to run without Hopsworks, `hopsworks.login` if None
+        self._login = login
+        self._feature_group: Optional["FeatureGroup"] = None
+        self._lock = threading.Lock()
+
+        # timings, in seconds
+        self.connect_time_sec = 0.0
+        self.last_insert_time_sec = 0.0
+        self.insert_time_sec = 0.0
+        self.inserts = 0
+
+    def get_feature_group(self) -> "FeatureGroup":
+        """
+        Returns the feature group, connecting to Hopsworks if we have not yet.
+        """
+        with self._lock:
+            if self._feature_group is None:
+                self._connect()
+
+            return self._feature_group
+
+    def push_data_to_feature_store(
+        self,
+        data: EarthquakeBatch,
+        online_or_offline: str,
+    ) -> None:
+        """
+        Pushes the given `data` to the feature store, writing it to the feature group
+        with name `feature_group_name` and version `feature_group_version`.
+
+        Args:
+            data (EarthquakeBatch): The data to write to the feature store.
+            online_or_offline (str): Whether we are saving the `data` to the online or offline
+            feature group
+
+        Returns:
+            None
+        """
+        # transform the columnar batch into a pandas dataframe
+        data = data.to_dataframe()
+
+        feature_group = self.get_feature_group()
+
+        try:
+            self._insert(feature_group, data, online_or_offline)
+
+        except Exception as e:
+            if not self._session_expired(e):
+                raise
+
+            logger.info("Hopsworks session expired. Logging in again.")
+
+            with self._lock:
+                # Another writer may have logged in again already
+                if self._feature_group is feature_group:
+                    self._feature_group = None
+
+            self._insert(self.get_feature_group(), data, online_or_offline)
+
+    @staticmethod
+    def _session_expired(error: Exception) -> bool:
+        """
+        Whether `error` is the `RestAPIError` of a request Hopsworks rejected
+        because the session expired.
+        """
+        response = getattr(error, "response", None)
+
+        return getattr(response, "status_code", None) == 401
+
+    def _insert(
+        self, feature_group: "FeatureGroup", data, online_or_offline: str
+    ) -> None:
+        start = time.perf_counter()
+
+        # Write the data to the feature group
+        feature_group.insert(
+            data,
+            overwrite=False,
+            operation="upsert",
+            write_options={
+                "start_offline_materialization": True
+                if online_or_offline == "offline"
+                else False
+            },
+        )
+
+        elapsed_sec = time.perf_counter() - start
+
+        with self._lock:
+            self.last_insert_time_sec = elapsed_sec
+            self.insert_time_sec += elapsed_sec
+            self.inserts += 1
+            average_sec = self.insert_time_sec / self.inserts
+
+        logger.info(
+            f"Inserted {len(data)} rows in {elapsed_sec:.3f}s. "
+            f"Average insert time: {average_sec:.3f}s, "
+            f"connect time: {self.connect_time_sec:.3f}s."
+        )
+
+    def _connect(self) -> None:
+        """
+        Logs in to Hopsworks and gets or creates the feature group we write to.
+        """
+        start = time.perf_counter()
+
+        logger.info(f"Connecting to Hopsworks. Project name: {self.project_name}")
+
+        login = self._login
+        if login is None:
+            import hopsworks
+
+            login = hopsworks.login
+
+        # Authenticate with Hopsworks API
+        project = login(
+            project=self.project_name,
+            api_key_value=self.api_key,
+        )
+
+        # Get the feature store
+        feature_store = project.get_feature_store()
+
+        # Get or create the feature group we will be saving feature data to
+        self._feature_group = feature_store.get_or_create_feature_group(
+            name=self.feature_group_name,
+            version=self.feature_group_version,
+            description="Earthquake data from Seismic Portal",
+            primary_key=["uuid"],
+            partition_key=[self.partition_key],
+            event_time="timestamp",
+            online_enabled=True,
+            offline_backfill_every_hr=3,
+        )
+
+        self.connect_time_sec = time.perf_counter() - start
+        logger.info(
+            f"Connected to feature group {self.feature_group_name} "
+            f"in {self.connect_time_sec:.3f}s."
+        )
@@ -0,0 +1,84 @@
+"""
+An in-memory stand-in for the parts of the Hopsworks API the sink uses, to run
+and benchmark the sink offline. Pass `login` to `HopsworksApi` instead of
+`hopsworks.login`.
+"""
+
+import time
+
+import pandas as pd
+
+from loguru import logger
+from typing import Dict, List
+
+
+# Simulated latencies, in seconds, of a login, of an insert, and of an insert
+# per row
+LOGIN_LATENCY_SEC = 0.0
+INSERT_LATENCY_SEC = 0.0
+INSERT_LATENCY_SEC_PER_ROW = 0.0
+
+# Number of logins, to check how often the sink authenticates
+logins = 0
+
+
+class StubFeatureGroup:
+    def __init__(self, name: str, version: int, primary_key: List[str]):
+        self.name = name
+        self.version = version
+        self.primary_key = primary_key
+
+        # Rows by primary key, so that inserts behave like upserts
+        self.rows: Dict[tuple, dict] = {}
+        self.inserted_rows = 0
+
+    def insert(self, features: pd.DataFrame, **kwargs) -> None:
+        time.sleep(INSERT_LATENCY_SEC + INSERT_LATENCY_SEC_PER_ROW * len(features))
+
+        for row in features.to_dict(orient="records"):
+            self.rows[tuple(row[key] for key in self.primary_key)] = row
+
+        self.inserted_rows += len(features)
+
+    def read(self, **kwargs) -> pd.DataFrame:
+        return pd.DataFrame(list(self.rows.values()))
+
+
+class StubFeatureStore:
+    def __init__(self):
+        self.feature_groups: Dict[tuple, StubFeatureGroup] = {}
+
+    def get_or_create_feature_group(
+        self, name: str, version: int, primary_key: List[str], **kwargs
+    ) -> StubFeatureGroup:
+        key = (name, version)
+
+        if key not in self.feature_groups:
+            self.feature_groups[key] = StubFeatureGroup(name, version, primary_key)
+
+        return self.feature_groups[key]
+
+
+class StubProject:
+    def __init__(self, name: str):
+        self.name = name
+
+    def get_feature_store(self) -> StubFeatureStore:
+        return feature_store
+
+
+# A single store per process, like the one of a Hopsworks project
+feature_store = StubFeatureStore()
+
+
+def login(project: str, api_key_value: str, **kwargs) -> StubProject:
+    """
+    Stands in for `hopsworks.login`.
+    """
+    global logins
+
+    time.sleep(LOGIN_LATENCY_SEC)
+    logins += 1
+    logger.debug(f"Logged in to the Hopsworks stub. Project name: {project}")
+
+    return StubProject(project)
@@ -1,23 +1,23 @@
-import json
+import multiprocessing
+import os
+import time
 
+from collections import defaultdict
+from confluent_kafka import KafkaException, TopicPartition
 from quixstreams import Application
-from typing import Optional, List, Tuple, Any
+from quixstreams.kafka import Consumer
+from typing import Optional, List, Tuple, Any, Dict, Set
 
 from loguru import logger
-from src.hopsworks_api import push_data_to_feature_store
+from src import metrics, wire_format
+from src.batching import AdaptivePolicy, BatchingPolicy, ThresholdPolicy
+from src.earthquake_batch import EarthquakeBatch
+from src.hopsworks_api import HopsworksApi
+from src.parquet_store import ParquetStore
+from src.sink_backend import SinkBackend
+from src.writer import PartitionedWriter
 
 
-def get_current_utc_sec() -> int:
-    """
-    Get the current time in UTC seconds.
-
-    Returns:
-        int: The current time in UTC seconds.
-    """
-    from datetime import datetime, timezone
-
-    return int(datetime.now(timezone.utc).timestamp())
-
 def custom_ts_extractor(
     value: Any,
     headers: Optional[List[Tuple[str, bytes]]],
@@ -37,6 +37,195 @@ def custom_ts_extractor(
     return value["timestamp"]
 
 
+def consume(consumer: Consumer, num_messages: int, timeout: float) -> List:
+    """
+    Consumes up to `num_messages` messages in a single call, waiting at most
+    `timeout` seconds for them.
+
+    The quixstreams Consumer only exposes `poll`, which returns one message per
+    call, so we call `consume` on the confluent_kafka consumer it wraps.
+    """
+    return consumer._consumer.consume(num_messages=num_messages, timeout=timeout)
+
+
+def commit_offsets(consumer: Consumer, offsets: List[TopicPartition]) -> None:
+    """
+    Synchronously commits `offsets`, e.g. the ones of the batches written to the
+    feature store.
+
+    A commit can fail if a partition was revoked by a rebalance after its batch
+    was buffered. The new owner of the partition reprocesses the batch, and the
+    upsert makes that harmless.
+    """
+    if not offsets:
+        return
+
+    try:
+        consumer.commit(offsets=offsets, asynchronous=False)
+    except KafkaException as e:
+        logger.error(f"Failed to commit offsets {offsets}: {e}")
+
+
+def new_consumer_group_name() -> str:
+    """
+    Returns the name of a new consumer group, to consume the topic from the start.
+    """
+    import uuid
+
+    kafka_consumer_group = "earthquake_historical_consumer_group_" + str(uuid.uuid4())
+    logger.debug(f"Created new Kafka consumer group: {kafka_consumer_group}")
+
+    return kafka_consumer_group
+
+
+def log_partition_lag(consumer: Consumer) -> None:
+    """
+    Logs the lag of each assigned partition: the number of messages between the
+    position of the consumer and the end of the partition.
+    """
+    try:
+        positions = consumer.position(consumer.assignment())
+
+        for partition in positions:
+            _, high = consumer.get_watermark_offsets(partition, timeout=5)
+
+            if partition.offset < 0:
+                # Nothing consumed yet
+                continue
+
+            logger.info(
+                f"Lag of {partition.topic}[{partition.partition}]: "
+                f"{high - partition.offset} messages."
+            )
+            metrics.CONSUMER_LAG.labels(partition.partition).set(
+                high - partition.offset
+            )
+
+    except KafkaException as e:
+        logger.warning(f"Failed to get the partition lag: {e}")
+
+
+def log_committed_offsets(consumer, partitions: List[TopicPartition]) -> None:
+    """
+    Logs the committed offsets the consumer resumes from, on partition assignment.
+    Messages after them were not written to the feature store, or not known to be,
+    and are consumed again.
+    """
+    try:
+        committed = consumer.committed(partitions, timeout=10)
+    except KafkaException as e:
+        logger.warning(f"Failed to get the committed offsets: {e}")
+        return
+
+    for partition in committed:
+        if partition.offset < 0:
+            logger.info(
+                f"No committed offset for {partition.topic}[{partition.partition}]."
+            )
+        else:
+            logger.info(
+                f"Resuming {partition.topic}[{partition.partition}] "
+                f"from committed offset {partition.offset}."
+            )
+
+
+def get_batching_policy(
+    batching_policy: str,
+    buffer_size: int,
+    buffer_max_bytes: int,
+    save_every_n_sec: float,
+    adaptive_min_buffer_size: int,
+) -> BatchingPolicy:
+    """
+    Returns the policy that decides when the buffer is written to the feature store.
+
+    Args:
+        batching_policy: "threshold" to flush at fixed thresholds, or "adaptive" to
+            tune the row threshold between `adaptive_min_buffer_size` and `buffer_size`.
+        buffer_size: The maximum number of messages in the buffer.
+        buffer_max_bytes: The maximum size of the messages in the buffer, in bytes.
+        save_every_n_sec: The maximum age of the oldest message in the buffer.
+        adaptive_min_buffer_size: The minimum row threshold of the adaptive policy.
+
+    Returns:
+        BatchingPolicy: The batching policy.
+    """
+    if batching_policy == "adaptive":
+        return AdaptivePolicy(
+            min_rows=min(adaptive_min_buffer_size, buffer_size),
+            max_rows=buffer_size,
+            max_bytes=buffer_max_bytes,
+            max_age_sec=save_every_n_sec,
+        )
+
+    return ThresholdPolicy(
+        max_rows=buffer_size,
+        max_bytes=buffer_max_bytes,
+        max_age_sec=save_every_n_sec,
+    )
+
+
+def get_sink_backend(
+    sink_backend: str,
+    feature_group_name: str,
+    feature_group_version: int,
+    partition_key: str = "datestr",
+    hopsworks_project_name: Optional[str] = None,
+    hopsworks_api_key: Optional[str] = None,
+    use_hopsworks_stub: bool = False,
+    parquet_store_path: str = "data/offline_store",
+    parquet_compact_every_sec: float = 60,
+    parquet_compact_min_files: int = 8,
+    parquet_retention_sec: float = 600,
+) -> SinkBackend:
+    """
+    Returns the backend the sink writes to.
+
+    Args:
+        sink_backend: "hopsworks", or "parquet" for a local Parquet store.
+        feature_group_name: The name of the feature group to write to.
+        feature_group_version: The version of the feature group to write to.
+        partition_key: The partition key of the feature group.
+        hopsworks_project_name: The Hopsworks project of the feature store.
+        hopsworks_api_key: The API key to log in to Hopsworks.
+        use_hopsworks_stub: Whether to write to an in-memory stub instead of Hopsworks.
+        parquet_store_path: The directory of the Parquet stores, one per feature
+            group and version.
+        parquet_compact_every_sec: How often the Parquet store is compacted.
+        parquet_compact_min_files: The number of files from which a partition of
+            the Parquet store is compacted.
+        parquet_retention_sec: How long the files replaced by a compaction are kept.
+
+    Returns:
+        SinkBackend: The backend.
+    """
+    if sink_backend == "parquet":
+        return ParquetStore(
+            path=os.path.join(
+                parquet_store_path, f"{feature_group_name}_{feature_group_version}"
+            ),
+            compact_every_sec=parquet_compact_every_sec,
+            compact_min_files=parquet_compact_min_files,
+            retention_sec=parquet_retention_sec,
+        )
+
+    login = None
+    if use_hopsworks_stub:
+        from src import hopsworks_stub
+
+        login = hopsworks_stub.login
+
+    # A single client, so that we log in and get the feature group only once
+    return HopsworksApi(
+        api_key=hopsworks_api_key,
+        project_name=hopsworks_project_name,
+        feature_group_name=feature_group_name,
+        feature_group_version=feature_group_version,
+        partition_key=partition_key,
+        login=login,
+    )
+
+
 def kafka_to_feature_store(
     kafka_broker_address: str,
     kafka_topic: str,
@@ -48,11 +237,40 @@ def kafka_to_feature_store(
     create_new_consumer_group: Optional[bool] = False,
     save_every_n_sec: Optional[int] = 60,
     partition_key: Optional[str] = "datestr",
+    hopsworks_project_name: Optional[str] = None,
+    hopsworks_api_key: Optional[str] = None,
+    use_hopsworks_stub: Optional[bool] = False,
+    max_pending_flushes: Optional[int] = 2,
+    batching_policy: Optional[str] = "threshold",
+    buffer_max_bytes: Optional[int] = 64 * 1024 * 1024,
+    adaptive_min_buffer_size: Optional[int] = 100,
+    consume_batch_size: Optional[int] = 500,
+    log_lag_every_sec: Optional[int] = 30,
+    metrics_port: Optional[int] = None,
+    sink_backend: Optional[str] = "hopsworks",
+    parquet_store_path: Optional[str] = "data/offline_store",
+    parquet_compact_every_sec: Optional[float] = 60,
+    parquet_compact_min_files: Optional[int] = 8,
+    parquet_retention_sec: Optional[float] = 600,
 ) -> None:
     """
     Writes data from the `earthquake` Kafka topic and saves the data to
     our Hopsworks Feature Store.
 
+    Messages are buffered per partition, and each buffer is flushed on its own.
+    Full buffers are written by a background writer per partition while we
+    keep consuming, so that a slow write of one partition does not hold up the
+    others. Offsets are committed only once their buffer is in the feature
+    store, and when the writer of a partition has no room for its buffer we
+    pause that partition until it catches up.
+    After a restart or a rebalance we resume from the committed offsets, so
+    only the buffers that were not confirmed written are written again. This
+    needs a stable `kafka_consumer_group`, i.e. `create_new_consumer_group`
+    off. Messages of aborted producer transactions are skipped.
+
+    The data is written to Hopsworks, or with `sink_backend` "parquet" to a
+    local Parquet store, see `get_sink_backend`.
+
     Args:
         kafka_broker_address: The address of the Kafka broker.
         kafka_topic: The name of the Kafka topic to read data from.
@@ -62,18 +280,34 @@ def kafka_to_feature_store(
         buffer_size: The number of messages to buffer before writing to the feature store.
         live_or_historical: Whether the data is live or historical.
         create_new_consumer_group: Whether to create a new consumer group.
+        save_every_n_sec: Force a write to the feature store every n seconds.
+        partition_key: The partition key of the feature group.
+        hopsworks_project_name: The Hopsworks project of the feature store.
+        hopsworks_api_key: The API key to log in to Hopsworks.
+        use_hopsworks_stub: Whether to write to an in-memory stub instead of Hopsworks.
+        max_pending_flushes: The number of buffers of a partition that can wait to be
+            written before we stop consuming that partition.
+        batching_policy: "threshold" or "adaptive", see `get_batching_policy`.
+        buffer_max_bytes: The size of the buffer, in bytes, that triggers a write.
+        adaptive_min_buffer_size: The smallest buffer size the adaptive policy uses.
+        consume_batch_size: The maximum number of messages read from Kafka at once.
+        log_lag_every_sec: How often to log the lag of each partition.
+        metrics_port: The port to serve the metrics of `src.metrics` on, if any.
+        sink_backend: "hopsworks" or "parquet", see `get_sink_backend`.
+        parquet_store_path: The directory of the Parquet stores.
+        parquet_compact_every_sec: How often the Parquet store is compacted.
+        parquet_compact_min_files: The number of files from which a partition of
+            the Parquet store is compacted.
+        parquet_retention_sec: How long the files replaced by a compaction are kept.
 
     Returns:
         None
     """
 
-    if create_new_consumer_group:
-        import uuid
+    metrics.start_metrics_server(metrics_port)
 
-        kafka_consumer_group = "earthquake_historical_consumer_group_" + str(
-            uuid.uuid4()
-        )
-        logger.debug(f"Created new Kafka consumer group: {kafka_consumer_group}")
+    if create_new_consumer_group:
+        kafka_consumer_group = new_consumer_group_name()
 
     app = Application(
         broker_address=kafka_broker_address,
@@ -81,72 +315,207 @@ def kafka_to_feature_store(
         auto_offset_reset="earliest"
         if live_or_historical == "historical"
         else "latest",
+        # Skip the messages of aborted producer transactions
+        consumer_extra_config={"isolation.level": "read_committed"},
+    )
+
+    backend = get_sink_backend(
+        sink_backend,
+        feature_group_name=feature_group_name,
+        feature_group_version=feature_group_version,
+        partition_key=partition_key,
+        hopsworks_project_name=hopsworks_project_name,
+        hopsworks_api_key=hopsworks_api_key,
+        use_hopsworks_stub=use_hopsworks_stub,
+        parquet_store_path=parquet_store_path,
+        parquet_compact_every_sec=parquet_compact_every_sec,
+        parquet_compact_min_files=parquet_compact_min_files,
+        parquet_retention_sec=parquet_retention_sec,
     )
 
     topic = app.topic(kafka_topic, value_serializer="json", timestamp_extractor=custom_ts_extractor)
 
-    last_saved_to_feature_store_ts = get_current_utc_sec()
+    policy = get_batching_policy(
+        batching_policy,
+        buffer_size=buffer_size,
+        buffer_max_bytes=buffer_max_bytes,
+        save_every_n_sec=save_every_n_sec,
+        adaptive_min_buffer_size=adaptive_min_buffer_size,
+    )
 
-    buffer = []
+    # One buffer per (topic, partition), each flushed on its own
+    buffers: Dict[Tuple[str, int], EarthquakeBatch] = {}
 
-    with app.get_consumer() as consumer:
-        consumer.subscribe(topics=[topic.name])
+    # Offset of the last message consumed, per (topic, partition)
+    last_offsets: Dict[Tuple[str, int], int] = {}
 
-        while True:
-            msg = consumer.poll(1)
+    # Partitions we stopped consuming because their writer had no room for their buffer
+    paused: Set[Tuple[str, int]] = set()
 
-            # Number of seconds since the last time we saved data to the feature store.
-            # We will use this for buffer operations so that we push the remaining
-            # elements every `save_every_n_sec` if we haven't reached the buffer size.
-            since_last_saved = get_current_utc_sec() - last_saved_to_feature_store_ts
+    last_lag_log_time = time.monotonic()
 
-            if (msg is not None) and msg.error():
-                # Log the error and continue
-                logger.error(f"Kafka error: {msg.error()}")
-                continue
-
-            elif (msg is None) and (since_last_saved < save_every_n_sec):
-                # Log a message and `since_last_saved` and continue
-                logger.debug("No messages to process.")
-                logger.debug(f"Seconds since last saved: {since_last_saved}")
-                continue
+    with app.get_consumer(auto_commit_enable=False) as consumer:
+        # Writes to the feature store in the background while we keep polling,
+        # with a writer per partition
+        writer = PartitionedWriter(
+            backend=backend,
+            online_or_offline="online" if live_or_historical == "live" else "offline",
+            batching_policy=policy,
+            max_pending=max_pending_flushes,
+        )
 
-            else:
-                # Process the message if it exists
-                if msg is not None:
-                    # append the data to the buffer
-                    earthquake = json.loads(msg.value().decode("utf-8"))
-                    buffer.append(earthquake)
-                    logger.debug(
-                        f"Message was pushed to buffer. Buffer size={len(buffer)}"
-                    )
-
-                if (len(buffer) >= buffer_size) or (
-                    since_last_saved >= save_every_n_sec
-                ):
-                    # if the buffer is not empty we write the data to the feature store
-                    if len(buffer) > 0:
-                        try:
-                            push_data_to_feature_store(
-                                feature_group_name=feature_group_name,
-                                feature_group_version=feature_group_version,
-                                data=buffer,
-                                online_or_offline="online"
-                                if live_or_historical == "live"
-                                else "offline",
-                                partition_key=partition_key,
-                            )
-                        except Exception as e:
-                            logger.error(
-                                f"Failed to push data to the feature store: {e}"
-                            )
-                            continue
+        def on_revoke(kafka_consumer, partitions: List[TopicPartition]) -> None:
+            # Commit what is already written before another consumer takes the
+            # partitions over, so that it does not write it again
+            commit_offsets(consumer, writer.written_offsets())
+
+            # and drop what is not, the new owner consumes it again
+            for partition in partitions:
+                key = (partition.topic, partition.partition)
+                writer.revoke(key)
+                buffers.pop(key, None)
+                last_offsets.pop(key, None)
+                paused.discard(key)
+
+            metrics.PAUSED_PARTITIONS.set(len(paused))
+
+        consumer.subscribe(
+            topics=[topic.name],
+            on_assign=log_committed_offsets,
+            on_revoke=on_revoke,
+        )
 
+        try:
+            while True:
+                # Commit the offsets of the batches that are now in the feature store
+                commit_offsets(consumer, writer.written_offsets())
+
+                messages = consume(consumer, num_messages=consume_batch_size, timeout=1)
+
+                # JSON and binary message values, per (topic, partition)
+                values = defaultdict(lambda: ([], []))
+
+                for msg in messages:
+                    if msg.error():
+                        # Log the error and skip the message
+                        logger.error(f"Kafka error: {msg.error()}")
+                        metrics.CONSUMER_ERRORS.inc()
+                        continue
+
+                    key = (msg.topic(), msg.partition())
+                    metrics.CONSUMED.labels(msg.partition()).inc()
+                    last_offsets[key] = msg.offset()
+
+                    # Tombstones have nothing to write, their offset is committed
+                    # with the next buffer of the partition
+                    if msg.value() is None:
+                        logger.warning(
+                            f"Skipping message without a value at {key[0]}[{key[1]}] "
+                            f"offset {msg.offset()}."
+                        )
+                        continue
+
+                    json_values, binary_values = values[key]
+
+                    # JSON and binary messages can share the topic during a migration
+                    if wire_format.content_type(msg.headers()) == wire_format.CONTENT_TYPE_BINARY:
+                        binary_values.append(msg.value())
+                    else:
+                        json_values.append(msg.value())
+
+                # Decode the messages into the columns of the buffers in one go
+                for key, (json_values, binary_values) in values.items():
+                    buffer = buffers.setdefault(key, EarthquakeBatch())
+
+                    if json_values:
+                        with metrics.DECODE_SECONDS.labels("json").time():
+                            buffer.extend_json(json_values)
+
+                    if binary_values:
+                        with metrics.DECODE_SECONDS.labels("binary").time():
+                            buffer.extend_binary(binary_values)
+
+                for key, buffer in list(buffers.items()):
+                    # The policy looks at the number of messages, their size, and the
+                    # age of the oldest one, so that live data is written while fresh
+                    if not policy.should_flush(len(buffer), buffer.nbytes, buffer.age_sec):
+                        continue
+
+                    offsets = [TopicPartition(key[0], key[1], last_offsets[key] + 1)]
+
+                    if writer.submit(key, buffer, offsets):
                         # reset the buffer
                         # Thanks Rosina!
-                        buffer = []
+                        del buffers[key]
+
+                        if key in paused:
+                            logger.info(f"Resuming consumption of {key[0]}[{key[1]}].")
+                            consumer.resume([TopicPartition(key[0], key[1])])
+                            paused.discard(key)
+                            metrics.PAUSED_PARTITIONS.set(len(paused))
+
+                    elif key not in paused:
+                        # Stop fetching messages of this partition until its writer
+                        # has room for its buffer. The other partitions have their
+                        # own writers and keep going.
+                        logger.warning(
+                            f"Writer is lagging behind. Pausing consumption of {key[0]}[{key[1]}]."
+                        )
+                        consumer.pause([TopicPartition(key[0], key[1])])
+                        paused.add(key)
+                        metrics.PAUSED_PARTITIONS.set(len(paused))
+
+                if time.monotonic() - last_lag_log_time >= log_lag_every_sec:
+                    log_partition_lag(consumer)
+                    last_lag_log_time = time.monotonic()
+
+        finally:
+            writer.close(timeout=save_every_n_sec)
+
+            commit_offsets(consumer, writer.written_offsets())
+            backend.close()
+
+
+def run_workers(num_workers: int, **kwargs) -> None:
+    """
+    Runs `num_workers` processes of `kafka_to_feature_store`, called with `kwargs`,
+    in the same consumer group, so that Kafka spreads the partitions of the topic
+    over them. There is no point in more workers than partitions.
 
-                        last_saved_to_feature_store_ts = get_current_utc_sec()
+    Args:
+        num_workers (int): The number of processes.
+        **kwargs: The arguments of `kafka_to_feature_store`.
+
+    Returns:
+        None
+    """
+    # All the workers must join the same group
+    if kwargs.get("create_new_consumer_group"):
+        kwargs["kafka_consumer_group"] = new_consumer_group_name()
+        kwargs["create_new_consumer_group"] = False
+
+    # Each worker serves its metrics on its own port, from `metrics_port` up
+    metrics_port = kwargs.pop("metrics_port", None)
+
+    workers = [
+        multiprocessing.Process(
+            target=kafka_to_feature_store,
+            kwargs=dict(
+                kwargs,
+                metrics_port=None if metrics_port is None else metrics_port + i,
+            ),
+            name=f"seismic-data-sink-{i}",
+        )
+        for i in range(num_workers)
+    ]
+
+    for worker in workers:
+        worker.start()
+
+    logger.info(f"Started {num_workers} workers.")
+
+    for worker in workers:
+        worker.join()
 
 
 if __name__ == "__main__":
@@ -154,18 +523,38 @@ if __name__ == "__main__":
 
     logger.debug("Starting Kafka to Feature Store service...")
 
+    kwargs = dict(
+        kafka_topic=config.kafka_topic,
+        kafka_broker_address=config.kafka_broker_address,
+        kafka_consumer_group=config.kafka_consumer_group,
+        feature_group_name=config.feature_group_name,
+        feature_group_version=config.feature_group_version,
+        buffer_size=config.buffer_size,
+        live_or_historical=config.live_or_historical,
+        save_every_n_sec=config.save_every_n_sec,
+        create_new_consumer_group=config.create_new_consumer_group,
+        partition_key=config.partition_key,
+        hopsworks_project_name=config.hopsworks_project_name,
+        hopsworks_api_key=config.hopsworks_api_key,
+        use_hopsworks_stub=config.use_hopsworks_stub,
+        max_pending_flushes=config.max_pending_flushes,
+        batching_policy=config.batching_policy,
+        buffer_max_bytes=config.buffer_max_bytes,
+        adaptive_min_buffer_size=config.adaptive_min_buffer_size,
+        consume_batch_size=config.consume_batch_size,
+        log_lag_every_sec=config.log_lag_every_sec,
+        metrics_port=config.metrics_port,
+        sink_backend=config.sink_backend,
+        parquet_store_path=config.parquet_store_path,
+        parquet_compact_every_sec=config.parquet_compact_every_sec,
+        parquet_compact_min_files=config.parquet_compact_min_files,
+        parquet_retention_sec=config.parquet_retention_sec,
+    )
+
     try:
-        kafka_to_feature_store(
-            kafka_topic=config.kafka_topic,
-            kafka_broker_address=config.kafka_broker_address,
-            kafka_consumer_group=config.kafka_consumer_group,
-            feature_group_name=config.feature_group_name,
-            feature_group_version=config.feature_group_version,
-            buffer_size=config.buffer_size,
-            live_or_historical=config.live_or_historical,
-            save_every_n_sec=config.save_every_n_sec,
-            create_new_consumer_group=config.create_new_consumer_group,
-            partition_key=config.partition_key,
-        )
+        if config.num_workers > 1:
+            run_workers(config.num_workers, **kwargs)
+        else:
+            kafka_to_feature_store(**kwargs)
     except KeyboardInterrupt:
         logger.info("Exiting neatly!")
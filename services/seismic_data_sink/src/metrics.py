@@ -0,0 +1,107 @@
+"""
+Prometheus metrics of the seismic data sink, served over HTTP by
+`start_metrics_server` for Prometheus to scrape.
+
+Every service has its own copy of `start_metrics_server` and `observe_event_lag`,
+with the metrics of that service. Latencies are in seconds, and the event lag
+is the time since the `timestamp` of the earthquake, i.e. since it happened.
+"""
+
+import time
+
+from loguru import logger
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from typing import Iterable, Optional
+
+# From a second to a month, since historical earthquakes are written long
+# after they happened
+EVENT_LAG_BUCKETS = (
+    1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 6 * 3600, 86400, 7 * 86400, 30 * 86400,
+)
+
+CONSUMED = Counter(
+    "seismic_data_sink_consumed_total",
+    "Messages read from Kafka.",
+    ["partition"],
+)
+CONSUMER_ERRORS = Counter(
+    "seismic_data_sink_consumer_errors_total",
+    "Errors returned by the consumer instead of a message.",
+)
+DECODE_SECONDS = Histogram(
+    "seismic_data_sink_decode_seconds",
+    "Time to decode the messages of a consume call into the buffers.",
+    ["content_type"],
+)
+CONSUMER_LAG = Gauge(
+    "seismic_data_sink_consumer_lag",
+    "Messages between the position of the consumer and the end of the partition.",
+    ["partition"],
+)
+PAUSED_PARTITIONS = Gauge(
+    "seismic_data_sink_paused_partitions",
+    "Partitions paused because their writer has no room for their buffer.",
+)
+PENDING_FLUSHES = Gauge(
+    "seismic_data_sink_pending_flushes",
+    "Buffers waiting to be written to the feature store, by partition.",
+    ["partition"],
+)
+FLUSH_ROWS = Histogram(
+    "seismic_data_sink_flush_rows",
+    "Number of earthquakes of a buffer written to the feature store.",
+    buckets=(1, 10, 100, 500, 1000, 5000, 10000, 50000, 100000),
+)
+FLUSH_BYTES = Histogram(
+    "seismic_data_sink_flush_bytes",
+    "Size of the messages of a buffer written to the feature store.",
+    buckets=tuple(2**n for n in range(10, 28, 2)),
+)
+INSERT_SECONDS = Histogram(
+    "seismic_data_sink_insert_seconds",
+    "Time of a successful insert into the feature store.",
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+INSERT_FAILURES = Counter(
+    "seismic_data_sink_insert_failures_total",
+    "Inserts into the feature store that failed and are retried.",
+)
+DROPPED_ROWS = Counter(
+    "seismic_data_sink_dropped_rows_total",
+    "Earthquakes of buffers dropped because they fail to be written for good, "
+    "e.g. a value of the wrong type.",
+)
+COMPACTIONS = Counter(
+    "seismic_data_sink_compactions_total",
+    "Partitions of the Parquet store compacted into a single file.",
+)
+EVENT_LAG_SECONDS = Histogram(
+    "seismic_data_sink_event_lag_seconds",
+    "Time from an earthquake to it being written to the feature store, the "
+    "end-to-end lag of the pipeline.",
+    buckets=EVENT_LAG_BUCKETS,
+)
+
+
+def start_metrics_server(port: Optional[int]) -> None:
+    """
+    Serves the metrics on `http://0.0.0.0:{port}/metrics`, from a background
+    thread. Does nothing if `port` is None.
+    """
+    if port is None:
+        return
+
+    start_http_server(port)
+    logger.info(f"Serving metrics on port {port}.")
+
+
+def observe_event_lag(histogram: Histogram, timestamps_ms: Iterable[int]) -> None:
+    """
+    Records in `histogram` the time since each of the event `timestamps_ms`,
+    skipping the missing ones.
+    """
+    now_ms = time.time() * 1000
+
+    for timestamp_ms in timestamps_ms:
+        if timestamp_ms is not None:
+            histogram.observe((now_ms - timestamp_ms) / 1000)
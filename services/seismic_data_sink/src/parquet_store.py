@@ -0,0 +1,356 @@
+import contextlib
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from loguru import logger
+from typing import Dict, Iterator, List, Optional
+
+from src import metrics
+from src.earthquake_batch import EarthquakeBatch
+from src.sink_backend import SinkBackend
+
+MANIFEST = "_manifest.json"
+MANIFEST_LOCK = "_manifest.lock"
+
+
+class ParquetStore(SinkBackend):
+    """
+    A local offline store of Parquet files, partitioned by `datestr`, for bulk
+    backfills to land at disk speed instead of going through Hopsworks.
+
+    Each write adds one file per `datestr` of the batch under `datestr=.../`,
+    and then commits them by rewriting `_manifest.json`, which lists the files
+    of each partition in the order they were written. The manifest is replaced
+    atomically, so a reader only ever sees whole writes, and is updated under a
+    file lock, so that several sink processes can share the store.
+
+    Rows are upserted by `uuid` within their partition: when a partition is
+    read, the row of the last file wins. An event whose timestamp is corrected
+    into another day keeps a row in each partition. A background thread
+    compacts the partitions that have at least `compact_min_files` files into
+    one file every `compact_every_sec`. Replaced files are deleted after
+    `retention_sec`, so that readers that loaded the previous manifest can
+    still read them.
+
+    The dashboard reads the store with its own copy of the reader, which its
+    `tests/test_parquet_store.py` keeps in sync with this one.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        compact_every_sec: float = 60,
+        compact_min_files: int = 8,
+        retention_sec: float = 600,
+    ):
+        self.path = path
+        self.compact_every_sec = compact_every_sec
+        self.compact_min_files = compact_min_files
+        self.retention_sec = retention_sec
+
+        self.inserts = 0
+        self.insert_time_sec = 0.0
+        # the writers of the partitions push concurrently
+        self._stats_lock = threading.Lock()
+
+        os.makedirs(path, exist_ok=True)
+
+        self._stop = threading.Event()
+        self._compactor = threading.Thread(
+            target=self._run_compaction, name="parquet-store-compactor", daemon=True
+        )
+        self._compactor.start()
+
+    def push_data_to_feature_store(
+        self,
+        data: EarthquakeBatch,
+        online_or_offline: str,
+    ) -> None:
+        """
+        Upserts `data` into the store, in one commit. The store is an offline
+        store, so `online_or_offline` is ignored.
+
+        Args:
+            data (EarthquakeBatch): The data to write.
+            online_or_offline (str): Ignored.
+
+        Returns:
+            None
+        """
+        start = time.perf_counter()
+
+        data = to_partitioned_dataframe(data.to_dataframe())
+
+        files: Dict[str, List[str]] = {}
+
+        for datestr, rows in data.groupby("datestr", sort=False):
+            files[datestr] = [self._write_file(datestr, rows)]
+
+        with self._manifest() as manifest:
+            for datestr, new_files in files.items():
+                manifest["partitions"].setdefault(datestr, []).extend(new_files)
+
+        elapsed_sec = time.perf_counter() - start
+
+        with self._stats_lock:
+            self.insert_time_sec += elapsed_sec
+            self.inserts += 1
+
+        logger.info(
+            f"Wrote {len(data)} rows to {len(files)} partitions of {self.path} "
+            f"in {elapsed_sec:.3f}s."
+        )
+
+    def read(self, start_time: Optional[int] = None) -> pd.DataFrame:
+        """
+        Reads the rows of the store, the last written for each `uuid`.
+
+        Args:
+            start_time (Optional[int]): If given, only the rows from this
+                timestamp on, in milliseconds, are read.
+
+        Returns:
+            pd.DataFrame: The rows, sorted by `timestamp`.
+        """
+        return read_parquet_store(self.path, start_time)
+
+    def compact(self) -> int:
+        """
+        Compacts each partition with at least `compact_min_files` files into one
+        file, then deletes the files replaced more than `retention_sec` ago.
+
+        Returns:
+            int: The number of partitions compacted.
+        """
+        compacted = 0
+
+        for datestr, files in read_manifest(self.path)["partitions"].items():
+            if len(files) >= self.compact_min_files and self._compact_partition(
+                datestr, files
+            ):
+                compacted += 1
+
+        self._delete_obsolete_files()
+
+        return compacted
+
+    def close(self) -> None:
+        self._stop.set()
+        self._compactor.join(timeout=self.compact_every_sec)
+
+    def _compact_partition(self, datestr: str, files: List[str]) -> bool:
+        """
+        Replaces `files`, the first files of a partition, with a single file of
+        their rows, the last one for each `uuid`.
+
+        Returns:
+            bool: False if another process changed these files in the meantime.
+        """
+        start = time.perf_counter()
+
+        rows = read_files(self.path, files)
+        new_file = self._write_file(datestr, rows)
+
+        with self._manifest() as manifest:
+            current = manifest["partitions"].get(datestr, [])
+
+            # Files written since are kept after the compacted one, so that
+            # their rows still win
+            if current[: len(files)] != files:
+                os.remove(os.path.join(self.path, new_file))
+                return False
+
+            manifest["partitions"][datestr] = [new_file] + current[len(files) :]
+            manifest["obsolete"].extend([file, time.time()] for file in files)
+
+        metrics.COMPACTIONS.inc()
+        logger.info(
+            f"Compacted {len(files)} files of partition {datestr} into {len(rows)} "
+            f"rows in {time.perf_counter() - start:.3f}s."
+        )
+
+        return True
+
+    def _delete_obsolete_files(self) -> None:
+        """
+        Deletes the files replaced by a compaction more than `retention_sec` ago,
+        and the files that were written but never committed, e.g. by a process
+        that crashed.
+        """
+        deadline = time.time() - self.retention_sec
+
+        with self._manifest() as manifest:
+            expired = [file for file, replaced_at in manifest["obsolete"] if replaced_at < deadline]
+            manifest["obsolete"] = [
+                entry for entry in manifest["obsolete"] if entry[1] >= deadline
+            ]
+
+            known = {file for files in manifest["partitions"].values() for file in files}
+            known.update(file for file, _ in manifest["obsolete"])
+
+        for directory, _, names in os.walk(self.path):
+            for name in names:
+                path = os.path.join(directory, name)
+                file = os.path.relpath(path, self.path)
+
+                if not name.endswith(".parquet") or file in known:
+                    continue
+
+                if file in expired or os.path.getmtime(path) < deadline:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+    def _write_file(self, datestr: str, rows: pd.DataFrame) -> str:
+        """
+        Writes `rows` to a new file of the partition `datestr`, and returns its
+        path relative to the store. The file is not part of the store until it
+        is added to the manifest.
+        """
+        file = os.path.join(f"datestr={datestr}", f"part-{uuid.uuid4().hex}.parquet")
+        path = os.path.join(self.path, file)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        rows.to_parquet(path, index=False)
+
+        return file
+
+    @contextlib.contextmanager
+    def _manifest(self) -> Iterator[dict]:
+        """
+        Yields the manifest, locked across processes, and atomically saves the
+        changes made to it.
+        """
+        with open(os.path.join(self.path, MANIFEST_LOCK), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            try:
+                manifest = read_manifest(self.path)
+                yield manifest
+
+                manifest["version"] += 1
+                tmp_path = os.path.join(self.path, f"{MANIFEST}.tmp")
+
+                with open(tmp_path, "w") as f:
+                    json.dump(manifest, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                os.replace(tmp_path, os.path.join(self.path, MANIFEST))
+
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _run_compaction(self) -> None:
+        while not self._stop.wait(self.compact_every_sec):
+            try:
+                self.compact()
+            except Exception as e:
+                logger.error(f"Failed to compact {self.path}: {e}.")
+
+
+def to_partitioned_dataframe(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns the rows of `data` to write, the last one for each `uuid`, with a
+    `datestr` derived from the `timestamp` if there is none, e.g. for the
+    aggregated features.
+    """
+    if "datestr" not in data.columns:
+        data = data.assign(
+            datestr=pd.to_datetime(data["timestamp"], unit="ms").dt.strftime("%Y-%m-%d")
+        )
+
+    return data.drop_duplicates(subset="uuid", keep="last")
+
+
+def read_manifest(path: str) -> dict:
+    """
+    Returns the manifest of the store at `path`, an empty one if there is none.
+    """
+    try:
+        with open(os.path.join(path, MANIFEST)) as f:
+            return json.load(f)
+
+    except FileNotFoundError:
+        return {"version": 0, "partitions": {}, "obsolete": []}
+
+
+def read_files(path: str, files: List[str]) -> pd.DataFrame:
+    """
+    Reads `files` of the store at `path` in order, and keeps the last row of
+    each `uuid`, sorted by `timestamp`.
+    """
+    data = pd.concat(
+        [pd.read_parquet(os.path.join(path, file)) for file in files], ignore_index=True
+    )
+
+    return (
+        data.drop_duplicates(subset="uuid", keep="last")
+        .sort_values("timestamp", kind="stable")
+        .reset_index(drop=True)
+    )
+
+
+def empty_frame(path: str, manifest: dict) -> pd.DataFrame:
+    """
+    Returns an empty frame with the columns of the store at `path`, the ones of
+    its files, or the columns of the earthquakes if it has no files yet.
+    """
+    for files in manifest["partitions"].values():
+        if files:
+            schema = pq.read_schema(os.path.join(path, files[0]))
+            return schema.empty_table().to_pandas()
+
+    return pd.DataFrame(
+        {name: pd.Series(dtype=dtype) for name, dtype in EarthquakeBatch.DTYPES.items()}
+    )
+
+
+def read_parquet_store(path: str, start_time: Optional[int] = None) -> pd.DataFrame:
+    """
+    Reads the rows of the store at `path`, the last written for each `uuid`,
+    as of the last commit.
+
+    Rows are only upserted within a `datestr` partition: if the timestamp of an
+    event is corrected across midnight, both versions are returned, each from
+    its own partition. The reader cannot tell which of the two was written
+    last, so they are left for the caller to deduplicate.
+
+    Args:
+        path (str): The directory of the store.
+        start_time (Optional[int]): If given, only the rows from this timestamp
+            on, in milliseconds, are read. Older partitions are skipped.
+
+    Returns:
+        pd.DataFrame: The rows, sorted by `timestamp`. An empty store still has
+            its columns.
+    """
+    manifest = read_manifest(path)
+    partitions = manifest["partitions"]
+
+    if start_time is not None:
+        start_date = pd.to_datetime(start_time, unit="ms").strftime("%Y-%m-%d")
+        partitions = {
+            datestr: files for datestr, files in partitions.items() if datestr >= start_date
+        }
+
+    if not partitions:
+        return empty_frame(path, manifest)
+
+    data = pd.concat(
+        [read_files(path, files) for _, files in sorted(partitions.items())],
+        ignore_index=True,
+    )
+
+    if start_time is not None:
+        data = data[data["timestamp"] >= start_time].reset_index(drop=True)
+
+    return data
@@ -0,0 +1,42 @@
+from abc import ABC, abstractmethod
+
+from src.earthquake_batch import EarthquakeBatch
+
+
+class SinkBackend(ABC):
+    """
+    A store the sink writes its batches to: Hopsworks, see `src.hopsworks_api`,
+    or a local Parquet store, see `src.parquet_store`.
+
+    Writes are upserts by `uuid`, so that writing a batch again after a restart
+    or a rebalance is harmless. They are called from the threads of the
+    `BackgroundWriter` of each partition, so concurrently for different
+    partitions.
+    """
+
+    # Number of writes, and the total time they took, in seconds
+    inserts = 0
+    insert_time_sec = 0.0
+
+    @abstractmethod
+    def push_data_to_feature_store(
+        self,
+        data: EarthquakeBatch,
+        online_or_offline: str,
+    ) -> None:
+        """
+        Upserts `data` into the store.
+
+        Args:
+            data (EarthquakeBatch): The data to write.
+            online_or_offline (str): Whether the data is for the online or the
+                offline store, for the backends that have both.
+
+        Returns:
+            None
+        """
+
+    def close(self) -> None:
+        """
+        Stops the background work of the backend, once the writes are done.
+        """
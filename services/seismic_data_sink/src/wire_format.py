@@ -0,0 +1,109 @@
+"""
+Decoder of the binary wire format of the messages of the earthquake topic.
+
+The format is described in `src/wire_format.py` of the earthquake producer,
+which has the matching encoder, keep both in sync. `make bench` checks that
+they agree, see `benchmarks/wire_check.py`, and `tests/test_wire_format.py`
+decodes messages the producer encoded. Messages tell their format
+in the `content-type` header, and messages without one are JSON.
+"""
+
+import struct
+
+from datetime import date, timedelta
+from functools import lru_cache
+from loguru import logger
+from typing import Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE_HEADER = "content-type"
+CONTENT_TYPE_JSON = b"application/json"
+CONTENT_TYPE_BINARY = b"application/x-earthquake"
+
+VERSION = 1
+
+_HEADER = struct.Struct("<Bqdddd16siH")
+_EPOCH = date(1970, 1, 1)
+
+# Fields of an earthquake, in the order of the JSON messages
+_FIELDS = [
+    "timestamp",
+    "datestr",
+    "region",
+    "magnitude",
+    "depth",
+    "latitude",
+    "longitude",
+    "uuid",
+]
+
+
+def content_type(headers: Optional[Sequence[Tuple[str, bytes]]]) -> bytes:
+    """
+    Returns the content type in the Kafka `headers` of a message, JSON if
+    there is none.
+    """
+    for name, value in headers or ():
+        if name == CONTENT_TYPE_HEADER:
+            return value
+
+    return CONTENT_TYPE_JSON
+
+
+def decode_columns(values: List[bytes]) -> Dict[str, List]:
+    """
+    Decodes messages in the binary wire format into one list per field, with
+    the same values as the JSON messages: the UUID and `datestr` as strings.
+    Messages that cannot be decoded are logged and skipped.
+
+    Args:
+        values (List[bytes]): The values of the Kafka messages.
+
+    Returns:
+        Dict[str, List]: The decoded fields, by name.
+    """
+    columns: Dict[str, List] = {name: [] for name in _FIELDS}
+
+    for value in values:
+        try:
+            fields = _HEADER.unpack_from(value)
+
+            if fields[0] != VERSION:
+                raise ValueError(f"unsupported version {fields[0]}")
+
+            if len(value) != _HEADER.size + fields[-1]:
+                raise ValueError(f"expected {_HEADER.size + fields[-1]} bytes")
+
+            region = value[_HEADER.size :].decode("utf-8")
+
+        except (struct.error, UnicodeDecodeError, ValueError) as e:
+            logger.error(f"Skipping message that is not a valid earthquake: {e}")
+            continue
+
+        _, timestamp, magnitude, depth, latitude, longitude, uuid, days, _ = fields
+
+        columns["timestamp"].append(timestamp)
+        columns["datestr"].append(_to_datestr(days))
+        columns["region"].append(region)
+        columns["magnitude"].append(magnitude)
+        columns["depth"].append(depth)
+        columns["latitude"].append(latitude)
+        columns["longitude"].append(longitude)
+        columns["uuid"].append(_to_uuid_str(uuid))
+
+    return columns
+
+
+@lru_cache(maxsize=4096)
+def _to_datestr(days: int) -> str:
+    """
+    Returns the "YYYY-MM-DD" date `days` days after the epoch.
+    """
+    return (_EPOCH + timedelta(days=days)).isoformat()
+
+
+def _to_uuid_str(uuid: bytes) -> str:
+    """
+    Formats 16 bytes like `str(UUID(bytes=uuid))`, which is slower.
+    """
+    h = uuid.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
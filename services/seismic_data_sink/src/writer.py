@@ -0,0 +1,283 @@
+import queue
+import threading
+import time
+
+from confluent_kafka import TopicPartition
+from loguru import logger
+from typing import Dict, List, Optional, Tuple
+
+from src import metrics
+from src.batching import BatchingPolicy
+from src.earthquake_batch import EarthquakeBatch
+from src.sink_backend import SinkBackend
+
+# Errors of a write that fail again however often it is retried, e.g. a value
+# pandas or Arrow cannot convert to the type of its column
+PERMANENT_ERRORS = (TypeError, ValueError)
+
+
+class BackgroundWriter:
+    """
+    Writes batches to the sink backend from a background thread, so that the
+    consumer keeps polling Kafka while an insert is in flight.
+
+    Batches are handed over through a queue of at most `max_pending` batches.
+    When it is full `submit` returns False, and it is up to the caller to stop
+    consuming until there is room again. A batch that fails to be written is
+    retried with exponential backoff until it succeeds, so that batches are
+    written in order and never dropped. The exception is a batch that fails
+    with one of `PERMANENT_ERRORS`: retrying it would stall the partition for
+    good, so it is dropped, counted in the metrics, and its offsets committed.
+    The offsets of each written batch are returned by `written_offsets`, for
+    the caller to commit them.
+
+    The size and latency of every write is recorded in `batching_policy`, and
+    in the metrics along with the end-to-end lag of the written earthquakes.
+
+    The sink has one writer per partition, see `PartitionedWriter`.
+    """
+
+    def __init__(
+        self,
+        backend: SinkBackend,
+        online_or_offline: str,
+        batching_policy: BatchingPolicy,
+        max_pending: int = 2,
+        max_backoff_sec: float = 60,
+        partition: int = 0,
+    ):
+        self.backend = backend
+        self.online_or_offline = online_or_offline
+        self.batching_policy = batching_policy
+        self.max_backoff_sec = max_backoff_sec
+        self.partition = partition
+
+        self._pending: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._written: queue.Queue = queue.Queue()
+        self._stop = threading.Event()
+
+        self._thread = threading.Thread(
+            target=self._run, name=f"feature-store-writer-{partition}", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, batch: EarthquakeBatch, offsets: List[TopicPartition]) -> bool:
+        """
+        Queues `batch` to be written, without blocking.
+
+        Args:
+            batch (EarthquakeBatch): The batch to write.
+            offsets (List[TopicPartition]): The offsets to commit once it is written.
+
+        Returns:
+            bool: False if the queue is full and the batch was not queued.
+        """
+        try:
+            self._pending.put_nowait((batch, offsets))
+        except queue.Full:
+            return False
+
+        metrics.PENDING_FLUSHES.labels(self.partition).set(self._pending.qsize())
+
+        return True
+
+    def written_offsets(self) -> List[TopicPartition]:
+        """
+        Returns the offsets to commit for the batches written since the last call,
+        the latest offset for each partition.
+        """
+        offsets = {}
+
+        while True:
+            try:
+                for offset in self._written.get_nowait():
+                    offsets[(offset.topic, offset.partition)] = offset
+            except queue.Empty:
+                break
+
+        return list(offsets.values())
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Waits for the queued batches to be written, then stops the writer thread.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while self._pending.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                logger.warning(
+                    f"Stopping the writer with {self._pending.qsize()} batches not written."
+                )
+                break
+            time.sleep(0.1)
+
+        self.stop()
+        self._thread.join(timeout=1)
+
+    def stop(self) -> None:
+        """
+        Stops the writer thread without waiting: the queued batches are dropped,
+        and a batch being written is not retried if it fails.
+        """
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                batch, offsets = self._pending.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            if self._write(batch):
+                self._written.put(offsets)
+            self._pending.task_done()
+
+            metrics.PENDING_FLUSHES.labels(self.partition).set(self._pending.qsize())
+
+    def _write(self, batch: EarthquakeBatch) -> bool:
+        """
+        Writes `batch` to the feature store, retrying until it succeeds or the
+        writer is stopped. A batch that fails with one of `PERMANENT_ERRORS` is
+        dropped instead.
+
+        Returns:
+            bool: Whether the batch was written or dropped, i.e. whether its
+                offsets can be committed.
+        """
+        backoff_sec = 1
+
+        while True:
+            try:
+                start = time.perf_counter()
+                self.backend.push_data_to_feature_store(
+                    data=batch,
+                    online_or_offline=self.online_or_offline,
+                )
+                elapsed_sec = time.perf_counter() - start
+                self.batching_policy.record_flush(len(batch), elapsed_sec)
+
+                metrics.INSERT_SECONDS.observe(elapsed_sec)
+                metrics.FLUSH_ROWS.observe(len(batch))
+                metrics.FLUSH_BYTES.observe(batch.nbytes)
+                # The earthquakes are now queryable in the feature store
+                metrics.observe_event_lag(
+                    metrics.EVENT_LAG_SECONDS, batch.columns.get("timestamp", ())
+                )
+                return True
+
+            except PERMANENT_ERRORS as e:
+                metrics.DROPPED_ROWS.inc(len(batch))
+                logger.error(
+                    f"Dropping {len(batch)} rows that cannot be written to the "
+                    f"feature store: {e!r}."
+                )
+                return True
+
+            except Exception as e:
+                metrics.INSERT_FAILURES.inc()
+
+                if self._stop.is_set():
+                    logger.error(f"Failed to push data to the feature store: {e}.")
+                    return False
+
+                logger.error(
+                    f"Failed to push data to the feature store: {e}. "
+                    f"Retrying in {backoff_sec} seconds."
+                )
+                self._stop.wait(backoff_sec)
+                backoff_sec = min(backoff_sec * 2, self.max_backoff_sec)
+
+
+class PartitionedWriter:
+    """
+    A `BackgroundWriter` per partition, so that a slow or retrying write of
+    one partition's buffer does not hold up the writes of the others. Each
+    partition has its own queue of `max_pending` batches, and `submit` only
+    returns False when the queue of that partition is full, for the caller to
+    pause that partition alone.
+
+    The writers share the backend and the batching policy, and write to the
+    backend concurrently.
+    """
+
+    def __init__(
+        self,
+        backend: SinkBackend,
+        online_or_offline: str,
+        batching_policy: BatchingPolicy,
+        max_pending: int = 2,
+        max_backoff_sec: float = 60,
+    ):
+        self.backend = backend
+        self.online_or_offline = online_or_offline
+        self.batching_policy = batching_policy
+        self.max_pending = max_pending
+        self.max_backoff_sec = max_backoff_sec
+
+        # Writer of each (topic, partition), created on its first batch
+        self._writers: Dict[Tuple[str, int], BackgroundWriter] = {}
+
+    def submit(
+        self,
+        key: Tuple[str, int],
+        batch: EarthquakeBatch,
+        offsets: List[TopicPartition],
+    ) -> bool:
+        """
+        Queues `batch` to be written by the writer of its partition, without
+        blocking.
+
+        Args:
+            key (Tuple[str, int]): The topic and partition of the batch.
+            batch (EarthquakeBatch): The batch to write.
+            offsets (List[TopicPartition]): The offsets to commit once it is written.
+
+        Returns:
+            bool: False if the queue of the partition is full and the batch was
+                not queued.
+        """
+        if key not in self._writers:
+            self._writers[key] = BackgroundWriter(
+                backend=self.backend,
+                online_or_offline=self.online_or_offline,
+                batching_policy=self.batching_policy,
+                max_pending=self.max_pending,
+                max_backoff_sec=self.max_backoff_sec,
+                partition=key[1],
+            )
+
+        return self._writers[key].submit(batch, offsets)
+
+    def written_offsets(self) -> List[TopicPartition]:
+        """
+        Returns the offsets to commit for the batches written since the last
+        call, the latest offset for each partition.
+        """
+        return [
+            offset
+            for writer in self._writers.values()
+            for offset in writer.written_offsets()
+        ]
+
+    def revoke(self, key: Tuple[str, int]) -> None:
+        """
+        Stops the writer of a partition that was revoked, dropping the batches it
+        has not written: the new owner of the partition consumes them again.
+        """
+        writer = self._writers.pop(key, None)
+
+        if writer is not None:
+            writer.stop()
+            metrics.PENDING_FLUSHES.labels(key[1]).set(0)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Waits up to `timeout` seconds in all for the queued batches of every
+        partition to be written, then stops the writers.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        for writer in self._writers.values():
+            writer.close(
+                timeout=None if deadline is None else max(deadline - time.monotonic(), 0)
+            )
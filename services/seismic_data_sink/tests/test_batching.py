@@ -0,0 +1,45 @@
+from src.batching import AdaptivePolicy, ThresholdPolicy
+
+
+def test_threshold_policy_flushes_on_any_threshold():
+    policy = ThresholdPolicy(max_rows=100, max_bytes=1000, max_age_sec=5)
+
+    assert not policy.should_flush(rows=0, nbytes=0, age_sec=60)
+    assert not policy.should_flush(rows=99, nbytes=999, age_sec=4.9)
+    assert policy.should_flush(rows=100, nbytes=0, age_sec=0)
+    assert policy.should_flush(rows=1, nbytes=1000, age_sec=0)
+    assert policy.should_flush(rows=1, nbytes=0, age_sec=5)
+
+
+def test_adaptive_policy_grows_while_bigger_batches_are_cheaper_per_row():
+    policy = AdaptivePolicy(min_rows=100, max_rows=800, max_bytes=2**30, max_age_sec=5)
+
+    # A fixed cost per insert, so that bigger batches are cheaper per row
+    for _ in range(10):
+        rows = policy.target_rows
+        policy.record_flush(rows, latency_sec=1 + 0.001 * rows)
+
+    assert policy.target_rows == 800
+    assert not policy.should_flush(rows=799, nbytes=0, age_sec=0)
+    assert policy.should_flush(rows=800, nbytes=0, age_sec=0)
+
+
+def test_adaptive_policy_shrinks_when_smaller_batches_were_cheaper():
+    policy = AdaptivePolicy(min_rows=100, max_rows=800, max_bytes=2**30, max_age_sec=5)
+
+    # Cheaper per row up to 200 rows, then more expensive per row the bigger
+    # the batch, e.g. once inserts time out and are retried
+    for _ in range(10):
+        rows = policy.target_rows
+        latency_sec = 1 + 0.001 * rows if rows <= 200 else rows**2 / 100
+        policy.record_flush(rows, latency_sec=latency_sec)
+
+    assert policy.target_rows == 200
+
+
+def test_adaptive_policy_ignores_flushes_below_the_threshold():
+    policy = AdaptivePolicy(min_rows=100, max_rows=800, max_bytes=2**30, max_age_sec=5)
+
+    policy.record_flush(10, latency_sec=0.001)
+
+    assert policy.target_rows == 100
@@ -0,0 +1,52 @@
+import orjson
+
+from src.earthquake_batch import EarthquakeBatch
+
+
+def earthquake(uuid: str, **fields) -> dict:
+    return {
+        "timestamp": 1721168130640,
+        "datestr": "2024-07-16",
+        "region": "SOUTHERN CALIFORNIA",
+        "magnitude": 2.3,
+        "depth": 7.9,
+        "latitude": 32.8632,
+        "longitude": -116.1513,
+        "uuid": uuid,
+        **fields,
+    }
+
+
+def test_extend_json_skips_rows_of_the_wrong_type():
+    no_timestamp = earthquake("no timestamp")
+    del no_timestamp["timestamp"]
+
+    batch = EarthquakeBatch()
+    batch.extend_json(
+        [
+            orjson.dumps(earthquake("valid")),
+            orjson.dumps(no_timestamp),
+            orjson.dumps(earthquake("string timestamp", timestamp="1721168130640")),
+            orjson.dumps(earthquake("float timestamp", timestamp=1721168130640.5)),
+            orjson.dumps(earthquake("uint64 timestamp", timestamp=2**64 - 1)),
+            orjson.dumps(earthquake("string magnitude", magnitude="2.3")),
+            orjson.dumps(earthquake("list region", region=["a"])),
+            orjson.dumps(earthquake("no magnitude", magnitude=None)),
+            orjson.dumps(earthquake("int depth", depth=10)),
+        ]
+    )
+
+    data = batch.to_dataframe()
+
+    assert list(data.uuid) == ["valid", "no magnitude", "int depth"]
+    assert data.timestamp.dtype == "int64"
+    assert data.magnitude.isna().tolist() == [False, True, False]
+
+
+def test_extend_json_keeps_the_batch_when_every_row_is_invalid():
+    batch = EarthquakeBatch()
+    batch.extend_json([orjson.dumps(earthquake("valid"))])
+    batch.extend_json([b'{"uuid": "no timestamp"}', b'{"timestamp": "now"}'])
+
+    assert len(batch) == 1
+    assert list(batch.to_dataframe().uuid) == ["valid"]
@@ -0,0 +1,115 @@
+import subprocess
+import sys
+import threading
+
+from types import SimpleNamespace
+
+from src import hopsworks_stub
+from src.earthquake_batch import EarthquakeBatch
+from src.hopsworks_api import HopsworksApi
+
+
+class SessionExpired(Exception):
+    """Like the `RestAPIError` Hopsworks raises once the session expired."""
+
+    response = SimpleNamespace(status_code=401)
+
+
+class ExpiringFeatureGroup(hopsworks_stub.StubFeatureGroup):
+    """Rejects every insert once `expired` is set."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.expired = False
+
+    def insert(self, features, **kwargs):
+        if self.expired:
+            raise SessionExpired()
+
+        super().insert(features, **kwargs)
+
+
+class CountingLogin:
+    def __init__(self):
+        self.logins = 0
+        self.feature_groups = []
+        self._lock = threading.Lock()
+
+    def __call__(self, project: str, api_key_value: str):
+        with self._lock:
+            self.logins += 1
+
+        feature_group = ExpiringFeatureGroup("earthquakes", 1, ["uuid"])
+        self.feature_groups.append(feature_group)
+
+        feature_store = SimpleNamespace(
+            get_or_create_feature_group=lambda **kwargs: feature_group
+        )
+        return SimpleNamespace(get_feature_store=lambda: feature_store)
+
+
+def make_batch(uuid: str) -> EarthquakeBatch:
+    batch = EarthquakeBatch()
+    batch.extend(
+        [
+            {
+                "timestamp": 1721168130640,
+                "datestr": "2024-07-16",
+                "magnitude": 2.3,
+                "latitude": 32.8632,
+                "longitude": -116.1513,
+                "depth": 7.9,
+                "region": "SOUTHERN CALIFORNIA",
+                "uuid": uuid,
+            }
+        ]
+    )
+    return batch
+
+
+def make_api(login) -> HopsworksApi:
+    return HopsworksApi(
+        api_key="key",
+        project_name="project",
+        feature_group_name="earthquakes",
+        feature_group_version=1,
+        login=login,
+    )
+
+
+def test_logs_in_again_once_when_the_session_expires():
+    login = CountingLogin()
+    api = make_api(login)
+
+    api.push_data_to_feature_store(make_batch("a"), "online")
+    login.feature_groups[0].expired = True
+
+    threads = [
+        threading.Thread(
+            target=api.push_data_to_feature_store, args=(make_batch(f"b{i}"), "online")
+        )
+        for i in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # The writers that hit the expired session share a single new login
+    assert login.logins == 2
+    assert set(login.feature_groups[1].rows) == {(f"b{i}",) for i in range(4)}
+
+
+def test_stub_mode_does_not_import_hopsworks():
+    code = (
+        "import sys\n"
+        "from src import hopsworks_stub\n"
+        "from src.hopsworks_api import HopsworksApi\n"
+        "api = HopsworksApi('key', 'project', 'earthquakes', 1,"
+        " login=hopsworks_stub.login)\n"
+        "api.get_feature_group()\n"
+        "assert 'hopsworks' not in sys.modules, 'hopsworks'\n"
+        "assert 'hsfs' not in sys.modules, 'hsfs'\n"
+    )
+
+    subprocess.run([sys.executable, "-c", code], check=True)
@@ -0,0 +1,48 @@
+from src import wire_format
+from src.earthquake_batch import EarthquakeBatch
+
+# Messages the earthquake producer encodes for one earthquake, copied from its
+# `tests/test_wire_format.py`, keep the copies equal
+BINARY = bytes.fromhex(
+    "0150729dbd9001000066666666666602409a99999999991f401ff46c567d6e4040a1f831e6ae"
+    "095dc016601f822b8de4b5a1044caa6256c027d04d00001300534f55544845524e2043414c49"
+    "464f524e4941"
+)
+
+JSON = (
+    b'{"timestamp":1721168130640,"datestr":"2024-07-16","region":"SOUTHERN '
+    b'CALIFORNIA","magnitude":2.3,"depth":7.9,"latitude":32.8632,"longitude":'
+    b'-116.1513,"uuid":"16601f82-2b8d-e4b5-a104-4caa6256c027"}'
+)
+
+EARTHQUAKE = {
+    "timestamp": 1721168130640,
+    "datestr": "2024-07-16",
+    "region": "SOUTHERN CALIFORNIA",
+    "magnitude": 2.3,
+    "depth": 7.9,
+    "latitude": 32.8632,
+    "longitude": -116.1513,
+    "uuid": "16601f82-2b8d-e4b5-a104-4caa6256c027",
+}
+
+
+def test_decodes_the_producer_binary_messages():
+    columns = wire_format.decode_columns([BINARY])
+
+    assert {name: values[0] for name, values in columns.items()} == EARTHQUAKE
+
+
+def test_binary_and_json_messages_give_the_same_rows():
+    binary, json = EarthquakeBatch(), EarthquakeBatch()
+    binary.extend_binary([BINARY])
+    json.extend_json([JSON])
+
+    assert binary.to_dataframe().to_dict("records") == [EARTHQUAKE]
+    assert json.to_dataframe().to_dict("records") == [EARTHQUAKE]
+
+
+def test_skips_messages_of_another_version_or_size():
+    columns = wire_format.decode_columns([b"\x02" + BINARY[1:], BINARY[:-1], BINARY])
+
+    assert len(columns["uuid"]) == 1
@@ -0,0 +1,165 @@
+import threading
+import time
+
+from confluent_kafka import TopicPartition
+
+from src.batching import ThresholdPolicy
+from src.earthquake_batch import EarthquakeBatch
+from src.sink_backend import SinkBackend
+from src.writer import BackgroundWriter, PartitionedWriter
+
+
+class FakeBackend(SinkBackend):
+    """
+    Records the uuids of the batches it writes. Fails the writes whose batch
+    has a uuid of `fail_with`, with the exception it maps it to.
+    """
+
+    def __init__(self, fail_with=None):
+        self.fail_with = fail_with or {}
+        self.written = []
+        self.attempts = 0
+
+    def push_data_to_feature_store(self, data, online_or_offline):
+        self.attempts += 1
+        uuids = data.columns["uuid"]
+
+        for uuid in uuids:
+            if uuid in self.fail_with:
+                raise self.fail_with[uuid]
+
+        self.written.append(list(uuids))
+
+
+class BlockingBackend(FakeBackend):
+    """
+    Blocks every write until `release` is set, then fails it with `error` if it
+    is set, like a sink killed or disconnected in the middle of an insert.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.error = None
+
+    def push_data_to_feature_store(self, data, online_or_offline):
+        self.started.set()
+        self.release.wait()
+
+        if self.error is not None:
+            raise self.error
+
+        super().push_data_to_feature_store(data, online_or_offline)
+
+
+def make_batch(*uuids: str) -> EarthquakeBatch:
+    batch = EarthquakeBatch()
+    batch.extend([{"timestamp": 1721168130640, "uuid": uuid} for uuid in uuids])
+    return batch
+
+
+def offsets(offset: int):
+    return [TopicPartition("earthquakes", 0, offset)]
+
+
+def make_policy() -> ThresholdPolicy:
+    return ThresholdPolicy(max_rows=100, max_bytes=2**20, max_age_sec=1)
+
+
+def make_writer(backend: SinkBackend) -> BackgroundWriter:
+    return BackgroundWriter(
+        backend=backend,
+        online_or_offline="online",
+        batching_policy=make_policy(),
+        max_pending=4,
+        max_backoff_sec=0.01,
+    )
+
+
+def wait_for_offset(writer: BackgroundWriter, offset: int, timeout_sec: float = 5):
+    deadline = time.monotonic() + timeout_sec
+    committed = []
+
+    while time.monotonic() < deadline:
+        committed.extend(o.offset for o in writer.written_offsets())
+        if offset in committed:
+            return committed
+        time.sleep(0.01)
+
+    raise AssertionError(f"offset {offset} not committed, only {committed}")
+
+
+def test_batch_that_fails_for_good_is_dropped_and_committed():
+    backend = FakeBackend(fail_with={"poison": ValueError("cannot convert")})
+    writer = make_writer(backend)
+
+    writer.submit(make_batch("poison"), offsets(1))
+    writer.submit(make_batch("next"), offsets(2))
+
+    wait_for_offset(writer, 2)
+    writer.close(timeout=1)
+
+    assert backend.written == [["next"]]
+    assert backend.attempts == 2
+
+
+def test_batch_that_fails_transiently_is_retried():
+    backend = FakeBackend(fail_with={"flaky": ConnectionError("unreachable")})
+    writer = make_writer(backend)
+
+    writer.submit(make_batch("flaky"), offsets(1))
+
+    while backend.attempts < 3:
+        time.sleep(0.01)
+
+    assert writer.written_offsets() == []
+
+    backend.fail_with = {}
+    wait_for_offset(writer, 1)
+    writer.close(timeout=1)
+
+    assert backend.written == [["flaky"]]
+
+
+def test_batch_interrupted_mid_write_is_not_committed_and_written_on_restart():
+    key = ("earthquakes", 0)
+    backend = BlockingBackend()
+    writer = PartitionedWriter(
+        backend=backend,
+        online_or_offline="online",
+        batching_policy=make_policy(),
+        max_backoff_sec=0.01,
+    )
+
+    writer.submit(key, make_batch("first"), offsets(5))
+    backend.release.set()
+    wait_for_offset(writer, 5)
+
+    # The second write hangs, and the sink stops in the middle of it
+    backend.release.clear()
+    writer.submit(key, make_batch("second"), offsets(10))
+    assert backend.started.wait(timeout=5)
+
+    writer.close(timeout=0.1)
+    backend.error = ConnectionError("sink stopped")
+    backend.release.set()
+    time.sleep(0.1)
+
+    assert writer.written_offsets() == []
+    assert backend.written == [["first"]]
+
+    # After a restart, the consumer reads again from the committed offset 5
+    backend.error = None
+    restarted = PartitionedWriter(
+        backend=backend,
+        online_or_offline="online",
+        batching_policy=make_policy(),
+        max_backoff_sec=0.01,
+    )
+    restarted.submit(key, make_batch("second"), offsets(10))
+
+    assert wait_for_offset(restarted, 10) == [10]
+    restarted.close(timeout=1)
+
+    assert backend.written == [["first"], ["second"]]